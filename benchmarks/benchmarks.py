@@ -0,0 +1,350 @@
+"""Benchmarks for every public marstime function
+
+Written for airspeed velocity (asv run), and also runnable without it
+through benchmarks/run.py, which reports latency, throughput and peak memory.
+
+Array sizes above MARSTIME_BENCH_MAX_SIZE (default 10**6) are skipped; the
+10**8 element runs need tens of GB for the longer chains, so set
+MARSTIME_BENCH_MAX_SIZE=100000000 to include them.
+"""
+import math
+import os
+import numpy as np
+import marstime
+from marstime import horizon, terrain
+
+sizes = [1, 10**3, 10**6, 10**8]
+max_size = int(float(os.environ.get("MARSTIME_BENCH_MAX_SIZE", 10**6)))
+
+
+def arguments(n):
+    """Inputs at size n spanning ~20 years from 1999, Python floats for n=1"""
+    if n == 1:
+        t, lon, lat = 1463.07471, 184.702, -14.46
+    else:
+        t = np.linspace(-300., 7000., n)
+        lon = np.linspace(0., 360., n)
+        lat = np.linspace(-89., 89., n)
+    a = dict(t=t, lon=lon, lat=lat, jday_tt=t + marstime.j2000_epoch())
+    a["jday"] = a["jday_tt"] - 64.184/86400.
+    a["mills"] = marstime.mills_from_julian(a["jday"])
+    a["msd"] = marstime.Mars_Solar_Date(t)
+    a["mtc"] = marstime.Coordinated_Mars_Time(t)
+    a["sol"] = a["msd"] - a["mtc"]/24.
+    a["ls"] = marstime.Mars_Ls(t)
+    a["n"] = n
+    return a
+
+
+#argument builders for each public function, the _math/_numpy backend
+#variants are covered through the dispatchers by TimeFunctions and TimeMath
+public_functions = dict(
+    west_to_east=lambda a: (a["lon"],),
+    east_to_west=lambda a: (a["lon"],),
+    mills=lambda a: (),
+    julian=lambda a: (a["mills"],),
+    utc_to_tt_offset=lambda a: (a["jday"],),
+    tt_to_utc_offset=lambda a: (a["jday_tt"],),
+    julian_tt=lambda a: (a["jday"],),
+    julian_utc=lambda a: (a["jday_tt"],),
+    j2000_epoch=lambda a: (),
+    j2000_offset_tt=lambda a: (a["jday_tt"],),
+    mills_from_julian=lambda a: (a["jday"],),
+    mills_from_j2000_ott=lambda a: (a["t"],),
+    datetime64_from_mills=lambda a: (a["mills"],),
+    Mars_Mean_Anomaly=lambda a: (a["t"],),
+    FMS_Angle=lambda a: (a["t"],),
+    alpha_perturbs=lambda a: (a["t"],),
+    equation_of_center=lambda a: (a["t"],),
+    Mars_Ls=lambda a: (a["t"],),
+    equation_of_time=lambda a: (a["t"],),
+    j2000_from_Mars_Solar_Date=lambda a: (a["msd"],),
+    j2000_ott_from_Mars_Solar_Date=lambda a: (a["msd"],),
+    j2000_ott_from_Coordinated_Mars_Time=lambda a: (a["mtc"], a["sol"]),
+    j2000_ott_from_Local_Mean_Solar_Time=lambda a: (a["mtc"], a["sol"], a["lon"]),
+    mills_from_Mars_Solar_Date=lambda a: (a["msd"],),
+    Mars_Solar_Date=lambda a: (a["t"],),
+    Clancy_Year=lambda a: (a["t"],),
+    Mars_Year=lambda a: (a["t"],),
+    table_segments=lambda a: (a["t"], "year"),
+    Coordinated_Mars_Time=lambda a: (a["t"],),
+    Local_Mean_Solar_Time=lambda a: (a["lon"], a["t"]),
+    Local_True_Solar_Time=lambda a: (a["lon"], a["t"]),
+    times_of_ltst=lambda a: (14., 137.4, np.arange(a["n"]) + 46000),
+    subsolar_longitude=lambda a: (a["t"],),
+    solar_declination=lambda a: (a["ls"],),
+    heliocentric_distance=lambda a: (a["t"],),
+    heliocentric_longitude=lambda a: (a["t"],),
+    heliocentric_latitude=lambda a: (a["t"],),
+    hourangle=lambda a: (a["lon"], a["t"]),
+    cos_solar_zenith=lambda a: (a["lon"], a["lat"], a["t"]),
+    solar_zenith=lambda a: (a["lon"], a["lat"], a["t"]),
+    solar_elevation=lambda a: (a["lon"], a["lat"], a["t"]),
+    solar_azimuth=lambda a: (a["lon"], a["lat"], a["t"]),
+    sun_vector_body_fixed=lambda a: (a["t"],),
+    sun_vector_enu=lambda a: (a["lon"], a["lat"], a["t"]),
+    track_geometry=lambda a: (a["t"], a["lon"], a["lat"]),
+    time_state=lambda a: (a["t"],),
+    interpolated_time_state=lambda a: (a["t"],),
+    timeseries=lambda a: (-300., 1/86400., a["n"]),
+)
+
+
+class TimeFunctions(object):
+    """Each public function on the numpy path, scalar and array inputs"""
+    params = (sorted(public_functions), sizes)
+    param_names = ["function", "size"]
+    timeout = 1200
+
+    def setup(self, name, n):
+        if n > max_size:
+            raise NotImplementedError("size above MARSTIME_BENCH_MAX_SIZE")
+        self.func = getattr(marstime, name)
+        self.args = public_functions[name](arguments(n))
+
+    def time_call(self, name, n):
+        self.func(*self.args)
+
+    def peakmem_call(self, name, n):
+        self.func(*self.args)
+
+
+class TimeMath(object):
+    """Each public function with scalar input on the math library path, which
+    is used when numpy is not installed. Functions that need numpy are skipped."""
+    params = sorted(public_functions)
+    param_names = ["function"]
+
+    def setup(self, name):
+        self.saved = (marstime.np, marstime.use_numpy)
+        marstime.np, marstime.use_numpy = math, False
+        self.func = getattr(marstime, name)
+        self.args = public_functions[name](arguments(1))
+        try:
+            self.func(*self.args)
+        except Exception:
+            self.teardown(name)
+            raise NotImplementedError("{0} needs numpy".format(name))
+
+    def teardown(self, name):
+        marstime.np, marstime.use_numpy = self.saved
+
+    def time_call(self, name):
+        self.func(*self.args)
+
+
+class TimeDtype(object):
+    """Site x time grids in double and single precision, see the dtype
+    argument of solar_zenith"""
+    params = (["solar_zenith", "solar_elevation", "cos_solar_zenith"],
+              ["float64", "float32"])
+    param_names = ["function", "dtype"]
+    shape = (1000, 1000)
+
+    def setup(self, name, dtype):
+        sites, times = self.shape
+        self.func = getattr(marstime, name)
+        self.lon = np.linspace(0., 360., sites)[:, np.newaxis]
+        self.lat = np.linspace(-89., 89., sites)[:, np.newaxis]
+        self.t = np.linspace(0., 700., times)
+        self.dtype = None if dtype == "float64" else np.dtype(dtype)
+
+    def time_grid(self, name, dtype):
+        self.func(self.lon, self.lat, self.t, dtype=self.dtype)
+
+    def peakmem_grid(self, name, dtype):
+        self.func(self.lon, self.lat, self.t, dtype=self.dtype)
+
+
+class TimeAccuracy(object):
+    """The accuracy tiers of the Mars_Ls chain on 10^6 times"""
+    params = (["Mars_Ls", "Local_True_Solar_Time", "solar_zenith", "track_geometry"],
+              ["full", "high", "medium", "low"])
+    param_names = ["function", "accuracy"]
+    size = 10**6
+
+    def setup(self, name, accuracy):
+        a = arguments(min(self.size, max_size))
+        self.func = getattr(marstime, name)
+        self.args = dict(Mars_Ls=(a["t"],),
+                         Local_True_Solar_Time=(a["lon"], a["t"]),
+                         solar_zenith=(a["lon"], a["lat"], a["t"]),
+                         track_geometry=(a["t"], a["lon"], a["lat"]))[name]
+
+    def time_accuracy(self, name, accuracy):
+        self.func(*self.args, accuracy=accuracy)
+
+
+class TimeMasked(object):
+    """where= masks selecting a fraction of 10^6 elements"""
+    params = (["solar_zenith", "track_geometry"], [0.1, 0.3, 1.0])
+    param_names = ["function", "fraction"]
+    size = 10**6
+
+    def setup(self, name, fraction):
+        a = arguments(min(self.size, max_size))
+        self.func = getattr(marstime, name)
+        self.args = public_functions[name](a)
+        self.where = np.random.default_rng(0).random(a["t"].size) < fraction
+
+    def time_masked(self, name, fraction):
+        self.func(*self.args, where=self.where)
+
+
+class TimeUnique(object):
+    """unique=True on 10^6 elements sharing 4000 sorted timestamps"""
+    params = (["Mars_Ls", "solar_zenith", "track_geometry"], [False, True])
+    param_names = ["function", "unique"]
+    channels = 250
+
+    def setup(self, name, unique):
+        t = np.repeat(np.linspace(0., 7000., 4000), self.channels)
+        n = self.size = min(t.size, max_size)
+        a = dict(t=t[:n], lon=np.linspace(0., 360., n), lat=np.linspace(-89., 89., n))
+        self.func = getattr(marstime, name)
+        self.args = public_functions[name](a)
+
+    def time_unique(self, name, unique):
+        self.func(*self.args, unique=unique)
+
+
+class TimeTables(object):
+    """Leap second and Mars year lookups of sorted and shuffled times"""
+    params = (["utc_to_tt_offset", "Mars_Year"], [True, False])
+    param_names = ["function", "sorted"]
+
+    def setup(self, name, ordered):
+        a = arguments(min(10**6, max_size))
+        self.func = getattr(marstime, name)
+        self.args = public_functions[name](a)
+        if not ordered:
+            self.args = (np.random.default_rng(0).permutation(self.args[0]),)
+
+    def time_tables(self, name, ordered):
+        self.func(*self.args)
+
+
+class TimeUfuncs(object):
+    """The numba ufuncs against the marstime functions they mirror"""
+    params = (["Mars_Ls", "Local_True_Solar_Time", "solar_zenith"], sizes)
+    param_names = ["function", "size"]
+
+    def setup(self, name, n):
+        if n > max_size:
+            raise NotImplementedError("size above MARSTIME_BENCH_MAX_SIZE")
+        try:
+            from marstime import ufuncs
+        except ImportError:
+            raise NotImplementedError("numba is not installed")
+        self.func = getattr(ufuncs, name)
+        self.args = public_functions[name](arguments(n))
+        self.func(*self.args)
+
+    def time_call(self, name, n):
+        self.func(*self.args)
+
+    def peakmem_call(self, name, n):
+        self.func(*self.args)
+
+
+class TimeChunked(object):
+    """track_geometry mapped over a chunked dask array of 10^6 times"""
+
+    def setup(self):
+        try:
+            import dask, dask.array
+        except ImportError:
+            raise NotImplementedError("dask is not installed")
+        self.compute = dask.compute
+        self.t = dask.array.linspace(0., 7000., min(10**6, max_size), chunks=10**5)
+
+    def time_track_geometry(self):
+        geometry = marstime.track_geometry(self.t, 137.4, -4.5)
+        self.compute(*geometry.values(), scheduler="synchronous")
+
+
+def midnight(date, longitude):
+    """Local midnights either side of date, as in examples/calculate_sunrise.py"""
+    lt = marstime.Local_True_Solar_Time(longitude, date)
+    return date - lt/24., date + (24-lt)/24.
+
+
+def bisect(f, a, b, tol=1e-8):
+    """Scalar bisection, standing in for scipy.optimize.bisect"""
+    fa = f(a)
+    while b - a > tol:
+        c = 0.5*(a+b)
+        fc = f(c)
+        if (fc > 0) == (fa > 0):
+            a, fa = c, fc
+        else:
+            b = c
+    return 0.5*(a+b)
+
+
+def sunrise_sunset(date, longitude, latitude):
+    """The bisection search of examples/calculate_sunrise.py"""
+    radius = math.degrees(6.96342e8/(marstime.heliocentric_distance(date)*1.496e11))
+    f = lambda t: marstime.solar_elevation(longitude, latitude, t) + radius
+    mid1, mid2 = midnight(date, longitude)
+    noon = 0.5*(mid1 + mid2)
+    return bisect(f, mid1, noon), bisect(f, noon, mid2)
+
+
+class TimeScenarios(object):
+    """End to end runs mirroring the examples directory"""
+    timeout = 600
+
+    def time_sunrise(self):
+        sunrise_sunset(4800.3, 360.-137.4, -4.5)
+
+    def time_sunrise_plot_points(self):
+        mid1, mid2 = midnight(4800.3, 360.-137.4)
+        x = mid1 + np.arange(72)/71.
+        marstime.Local_Mean_Solar_Time(360.-137.4, x)
+        marstime.solar_elevation(360.-137.4, -4.5, x)
+
+    def time_sunrise_year(self):
+        """Sunrise and sunset for every sol of a Mars year, scalar calls"""
+        for sol in range(669):
+            sunrise_sunset(4800.3 + sol*1.027491252, 360.-137.4, -4.5)
+
+    def time_horizon_calendar(self):
+        """Sunrise, sunset and illuminated time for 100 sites over a Mars year"""
+        sites = np.linspace(-60., 60., 100)
+        horizon.illumination(sites*3 % 360., sites, np.arange(49400, 50069))
+
+    def time_horizon_map(self):
+        """16 direction horizon map and a sol of shadow masks for a 256x256 DEM"""
+        dem = np.random.default_rng(0).normal(size=(256, 256)).cumsum(0).cumsum(1)
+        horizons = terrain.horizon_map(dem, 20., directions=16)
+        terrain.shadow_mask(horizons, 137.4, -4.5, 4800. + np.arange(24)/24.)
+
+    def time_facet_insolation(self):
+        """Incidence and flux on a 512x512 slope and aspect raster through a sol"""
+        rng = np.random.default_rng(0)
+        slope, aspect = rng.uniform(0, 30, (512, 512)), rng.uniform(0, 360, (512, 512))
+        terrain.facet_insolation(slope, aspect, 137.4, -4.5, 4800. + np.arange(24)/24.)
+
+    def time_analemma(self):
+        msd = np.linspace(0, 669, 120)
+        j2000_offsets = marstime.j2000_from_Mars_Solar_Date(
+            msd + marstime.Mars_Solar_Date(151.27365))
+        marstime.equation_of_time(j2000_offsets)*60/15.
+        marstime.solar_declination(marstime.Mars_Ls(j2000_offsets))
+
+    def peakmem_analemma(self):
+        self.time_analemma()
+
+
+class TimeImport(object):
+    """Start up cost in a fresh interpreter, see also run.py --import-time"""
+
+    def timeraw_import(self):
+        return "import marstime"
+
+    def timeraw_scalar_call(self):
+        return "import marstime; marstime.Local_True_Solar_Time(184.702, 1463.07471)"
+
+    def timeraw_array_call(self):
+        return "import numpy, marstime; marstime.Local_True_Solar_Time(184.702, numpy.arange(10.))"
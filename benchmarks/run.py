@@ -0,0 +1,171 @@
+"""Runs the benchmarks without asv, printing per-call latency, throughput
+(elements per second) and peak memory for each case, e.g.
+
+    python benchmarks/run.py --sizes 1,1000,1000000 --functions Mars_Ls,solar_zenith
+    python benchmarks/run.py --scenarios-only
+    python benchmarks/run.py --import-time
+
+Peak memory is the largest traced allocation (tracemalloc) during one call,
+measured in a separate call from the timings.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import benchmarks as b
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """Returns the best per-call time (seconds) and the peak traced memory (bytes)"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number*min_time/max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))/number
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def import_time(code, repeat=5):
+    """Returns the best cumulative import time (seconds) of marstime reported by
+    python -X importtime, and the best wall time of running code, in fresh
+    interpreters"""
+    best_import = best_wall = float("inf")
+    for i in range(repeat):
+        start = timeit.default_timer()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        best_wall = min(best_wall, timeit.default_timer() - start)
+        for line in result.stderr.splitlines():
+            fields = [f.strip() for f in line.split("|")]
+            if len(fields) == 3 and fields[2] == "marstime":
+                best_import = min(best_import, int(fields[1])*1e-6)
+    return best_import, best_wall
+
+
+def report(name, backend, n, latency, peak):
+    print("{0:40s} {1:8s} {2:>10d} {3:>12.3e} {4:>12.3e} {5:>10.3f}".format(
+        name, backend, n, latency, n/latency, peak/2.**20))
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the marstime benchmarks without asv")
+    parser.add_argument("--functions", default="",
+            help="comma separated function names, all by default")
+    parser.add_argument("--sizes", default="",
+            help="comma separated input sizes, default 1,1e3,1e6 up to MARSTIME_BENCH_MAX_SIZE")
+    parser.add_argument("--repeat", default=3, type=int, help="timing repeats, the best is kept")
+    parser.add_argument("--no-math", action="store_true", help="skip the math library path")
+    parser.add_argument("--scenarios-only", action="store_true",
+            help="only run the example scenarios")
+    parser.add_argument("--import-time", action="store_true",
+            help="only report the import and start up times")
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        for name in ["import", "scalar_call", "array_call"]:
+            code = getattr(b.TimeImport(), "timeraw_" + name)()
+            imported, wall = import_time(code)
+            print("{0:12s} import marstime {1:8.2f} ms, process {2:8.2f} ms".format(
+                name, imported*1e3, wall*1e3))
+        return
+
+    names = [f for f in args.functions.split(",") if f] or sorted(b.public_functions)
+    if args.sizes:
+        sizes = [int(float(s)) for s in args.sizes.split(",")]
+    else:
+        sizes = [n for n in b.sizes if n <= b.max_size]
+
+    print("{0:40s} {1:8s} {2:>10s} {3:>12s} {4:>12s} {5:>10s}".format(
+        "function", "path", "size", "latency(s)", "items/s", "peak(MB)"))
+    if not args.scenarios_only:
+        for name in names:
+            for n in sizes:
+                case = b.TimeFunctions()
+                case.setup(name, n)
+                latency, peak = measure(lambda: case.time_call(name, n), repeat=args.repeat)
+                report(name, "numpy", n, latency, peak)
+            if args.no_math:
+                continue
+            case = b.TimeMath()
+            try:
+                case.setup(name)
+            except NotImplementedError:
+                continue
+            try:
+                latency, peak = measure(lambda: case.time_call(name), repeat=args.repeat)
+            finally:
+                case.teardown(name)
+            report(name, "math", 1, latency, peak)
+
+        grid = b.TimeDtype.shape[0]*b.TimeDtype.shape[1]
+        for name in b.TimeDtype.params[0]:
+            for dtype in b.TimeDtype.params[1]:
+                case = b.TimeDtype()
+                case.setup(name, dtype)
+                latency, peak = measure(lambda: case.time_grid(name, dtype), repeat=args.repeat)
+                report(name, dtype, grid, latency, peak)
+
+        for name in b.TimeMasked.params[0]:
+            for fraction in b.TimeMasked.params[1]:
+                case = b.TimeMasked()
+                case.setup(name, fraction)
+                latency, peak = measure(lambda: case.time_masked(name, fraction),
+                                        repeat=args.repeat)
+                report(name, "where" + str(fraction), case.where.size, latency, peak)
+
+        for name in b.TimeUnique.params[0]:
+            for unique in b.TimeUnique.params[1]:
+                case = b.TimeUnique()
+                case.setup(name, unique)
+                latency, peak = measure(lambda: case.time_unique(name, unique),
+                                        repeat=args.repeat)
+                report(name, "unique" if unique else "all", case.size, latency, peak)
+
+        for name in b.TimeTables.params[0]:
+            for ordered in b.TimeTables.params[1]:
+                case = b.TimeTables()
+                case.setup(name, ordered)
+                latency, peak = measure(lambda: case.time_tables(name, ordered),
+                                        repeat=args.repeat)
+                report(name, "sorted" if ordered else "shuffled", case.args[0].size,
+                       latency, peak)
+
+        for name in b.TimeUfuncs.params[0]:
+            for n in sizes:
+                case = b.TimeUfuncs()
+                try:
+                    case.setup(name, n)
+                except NotImplementedError:
+                    break
+                latency, peak = measure(lambda: case.time_call(name, n), repeat=args.repeat)
+                report(name, "ufunc", n, latency, peak)
+
+        for name in b.TimeAccuracy.params[0]:
+            for accuracy in b.TimeAccuracy.params[1]:
+                case = b.TimeAccuracy()
+                case.setup(name, accuracy)
+                latency, peak = measure(lambda: case.time_accuracy(name, accuracy),
+                                        repeat=args.repeat)
+                report(name, accuracy, min(case.size, b.max_size), latency, peak)
+
+    scenarios = b.TimeScenarios()
+    for name in sorted(dir(scenarios)):
+        if name.startswith("time_"):
+            latency, peak = measure(getattr(scenarios, name), repeat=args.repeat)
+            report(name[5:], "scenario", 1, latency, peak)
+
+
+if __name__ == "__main__":
+    main()
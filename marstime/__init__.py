@@ -8,17 +8,236 @@ Allison, M. 1997. Accurate analytic representations of solar time and seasons on
 
 http://www.giss.nasa.gov/tools/mars24/
 
+The functions that broadcast their array arguments also take a where=
+keyword, a boolean array broadcast against them: only the selected elements
+are computed and the others are nan, e.g.
+
+    solar_zenith(lon, lat, j2000_ott, where=quality == 0)
+
+and unique=True, which evaluates each distinct combination of the arguments
+once and broadcasts the results back, e.g. for many channels sharing each
+timestamp of an observation:
+
+    Mars_Ls(j2000_ott_per_channel, unique=True)
+
 """
 version = "0.4.6"
 
+import functools
+import importlib
+import sys
 import time
-try:
-    import numpy as np
+from marstime._lazy import numpy_available, is_scalar, LazyNumpy
+#numpy is imported on first use, scalar inputs use the math module
+if numpy_available:
+    np = LazyNumpy()
     use_numpy=True
-except:
+else:
     use_numpy=False
     import math as np
 
+#submodules loaded on first attribute access
+_submodules = ["cache", "chunked", "cli", "horizon", "insolation", "instrument", "server", "terrain", "ufuncs"]
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("marstime." + name)
+    raise AttributeError("module 'marstime' has no attribute '{0}'".format(name))
+
+class _Undecorated(object):
+    """Namespace of the undecorated elementwise functions. marstime calls
+    these internally, so only the outermost call pays for the dispatch of
+    _elementwise"""
+
+_impl = _Undecorated()
+
+def _elementwise(outputs=1):
+    """Decorator for the functions that broadcast their array arguments, mapping
+    them blockwise over dask arrays and xarray objects (see marstime.chunked),
+    and adding two keywords:
+
+    where, a boolean array broadcast against the array arguments, where only
+    the selected elements are computed (by compacting them, evaluating and
+    scattering back) and the rest are nan.
+
+    unique, if True, evaluates each distinct combination of the array
+    arguments once and expands the results with the inverse index. Runs of
+    consecutive repeats (as in sorted inputs) are found in one pass, other
+    repeats with numpy.unique. Functions with their own unique argument
+    (track_geometry) are passed it instead.
+
+    outputs is the number of outputs, the keys of a dictionary result, or a
+    function of the call arguments returning either."""
+    def decorator(func):
+        setattr(_impl, func.__name__, func)
+        code = func.__code__
+        native_unique = "unique" in code.co_varnames[:code.co_argcount]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            where = unique = None
+            if kwargs:
+                where = kwargs.pop("where", None)
+                if not native_unique:
+                    unique = kwargs.pop("unique", None)
+            #neither can be an argument unless the caller has imported it
+            if "dask" in sys.modules or "xarray" in sys.modules:
+                chunked = sys.modules.get("marstime.chunked") or __getattr__("chunked")
+                if chunked.is_chunked(args + (where,), kwargs):
+                    n = outputs(*args, **kwargs) if callable(outputs) else outputs
+                    return chunked.apply(func, args, kwargs, n, where, unique)
+            if where is None and not unique:
+                return func(*args, **kwargs)
+            if not numpy_available:
+                raise ImportError("where= and unique= need numpy, e.g. pip install numpy")
+            n = outputs(*args, **kwargs) if callable(outputs) else outputs
+            return _restricted(func, n, unique)(where, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def _restricted(func, outputs=1, unique=False):
+    """func with where and unique (see _elementwise) applied, taking the mask
+    (None for none) as its first argument"""
+    call = func
+    if unique:
+        call = lambda *args, **kwargs: _deduplicated(func, args, kwargs, outputs)
+    def restricted(where, *args, **kwargs):
+        if where is None:
+            return call(*args, **kwargs)
+        return _masked(call, args, kwargs, where, outputs)
+    return restricted
+
+def _each_output(result, outputs, f):
+    """f applied to each output of a result with the given outputs"""
+    if outputs == 1:
+        return f(result)
+    if isinstance(outputs, int):
+        return tuple(f(r) for r in result)
+    return dict((key, f(result[key])) for key in outputs)
+
+def _is_array(a):
+    """Whether an argument is an array to broadcast, rather than a scalar or
+    an option such as dtype=numpy.float32 (a class, whose ndim is a descriptor)"""
+    return not isinstance(a, type) and np.ndim(a) > 0
+
+def _array_arguments(args, kwargs):
+    """The arguments as one list, and the positions of the arrays in it"""
+    values = list(args) + list(kwargs.values())
+    return values, [i for (i, a) in enumerate(values) if _is_array(a)]
+
+def _call(func, values, args, kwargs):
+    """func called with values in place of the args and kwargs"""
+    return func(*values[:len(args)], **dict(zip(kwargs, values[len(args):])))
+
+def _masked(func, args, kwargs, where, outputs=1):
+    """func evaluated on the elements selected by where only, nan elsewhere"""
+    values, arrays = _array_arguments(args, kwargs)
+    shaped = np.broadcast_arrays(np.asarray(where, dtype=bool),
+                                 *[values[i] for i in arrays])
+    mask = shaped[0]
+    for i, a in zip(arrays, shaped[1:]):
+        values[i] = a[mask]
+
+    def scatter(selected):
+        out = np.full(mask.shape, np.nan, dtype=np.result_type(selected, 1.))
+        out[mask] = selected
+        return out
+    return _each_output(_call(func, values, args, kwargs), outputs, scatter)
+
+def _unique_rows(arrays):
+    """Returns the index of one element of each distinct row of the 1D
+    arrays, and the inverse index that expands them back"""
+    n = arrays[0].size
+    change = np.zeros(n, dtype=bool)
+    change[:1] = True
+    for a in arrays:
+        change[1:] |= a[1:] != a[:-1]
+    first = np.flatnonzero(change)
+    if first.size <= n//2:
+        #repeats are mostly consecutive, e.g. sorted times
+        return first, np.cumsum(change) - 1
+    if len(arrays) == 1:
+        _, first, inverse = np.unique(arrays[0], return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(np.stack(arrays, axis=1), axis=0,
+                                      return_index=True, return_inverse=True)
+    return first, inverse.ravel()
+
+def _deduplicated(func, args, kwargs, outputs=1):
+    """func evaluated once per distinct combination of its array arguments"""
+    values, arrays = _array_arguments(args, kwargs)
+    if not arrays:
+        return func(*args, **kwargs)
+    shaped = [a.ravel() for a in np.broadcast_arrays(*[values[i] for i in arrays])]
+    shape = np.broadcast_shapes(*[np.shape(values[i]) for i in arrays])
+    first, inverse = _unique_rows(shaped)
+    for i, a in zip(arrays, shaped):
+        values[i] = a[first]
+    return _each_output(_call(func, values, args, kwargs), outputs,
+                        lambda r: np.asarray(r)[inverse].reshape(shape))
+
+#Leap second table, days after 1972 Jan 1 (UTC julian day 2441317.5) and the
+#TT-UTC offsets minus 32.184 seconds that apply from each date onwards
+_leap_jday_vals = [-2441317.5, 0.,    182.,    366.,
+                   731.,   1096.,   1461.,   1827.,
+                   2192.,   2557.,   2922.,   3469.,
+                   3834.,   4199.,   4930.,   5844.,
+                   6575.,   6940.,   7487.,   7852.,
+                   8217.,   8766.,   9313.,   9862.,
+                   12419.,  13515., 14792.]
+
+_leap_offset_vals = [-32.184,10., 11.0, 12.0, 13.0,
+                     14.0, 15.0, 16.0, 17.0, 18.0,
+                     19.0, 20.0, 21.0, 22.0, 23.0,
+                     24.0, 25.0, 26.0, 27.0, 28.0,
+                     29.0, 30.0, 31.0, 32.0, 33.0,
+                     34.0, 35.0]
+
+#Amplitude (degrees), period (Julian years) and phase (degrees) of the
+#planetary perturbations to the FMS angle, their argument advancing by
+#_perturb_rate/tau degrees per day
+_perturb_A = (0.0071, 0.0057, 0.0039, 0.0037, 0.0021, 0.0020, 0.0018)
+_perturb_tau = (2.2353, 2.7543, 1.1177, 15.7866, 2.1354, 2.4694, 32.8493)
+_perturb_phi = (49.409, 168.173, 191.837, 21.736, 15.704, 95.528, 49.095)
+_perturb_rate = 0.985626
+
+#The other coefficients of the Mars24 formulae, as tuples so that the
+#compiled kernels of marstime.ufuncs share them:
+#mean anomaly and FMS angle (degrees, degrees per day)
+_mean_anomaly = (19.3870, 0.52402075)
+_fms_angle = (270.3863, 0.52403840)
+#equation of center, sin(M) amplitude and its rate per day then sin(2M)..sin(5M)
+_center = (10.691, 3.0e-7, 0.6230, 0.0500, 0.0050, 0.0005)
+#equation of time, sin(2Ls), sin(4Ls) and sin(6Ls) (degrees)
+_eot_terms = (2.861, -0.071, 0.002)
+#Mars Solar Date, j2000 offset of its epoch, sol in days, offset and correction
+_msd_terms = (4.5, 1.027491252, 44796.0, 0.00096)
+#solar declination, sin of the obliquity and the correction (degrees)
+_declination_terms = (0.42565, 0.25)
+#heliocentric distance, AU scale then the constant and cos(M)..cos(4M)
+_distance_terms = (1.523679, 1.00436, -0.09309, -0.004336, -0.00031, -0.00003)
+
+#Terms kept at each accuracy= tier: harmonics of M in the equation of center,
+#perturbation terms (largest first) and harmonics of Ls in the equation of
+#time. See Mars_Ls for the error of each tier.
+_accuracy_tiers = dict(full=(5, 7, 3), high=(4, 7, 3), medium=(4, 4, 2), low=(2, 0, 2))
+
+def _terms(accuracy):
+    """Returns the terms kept at an accuracy tier"""
+    try:
+        return _accuracy_tiers[accuracy]
+    except KeyError:
+        raise ValueError("accuracy must be one of {0}, not {1}".format(
+            ", ".join(sorted(_accuracy_tiers)), accuracy))
+
+#Start (j2000 offset) and length (days) of each Mars Year, from the zeroes of Mars_Ls
+_year_jday_vals = [-16336.044076, -15649.093471, -14962.0892946, -14275.0960023, -13588.1458658, -12901.1772635, -12214.2082215, -11527.2637345, -10840.2842249, -10153.2828749, -9466.3114025, -8779.3356111, -8092.3607738, -7405.4236452, -6718.4615347, -6031.4574604, -5344.4876509, -4657.5318339, -3970.5474528, -3283.5848372, -2596.6329362, -1909.6426682, -1222.6617049, -535.7040268, 151.2736522, 838.2369682, 1525.1834712, 2212.1799182, 2899.1848518, 3586.1403058, 4273.1024234, 4960.0765368, 5647.0207838, 6333.986502, 7020.9875066, 7707.9629132, 8394.9318782, 9081.9102062, 9768.8526533, 10455.8028354, 11142.8050514, 11829.7873254, 12516.7417734, 13203.725449, 13890.6991502, 14577.6484912, 15264.6324865, 15951.6217969, 16638.5798914, 17325.5517216, 18012.5209097, 18699.4628887, 19386.4443201, 20073.4534421, 20760.4152811, 21447.3696661, 22134.3466251, 22821.2966642, 23508.2529432, 24195.2539572, 24882.2400506, 25569.2081296, 26256.1902459, 26943.1429481, 27630.0847446, 28317.0793316, 29004.0710936, 29691.0238241, 30377.9991486, 31064.9784277, 31751.9249377, 32438.896907, 33125.8902412, 33812.8520242, 34499.8183442, 35186.7944595, 35873.740573, 36560.7112423, 37247.7247318]
+
+_year_vals = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63, 64, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 75, 76, 77, 78, 79]
+
+_year_length_vals = [686.95252, 686.950605, 687.0041764, 686.9932923, 686.9501365, 686.9686023, 686.969042, 686.944487, 686.9795096, 687.00135, 686.9714724, 686.9757914, 686.9748373, 686.9371286, 686.9621105, 687.0040743, 686.9698095, 686.955817, 686.9843811, 686.9626156, 686.951901, 686.990268, 686.9809633, 686.9576781, 686.977679, 686.963316, 686.946503, 686.996447, 687.0049336, 686.955454, 686.9621176, 686.9741134, 686.944247, 686.9657182, 687.0010046, 686.9754066, 686.968965, 686.978328, 686.9424471, 686.9501821, 687.002216, 686.982274, 686.954448, 686.9836756, 686.9737012, 686.949341, 686.9839953, 686.9893104, 686.9580945, 686.9718302, 686.9691881, 686.941979, 686.9814314, 687.009122, 686.961839, 686.954385, 686.976959, 686.9500391, 686.956279, 687.001014, 686.9860934, 686.968079, 686.9821163, 686.9527022, 686.9417965, 686.994587, 686.991762, 686.9527305, 686.9753245, 686.9792791, 686.94651, 686.9719693, 686.9933342, 686.961783, 686.96632, 686.9761153, 686.9461135, 686.9706693, 687.0134895]
+
+@_elementwise()
 def west_to_east(west):
     """Convert from west longitude to east longitude,
     or vice versa. """
@@ -27,9 +246,10 @@ def west_to_east(west):
     #which seems to be wrong, so I've removed that option.
     return east % 360.
 
+@_elementwise()
 def east_to_west(east):
     """Interface, calls west_to_east to convert longitude"""
-    return west_to_east(east)
+    return _impl.west_to_east(east)
 
 def j2000_epoch():
     """Returns the j2000 epoch as a float"""
@@ -39,17 +259,61 @@ def mills():
     """Returns the current time in milliseconds since Jan 1 1970"""
     return time.time()*1000.
 
+@_elementwise()
 def julian(m=None):
     """Returns the julian day number given milliseconds since Jan 1 1970"""
     if m is None:
         m= mills()
     return 2440587.5 + (m/8.64e7)
 
+def _is_sorted(values):
+    """True if the array is ascending (in C order, without nans)"""
+    if np.ndim(values) == 0 or np.size(values) < 2:
+        return False
+    flat = values.ravel()
+    #a strided sample rejects most unsorted inputs cheaply
+    sample = flat[::max(1, flat.size//64)]
+    if not np.all(sample[1:] >= sample[:-1]):
+        return False
+    return bool(np.all(flat[1:] >= flat[:-1]))
+
+def _table_bounds(flat, edges):
+    """Start of the run of sorted values in each interval of the sorted table
+    edges, as numbered by np.digitize (0 below the first edge, len(edges) from
+    the last), followed by the end of the values"""
+    return np.concatenate(([0], np.searchsorted(flat, edges), [flat.size]))
+
+def table_segments(values, table="leap"):
+    """Returns the run-length segments of sorted values over a lookup table:
+    arrays (index, start, stop), one entry per table interval that holds
+    values, where values.ravel()[start:stop] fall in interval index.
+    table is "leap" (the UTC Julian days of utc_to_tt_offset, index i being
+    the i-th offset) or "year" (the j2000 offsets of Mars_Year, index i
+    being year i, with the years before 1 in index 0 and those from 79 on
+    in index 79), or an array of ascending interval edges numbered as in
+    np.digitize. The search is over the k table edges, O(k log n), instead
+    of over the n values."""
+    if isinstance(table, str):
+        edges = dict(leap=lambda: 2441317.5 + np.array(_leap_jday_vals),
+                     year=lambda: np.array(_year_jday_vals))[table]()
+    else:
+        edges = np.asarray(table, dtype=float)
+    flat = np.asarray(values, dtype=float).ravel()
+    if not (flat.size < 2 or _is_sorted(flat)):
+        raise ValueError("table_segments needs sorted values")
+    bounds = _table_bounds(flat, edges)
+    if isinstance(table, str) and table == "leap":
+        #the first offset applies below the first edge too
+        bounds = np.delete(bounds, 1)
+    index = np.flatnonzero(bounds[1:] > bounds[:-1])
+    return index, bounds[index], bounds[index + 1]
+
+@_elementwise()
 def utc_to_tt_offset(jday=None):
     """Returns the offset in seconds from a julian date in Terrestrial Time (TT)
     to a Julian day in Coordinated Universal Time (UTC)"""
 
-    if use_numpy:
+    if use_numpy and not is_scalar(jday):
         return utc_to_tt_offset_numpy(jday)
     else:
         return utc_to_tt_offset_math(jday)
@@ -58,26 +322,15 @@ def utc_to_tt_offset_math(jday=None):
     """Returns the offset in seconds from a julian date in Terrestrial Time (TT)
     to a Julian day in Coordinated Universal Time (UTC) [MATH]"""
     if jday is None:
-        jday_np=julian()
+        jday_np=_impl.julian()
     else:
         jday_np = jday
     
     jday_min = 2441317.5
-    jday_vals = [     -2441317.5, 0.,    182.,    366.,
-                       731.,   1096.,   1461.,   1827.,
-                       2192.,   2557.,   2922.,   3469.,
-                       3834.,   4199.,   4930.,   5844.,
-                       6575.,   6940.,   7487.,   7852.,
-                       8217.,   8766.,   9313.,   9862.,
-                       12419.,  13515., 14792.]
+    jday_vals = _leap_jday_vals
 
     offset_min = 32.184
-    offset_vals = [-32.184,10., 11.0, 12.0, 13.0,
-                    14.0, 15.0, 16.0, 17.0, 18.0,
-                    19.0, 20.0, 21.0, 22.0, 23.0,
-                    24.0, 25.0, 26.0, 27.0, 28.0,
-                    29.0, 30.0, 31.0, 32.0, 33.0,
-                    34.0, 35.0]
+    offset_vals = _leap_offset_vals
 
     if jday_np <= jday_min+jday_vals[0]:
         return offset_min+offset_vals[0]
@@ -91,11 +344,13 @@ def utc_to_tt_offset_math(jday=None):
         return offset_min+offset_vals[i]
 
 
-def utc_to_tt_offset_numpy(jday=None):
+def utc_to_tt_offset_numpy(jday=None, assume_sorted=None):
     """Returns the offset in seconds from a julian date in Terrestrial Time (TT)
-    to a Julian day in Coordinated Universal Time (UTC) [NUMPY]"""
+    to a Julian day in Coordinated Universal Time (UTC) [NUMPY]. Sorted
+    input, detected unless assume_sorted is given, is filled one leap second
+    segment at a time (see table_segments)."""
     if jday is None:
-        jday_np=julian()
+        jday_np=_impl.julian()
     elif type(jday) is not np.ndarray:
         jday_np = np.array(jday)
     else:
@@ -104,21 +359,19 @@ def utc_to_tt_offset_numpy(jday=None):
     #offsets=np.zeros(jday.shape)
 
 
-    jday_vals = 2441317.5 +\
-        np.array([     -2441317.5, 0.,    182.,    366.,
-                           731.,   1096.,   1461.,   1827.,
-                           2192.,   2557.,   2922.,   3469.,
-                           3834.,   4199.,   4930.,   5844.,
-                           6575.,   6940.,   7487.,   7852.,
-                           8217.,   8766.,   9313.,   9862.,
-                           12419.,  13515., 14792.])
+    jday_vals = 2441317.5 + np.array(_leap_jday_vals)
+
+    offset_vals = 32.184 + np.array(_leap_offset_vals)
 
-    offset_vals = 32.184 + np.array([-32.184,10., 11.0, 12.0, 13.0,
-                                         14.0, 15.0, 16.0, 17.0, 18.0,
-                                         19.0, 20.0, 21.0, 22.0, 23.0,
-                                         24.0, 25.0, 26.0, 27.0, 28.0,
-                                         29.0, 30.0, 31.0, 32.0, 33.0,
-                                         34.0, 35.0])
+    if assume_sorted is None:
+        assume_sorted = _is_sorted(jday_np)
+    if assume_sorted and np.ndim(jday_np) > 0:
+        bounds = _table_bounds(np.asarray(jday_np, dtype=float).ravel(), jday_vals)
+        offset = np.empty(np.shape(jday_np))
+        flat = offset.reshape(-1)
+        for i in range(bounds.size - 1):
+            flat[bounds[i]:bounds[i+1]] = offset_vals[min(max(i, 1), offset_vals.size) - 1]
+        return offset
 
     try:
         offset = offset_vals[
@@ -132,261 +385,468 @@ def utc_to_tt_offset_numpy(jday=None):
         
     return offset# 64.184
 
+@_elementwise()
+def tt_to_utc_offset(jday_tt=None):
+    """Returns the offset in seconds to subtract from a julian date in
+    Terrestrial Time (TT) to get a Julian day in Coordinated Universal Time (UTC).
+    The inverse of utc_to_tt_offset; TT instants that fall inside an inserted
+    leap second map to the start of the following UTC day."""
 
+    if use_numpy and not is_scalar(jday_tt):
+        return tt_to_utc_offset_numpy(jday_tt)
+    else:
+        return tt_to_utc_offset_math(jday_tt)
+
+def tt_to_utc_offset_math(jday_tt=None):
+    """Returns the offset in seconds from a julian date in Terrestrial Time (TT)
+    back to a Julian day in Coordinated Universal Time (UTC) [MATH]"""
+    if jday_tt is None:
+        jday_tt = _impl.julian_tt()
+
+    jday_min = 2441317.5
+    offset_min = 32.184
+    #each table entry starts at its UTC day boundary, which in TT is
+    #shifted by the offset that applies after the boundary
+    n = len(_leap_offset_vals)
+    i = 0
+    while i < n-1 and jday_min+_leap_jday_vals[i+1] + \
+            (offset_min+_leap_offset_vals[i+1])/86400. <= jday_tt:
+        i += 1
+    offset = offset_min+_leap_offset_vals[i]
+    if i < n-1:
+        #inside a leap second, hold UTC at the next boundary
+        boundary = jday_min+_leap_jday_vals[i+1]
+        if jday_tt - offset/86400. > boundary:
+            offset = (jday_tt - boundary)*86400.
+    return offset
+
+def tt_to_utc_offset_numpy(jday_tt=None):
+    """Returns the offset in seconds from a julian date in Terrestrial Time (TT)
+    back to a Julian day in Coordinated Universal Time (UTC) [NUMPY]"""
+    if jday_tt is None:
+        jday_tt = _impl.julian_tt()
+    jday_np = np.asarray(jday_tt, dtype=float)
+
+    jday_vals = 2441317.5 + np.array(_leap_jday_vals)
+    offset_vals = 32.184 + np.array(_leap_offset_vals)
+    tt_vals = jday_vals + offset_vals/86400.
+
+    i = np.clip(np.digitize(jday_np, tt_vals), 1, offset_vals.size) - 1
+    offset = offset_vals[i]
+    #inside a leap second, hold UTC at the next boundary
+    boundary = np.append(jday_vals[1:], np.inf)[i]
+    excess = jday_np - offset/86400. - boundary
+    offset = np.where(excess > 0, (jday_np - boundary)*86400., offset)
+    return offset[()]
+
+@_elementwise()
 def julian_tt(jday_utc=None):
     """Returns the TT Julian day given a UTC Julian day"""
     if jday_utc is None:
-        jday_utc = julian()
+        jday_utc = _impl.julian()
     
-    jdtt = jday_utc + utc_to_tt_offset(jday_utc)/86400.
+    jdtt = jday_utc + _impl.utc_to_tt_offset(jday_utc)/86400.
     return jdtt
 
+@_elementwise()
+def julian_utc(jday_tt=None):
+    """Returns the UTC Julian day given a TT Julian day"""
+    if jday_tt is None:
+        jday_tt = _impl.julian_tt()
+
+    jdutc = jday_tt - _impl.tt_to_utc_offset(jday_tt)/86400.
+    return jdutc
+
+@_elementwise()
+def mills_from_julian(jday):
+    """Returns milliseconds since Jan 1 1970 given a UTC julian day number"""
+    return (jday - 2440587.5)*8.64e7
+
+@_elementwise()
+def mills_from_j2000_ott(j2000_ott):
+    """Returns UTC milliseconds since Jan 1 1970 given a j2000 TT offset.
+    Works from the offset rather than the full julian day to keep
+    sub-millisecond precision."""
+    offset = _impl.tt_to_utc_offset(j2000_ott + j2000_epoch())
+    return (j2000_ott + (j2000_epoch() - 2440587.5))*8.64e7 - offset*1000.
+
+def datetime64_from_mills(m):
+    """Returns a numpy datetime64[us] array given milliseconds since Jan 1 1970"""
+    us = np.round(np.asarray(m, dtype=float)*1000.).astype("int64")
+    return us.astype("datetime64[us]")
+
+@_elementwise()
 def j2000_offset_tt(jday_tt=None):
     """Returns the julian day offset since the J2000 epoch"""
     if jday_tt is None:
-        jday_tt = julian_tt()
+        jday_tt = _impl.julian_tt()
 
     return (jday_tt - j2000_epoch())
 
+@_elementwise()
 def Mars_Mean_Anomaly(j2000_ott=None):
     """Calculates the Mars Mean Anomaly given a j2000 julian day offset"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
 
-    M = 19.3870 + 0.52402075 * j2000_ott
+    M = _mean_anomaly[0] + _mean_anomaly[1] * j2000_ott
     return M % 360.
 
+@_elementwise()
 def FMS_Angle(j2000_ott=None):
     """Returns the Fictional Mean Sun angle"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
         
-    alpha_fms = 270.3863 + 0.52403840 * j2000_ott
+    alpha_fms = _fms_angle[0] + _fms_angle[1] * j2000_ott
     return alpha_fms % 360.
 
-def alpha_perturbs(j2000_ott=None):
+@_elementwise()
+def alpha_perturbs(j2000_ott=None, accuracy="full"):
     """Returns the perturbations to apply to the FMS Angle from orbital perturbations"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
     
-    array_A = [0.0071, 0.0057, 0.0039, 0.0037, 0.0021, 0.0020, 0.0018]
-    array_tau = [2.2353, 2.7543, 1.1177, 15.7866, 2.1354, 2.4694, 32.8493]
-    array_phi = [49.409, 168.173, 191.837, 21.736, 15.704, 95.528, 49.095]
-
+    n = _terms(accuracy)[1]
     pbs = 0
-    for (A,tau,phi) in zip(array_A, array_tau, array_phi):
-        pbs+=A*np.cos(((0.985626 * j2000_ott/tau) + phi)*np.pi/180.)
+    for (A,tau,phi) in zip(_perturb_A[:n], _perturb_tau, _perturb_phi):
+        pbs+=A*np.cos(((_perturb_rate * j2000_ott/tau) + phi)*np.pi/180.)
 
     return pbs
 
-def equation_of_center(j2000_ott=None):
+@_elementwise()
+def equation_of_center(j2000_ott=None, accuracy="full"):
     """The true anomaly (v) - the Mean anomaly (M)"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
+
+    M = _impl.Mars_Mean_Anomaly(j2000_ott)*np.pi/180.
+    pbs = _impl.alpha_perturbs(j2000_ott, accuracy)
+    sinM = [np.sin(k*M) for k in range(1, _terms(accuracy)[0]+1)]
 
-    M = Mars_Mean_Anomaly(j2000_ott)*np.pi/180.
-    pbs = alpha_perturbs(j2000_ott)
+    return _equation_of_center(j2000_ott, sinM, pbs)
 
-    val = (10.691 + 3.0e-7 * j2000_ott)*np.sin(M)\
-        + 0.6230 * np.sin(2*M)\
-        + 0.0500 * np.sin(3*M)\
-        + 0.0050 * np.sin(4*M)\
-        + 0.0005 * np.sin(5*M) \
-        + pbs
+def _equation_of_center(j2000_ott, sinM, pbs):
+    """equation_of_center from sin(k*M), k=1..5 or fewer, and the perturbations"""
+    val = (_center[0] + _center[1] * j2000_ott)*sinM[0]
+    for (c, sinkM) in zip(_center[2:], sinM[1:]):
+        val = val + c*sinkM
+    val = val + pbs
 
     return val
 
-def Mars_Ls(j2000_ott=None):
-    """Returns the Areocentric solar longitude (aka Ls)"""
+@_elementwise()
+def Mars_Ls(j2000_ott=None, accuracy="full"):
+    """Returns the Areocentric solar longitude (aka Ls)
+
+    accuracy trades the smallest terms of the equation of center, the
+    planetary perturbations and the equation of time for speed throughout
+    the chain. The largest errors against "full" over 1900-2100 are
+
+    ======  ========  =========  ========  =========  =======
+    tier    Ls (deg)  EOT (deg)  LTST (s)  SZA (deg)  speedup
+    ======  ========  =========  ========  =========  =======
+    full    0         0          0         0          1
+    high    5e-4      6e-4       0.14      5e-4       1.2
+    medium  6e-3      8e-3       2.0       7e-3       1.4
+    low     8e-2      9e-2       21        8e-2       2.4
+    ======  ========  =========  ========  =========  =======
+
+    (LTST in Mars seconds, speedups for solar_zenith on 10^6 times, see the
+    TimeAccuracy benchmark). Azimuths within a few degrees of the zenith
+    can change by more, as the azimuth is poorly defined there."""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
 
-    alpha = FMS_Angle(j2000_ott)
-    v_m   = equation_of_center(j2000_ott)
+    alpha = _impl.FMS_Angle(j2000_ott)
+    v_m   = _impl.equation_of_center(j2000_ott, accuracy)
 
     ls = (alpha + v_m)
     ls = ls % 360
     return ls
 
-def equation_of_time(j2000_ott=None):
+@_elementwise()
+def equation_of_time(j2000_ott=None, accuracy="full"):
     """Equation of Time, to convert between Local Mean Solar Time
     and Local True Solar Time, and make pretty analemma plots"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
 
-    ls = Mars_Ls(j2000_ott)*np.pi/180.
+    ls = _impl.Mars_Ls(j2000_ott, accuracy)*np.pi/180.
 
-    EOT = 2.861*np.sin(2*ls)\
-        - 0.071 * np.sin(4*ls)\
-        + 0.002 * np.sin(6*ls) - equation_of_center(j2000_ott)
+    return _equation_of_time(np.sin(2*ls), np.cos(2*ls),
+                             _impl.equation_of_center(j2000_ott, accuracy),
+                             _terms(accuracy)[2])
+
+def _equation_of_time(sin2ls, cos2ls, v_m, harmonics=3):
+    """equation_of_time from sin(2Ls), cos(2Ls) and the equation of center,
+    the higher harmonics use the multiple angle formulae"""
+    EOT = _eot_terms[0]*sin2ls
+    if harmonics > 1:
+        EOT = EOT + _eot_terms[1] * (2*sin2ls*cos2ls)
+    if harmonics > 2:
+        EOT = EOT + _eot_terms[2] * (sin2ls*(3 - 4*sin2ls*sin2ls))
+    EOT = EOT - v_m
 
     return EOT
 
+@_elementwise()
 def j2000_from_Mars_Solar_Date(msd=0):
     """Returns j2000 based on MSD"""
-    j2000_ott = ((msd + 0.00096 - 44796.0) * 1.027491252)+4.5
+    t0, sol, offset, correction = _msd_terms
+    j2000_ott = ((msd + correction - offset) * sol)+t0
     return j2000_ott
 
+@_elementwise()
 def j2000_ott_from_Mars_Solar_Date(msd=0):
-    """Returns j2000 offset based on MSD"""
-    j2000 = j2000_from_Mars_Solar_Date(msd)
-    j2000_ott = julian_tt(j2000+j2000_epoch())
-    return j2000_ott-j2000_epoch()
-
+    """Returns j2000 offset based on MSD. MSD is defined on Terrestrial Time,
+    so no UTC offset is applied (see mills_from_Mars_Solar_Date for UTC)"""
+    return _impl.j2000_from_Mars_Solar_Date(msd)
+
+@_elementwise()
+def j2000_ott_from_Coordinated_Mars_Time(mtc, sol):
+    """Returns j2000 offset given the Coordinated Mars Time (hours) on
+    the Mars Solar Date sol (integer part of the MSD)"""
+    return _impl.j2000_from_Mars_Solar_Date(sol + mtc/24.)
+
+@_elementwise()
+def j2000_ott_from_Local_Mean_Solar_Time(lmst, sol, longitude=0):
+    """Returns j2000 offset given the Local Mean Solar Time (hours) at a
+    planetographic longitude on the local sol (integer part of the local MSD)"""
+    return _impl.j2000_from_Mars_Solar_Date(sol + lmst/24. + longitude/360.)
+
+@_elementwise()
+def mills_from_Mars_Solar_Date(msd):
+    """Returns UTC milliseconds since Jan 1 1970 given a Mars Solar Date"""
+    return _impl.mills_from_j2000_ott(_impl.j2000_ott_from_Mars_Solar_Date(msd))
+
+@_elementwise()
 def Mars_Solar_Date(j2000_ott = None):
     """Return the Mars Solar date"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
         
-    MSD = (((j2000_ott - 4.5)/1.027491252) + 44796.0 - 0.00096)
+    t0, sol, offset, correction = _msd_terms
+    MSD = (((j2000_ott - t0)/sol) + offset - correction)
     return MSD
     
+@_elementwise()
 def Clancy_Year(j2000_ott = None):
     """Returns the Mars Year date based on the reference date from Clancy(2000): 1955 April 11, 11am"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
     ref1955_4_11_11am = -16336.0416 #j2000_offset_tt reference
     year = np.floor(1 + (j2000_ott-ref1955_4_11_11am)/(686.978))
     return year
 
+@_elementwise(outputs=lambda j2000_ott=None, return_length=False: 2 if return_length else 1)
 def Mars_Year(j2000_ott = None, return_length=False):
     """Returns the Mars Year date based on the reference date 1955 April 11, 10:56:31 mtc after finding the j2k offsets of the zeroes of the Mars_Ls function. """
-    jday_vals = [-16336.044076, -15649.093471, -14962.0892946, -14275.0960023, -13588.1458658, -12901.1772635, -12214.2082215, -11527.2637345, -10840.2842249, -10153.2828749, -9466.3114025, -8779.3356111, -8092.3607738, -7405.4236452, -6718.4615347, -6031.4574604, -5344.4876509, -4657.5318339, -3970.5474528, -3283.5848372, -2596.6329362, -1909.6426682, -1222.6617049, -535.7040268, 151.2736522, 838.2369682, 1525.1834712, 2212.1799182, 2899.1848518, 3586.1403058, 4273.1024234, 4960.0765368, 5647.0207838, 6333.986502, 7020.9875066, 7707.9629132, 8394.9318782, 9081.9102062, 9768.8526533, 10455.8028354, 11142.8050514, 11829.7873254, 12516.7417734, 13203.725449, 13890.6991502, 14577.6484912, 15264.6324865, 15951.6217969, 16638.5798914, 17325.5517216, 18012.5209097, 18699.4628887, 19386.4443201, 20073.4534421, 20760.4152811, 21447.3696661, 22134.3466251, 22821.2966642, 23508.2529432, 24195.2539572, 24882.2400506, 25569.2081296, 26256.1902459, 26943.1429481, 27630.0847446, 28317.0793316, 29004.0710936, 29691.0238241, 30377.9991486, 31064.9784277, 31751.9249377, 32438.896907, 33125.8902412, 33812.8520242, 34499.8183442, 35186.7944595, 35873.740573, 36560.7112423, 37247.7247318]
-
-    year_vals = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63, 64, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 75, 76, 77, 78, 79]
-
-    year_length = [686.95252, 686.950605, 687.0041764, 686.9932923, 686.9501365, 686.9686023, 686.969042, 686.944487, 686.9795096, 687.00135, 686.9714724, 686.9757914, 686.9748373, 686.9371286, 686.9621105, 687.0040743, 686.9698095, 686.955817, 686.9843811, 686.9626156, 686.951901, 686.990268, 686.9809633, 686.9576781, 686.977679, 686.963316, 686.946503, 686.996447, 687.0049336, 686.955454, 686.9621176, 686.9741134, 686.944247, 686.9657182, 687.0010046, 686.9754066, 686.968965, 686.978328, 686.9424471, 686.9501821, 687.002216, 686.982274, 686.954448, 686.9836756, 686.9737012, 686.949341, 686.9839953, 686.9893104, 686.9580945, 686.9718302, 686.9691881, 686.941979, 686.9814314, 687.009122, 686.961839, 686.954385, 686.976959, 686.9500391, 686.956279, 687.001014, 686.9860934, 686.968079, 686.9821163, 686.9527022, 686.9417965, 686.994587, 686.991762, 686.9527305, 686.9753245, 686.9792791, 686.94651, 686.9719693, 686.9933342, 686.961783, 686.96632, 686.9761153, 686.9461135, 686.9706693, 687.0134895]
+    if j2000_ott is None:
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
 
-    if use_numpy:
-        return Mars_Year_np(j2000_ott,jday_vals, year_vals, year_length, return_length)
+    if use_numpy and not is_scalar(j2000_ott):
+        return Mars_Year_np(j2000_ott, _year_jday_vals, _year_vals, _year_length_vals, return_length)
     else:
-        return Mars_Year_math(j2000_ott,jday_vals, year_vals, year_length, return_length)
+        return Mars_Year_math(j2000_ott, _year_jday_vals, _year_vals, _year_length_vals, return_length)
 
 
 def Mars_Year_math(j2k_math, jday_vals, year_vals, year_length, return_length=False):
 
     if j2k_math < jday_vals[0]:
-        return np.floor(1+(j2k_math-jday_vals[0])/year_length[0])
+        y = np.floor(1+(j2k_math-jday_vals[0])/year_length[0])
+        l = year_length[0]
     elif j2k_math >= jday_vals[-1]:
-        return np.floor(1+(j2k_math-jday_vals[-1])/year_length[-1])
+        y = year_vals[-1] + np.floor((j2k_math-jday_vals[-1])/year_length[-1])
+        l = year_length[-1]
     else:
         for i in range(0, len(year_vals)-1):
             if (jday_vals[i] <= j2k_math) and\
                     (jday_vals[i+1] > j2k_math) :
                 break                
-    y= year_vals[i]
-    l= year_length[i]
+        y= year_vals[i]
+        l= year_length[i]
 
+    #a float, as Mars_Year_np returns
     if return_length:
-        return (y,l)
+        return (float(y),l)
     else:
-        return y
+        return float(y)
     
-def Mars_Year_np(j2k_np, jday_vals, year_vals, year_length, return_length=False):
+def Mars_Year_np(j2k_np, jday_vals, year_vals, year_length, return_length=False,
+                 assume_sorted=None):
+    """Mars_Year for arrays. Sorted input, detected unless assume_sorted is
+    given, is filled one year segment at a time (see table_segments)."""
     jday_vals = np.array(jday_vals)
 
     year_vals = np.array(year_vals)
 
     year_length = np.array(year_length)
 
-    if j2k_np < jday_vals[0]:
-        return np.floor(1+(j2k_np-jday_vals[0])/year_length[0])
-    elif j2k_np >= jday_vals[-1]:
-        return np.floor(1+(j2k_np-jday_vals[-1])/year_length[-1])
+    j2k_np = np.asarray(j2k_np, dtype=float)
+    if assume_sorted is None:
+        assume_sorted = _is_sorted(j2k_np)
+    if assume_sorted and j2k_np.ndim > 0:
+        flat = j2k_np.ravel()
+        bounds = _table_bounds(flat, jday_vals)
+        y = np.empty(flat.shape)
+        l = np.empty(flat.shape)
+        for i in range(bounds.size - 1):
+            s = slice(bounds[i], bounds[i+1])
+            v = min(max(i, 1), jday_vals.size) - 1
+            y[s] = year_vals[v]
+            l[s] = year_length[v]
+        #outside the table, extrapolate with the first or last year length
+        s = slice(0, bounds[1])
+        y[s] = np.floor(1+(flat[s]-jday_vals[0])/year_length[0])
+        s = slice(bounds[-2], flat.size)
+        y[s] = year_vals[-1] + np.floor((flat[s]-jday_vals[-1])/year_length[-1])
+        y, l = y.reshape(j2k_np.shape), l.reshape(j2k_np.shape)
     else:
-        try:
-            v=np.clip(np.digitize(j2k_np,jday_vals),1,jday_vals.size)-1
-            y = year_vals[v]
-            l = year_length[v]
-        except:
-            v=np.clip(np.digitize([j2k_np],jday_vals),1,jday_vals.size)-1
-            y = year_vals[v][0]
-            l = year_length[v][0]
+        v=np.clip(np.digitize(j2k_np,jday_vals),1,jday_vals.size)-1
+        y = year_vals[v]*1.0
+        l = year_length[v]
+
+        #outside the table, extrapolate with the first or last year length
+        before = j2k_np < jday_vals[0]
+        y = np.where(before, np.floor(1+(j2k_np-jday_vals[0])/year_length[0]), y)
+        after = j2k_np >= jday_vals[-1]
+        y = np.where(after,
+                     year_vals[-1] + np.floor((j2k_np-jday_vals[-1])/year_length[-1]), y)
 
     if return_length:
-        return (y*1.0,l)
+        return (y[()],l[()])
     else:
-        return y*1.0
+        return y[()]
 
+@_elementwise()
 def Coordinated_Mars_Time(j2000_ott = None):
     """The Mean Solar Time at the Prime Meridian"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
         
-    MTC = 24 * (((j2000_ott - 4.5)/1.027491252) + 44796.0 - 0.00096)
+    t0, sol, offset, correction = _msd_terms
+    MTC = 24 * (((j2000_ott - t0)/sol) + offset - correction)
     MTC = MTC % 24
     return MTC
 
+@_elementwise()
 def Local_Mean_Solar_Time(longitude=0, j2000_ott=None):
     """The Local Mean Solar Time given a planetographic longitude"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
         
-    MTC = Coordinated_Mars_Time(j2000_ott)
+    MTC = _impl.Coordinated_Mars_Time(j2000_ott)
     LMST = MTC - longitude * (24/360.)
     LMST = LMST % 24
     return LMST
 
-def Local_True_Solar_Time(longitude=0, j2000_ott=None):
+@_elementwise()
+def Local_True_Solar_Time(longitude=0, j2000_ott=None, accuracy="full"):
     """Local true solar time is the Mean solar time + equation of time perturbation"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
         
-    eot = equation_of_time(j2000_ott)
-    lmst = Local_Mean_Solar_Time(longitude, j2000_ott)
+    eot = _impl.equation_of_time(j2000_ott, accuracy)
+    lmst = _impl.Local_Mean_Solar_Time(longitude, j2000_ott)
     ltst = lmst + eot*(24/360.)
     ltst = ltst % 24
     return ltst
 
-def subsolar_longitude(j2000_ott=None):
+def times_of_ltst(target_hours, longitudes, sol_range, iterations=3, mills=False):
+    """Returns the j2000 offsets when the Local True Solar Time is target_hours
+    at each longitude on each local sol (integer local MSD) in sol_range.
+
+    The result has shape longitudes.shape + (len(sol_range),); target_hours is
+    a scalar or one value per longitude. The first guess is the LMST solution,
+    which is then corrected for the equation of time by fixed-point iteration
+    (each iteration improves the answer by roughly three orders of magnitude).
+    Near midnight a solution may lie just outside its mean sol, but there is
+    still exactly one per sol.
+    If mills is True, UTC milliseconds since Jan 1 1970 are returned instead."""
+    lon = np.asarray(longitudes, dtype=float)[..., np.newaxis]
+    target = np.asarray(target_hours, dtype=float)[..., np.newaxis] % 24.
+    sols = np.asarray(sol_range, dtype=float)
+
+    j2000_ott = _impl.j2000_ott_from_Local_Mean_Solar_Time(target, sols, lon)
+    for i in range(iterations):
+        #not wrapped, so a target near midnight can stay on the same true sol
+        lmst = target - _impl.equation_of_time(j2000_ott)*(24/360.)
+        j2000_ott = _impl.j2000_ott_from_Local_Mean_Solar_Time(lmst, sols, lon)
+
+    if mills:
+        return _impl.mills_from_j2000_ott(j2000_ott)
+    return j2000_ott
+
+@_elementwise()
+def subsolar_longitude(j2000_ott=None, accuracy="full"):
     """returns the longitude of the subsolar point for a given julian day."""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
 
-    MTC = Coordinated_Mars_Time(j2000_ott)
-    EOT = equation_of_time(j2000_ott)*24/360.
-    subsol = (MTC + EOT)*(360/24.) + 180.
+    MTC = _impl.Coordinated_Mars_Time(j2000_ott)
+    EOT = _impl.equation_of_time(j2000_ott, accuracy)
+    return _subsolar_longitude(MTC, EOT)
+
+def _subsolar_longitude(MTC, EOT):
+    """subsolar_longitude from the Coordinated Mars Time and equation of time"""
+    subsol = (MTC + EOT*24/360.)*(360/24.) + 180.
     return subsol % 360.
 
+@_elementwise()
 def solar_declination(ls=None):
     """Returns the solar declination"""
     if ls is None:
-        ls= Mars_Ls()
+        ls= _impl.Mars_Ls()
     ls1 = ls * np.pi/180.
 
+    return _solar_declination(np.sin(ls1))
+
+def _solar_declination(sinls):
+    """solar_declination from sin(Ls)"""
+    a, b = _declination_terms
     if use_numpy:
-        dec = np.arcsin(0.42565 * np.sin(ls1)) + 0.25*(np.pi/180) * np.sin(ls1)
+        dec = np.arcsin(a * sinls) + b*(np.pi/180) * sinls
     else:
-        dec = np.asin(0.42565 * np.sin(ls1)) + 0.25*(np.pi/180) * np.sin(ls1)
+        dec = np.asin(a * sinls) + b*(np.pi/180) * sinls
     dec = dec * 180. / np.pi
     return dec
 
+@_elementwise()
 def heliocentric_distance(j2000_ott=None):
     """Instantaneous orbital radius"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
 
-    M = Mars_Mean_Anomaly(j2000_ott)*np.pi/180.
-    
-    rm = 1.523679 * \
-        (1.00436 - 0.09309*np.cos(M) \
-             - 0.004336*np.cos(2*M) \
-             - 0.00031*np.cos(3*M)\
-             - 0.00003*np.cos(4*M))
+    M = _impl.Mars_Mean_Anomaly(j2000_ott)*np.pi/180.
+    cosM = [np.cos(k*M) for k in range(1, 5)]
+
+    return _heliocentric_distance(cosM)
+
+def _heliocentric_distance(cosM):
+    """heliocentric_distance from cos(k*M), k=1..4"""
+    scale, c0, c1, c2, c3, c4 = _distance_terms
+    rm = scale * \
+        (c0 + c1*cosM[0] \
+             + c2*cosM[1] \
+             + c3*cosM[2]\
+             + c4*cosM[3])
 
     return rm
 
+@_elementwise()
 def heliocentric_longitude(j2000_ott=None):
     """Heliocentric longitude, which is not Ls (offsets are different)"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt() 
-    ls = Mars_Ls(j2000_ott)
+        j2000_ott = _impl.j2000_offset_tt() 
+    ls = _impl.Mars_Ls(j2000_ott)
 
     im = ls + 85.061 - \
         0.015 * np.sin((71+2*ls)*np.pi/180.) - \
@@ -395,41 +855,68 @@ def heliocentric_longitude(j2000_ott=None):
     return im % 360.
 
 
+@_elementwise()
 def heliocentric_latitude(j2000_ott=None):
     """Heliocentric Latitude, which is not Ls"""
     if j2000_ott is None:
-        j2000_ott = j2000_offset_tt()
+        j2000_ott = _impl.j2000_offset_tt()
 
-    ls        = Mars_Ls(j2000_ott)
+    ls        = _impl.Mars_Ls(j2000_ott)
 
     bm = -(1.8497 - 2.23e-5*j2000_ott) \
         * np.sin((ls - 144.50 + 2.57e-6*j2000_ott)*np.pi/180.)
 
     return bm
 
-def hourangle(longitude=0, j2000_ott=None):
+@_elementwise()
+def hourangle(longitude=0, j2000_ott=None, accuracy="full"):
     """Hourangle is the longitude - subsolar longitude"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt()
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt()
         
-    subsol = subsolar_longitude(j2000_ott)*np.pi/180.
+    subsol = _impl.subsolar_longitude(j2000_ott, accuracy)*np.pi/180.
     hourangle = longitude*np.pi/180. - subsol
     return hourangle
 
-def solar_zenith(longitude=0,latitude=0, j2000_ott=None):
-    """Zenith Angle, angle between sun and nadir"""
+def _cast(dtype, *values):
+    """Returns the values as arrays of dtype, for the reduced precision modes"""
+    return [np.asarray(v, dtype=dtype) for v in values]
+
+@_elementwise()
+def solar_zenith(longitude=0,latitude=0, j2000_ott=None, dtype=None, accuracy="full"):
+    """Zenith Angle, angle between sun and nadir.
+
+    With dtype=numpy.float32 the time terms (Ls, MTC, subsolar longitude,
+    declination) are computed in float64 and the terms broadcast over sites,
+    and the result, in float32. The error is below 3e-4 degrees, rising to
+    ~0.1 degrees within a degree of the zenith or nadir, where arccos is
+    poorly conditioned (use cos_solar_zenith there). See Mars_Ls for accuracy."""
    
-    if latitude > 90 or latitude < -90:
+    if use_numpy:
+        out_of_bounds = np.any(np.abs(latitude) > 90)
+    else:
+        out_of_bounds = latitude > 90 or latitude < -90
+    if out_of_bounds:
         raise ValueError("Latitude out of Bounds: {0}".format(latitude))
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt()
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt()
         
-    ha = hourangle(longitude, j2000_ott)
-    ls = Mars_Ls(j2000_ott)
-    dec = solar_declination(ls)*np.pi/180
+    ls = _impl.Mars_Ls(j2000_ott, accuracy)
+    dec = _impl.solar_declination(ls)*np.pi/180
+    if dtype is None:
+        ha = _impl.hourangle(longitude, j2000_ott, accuracy)
+    else:
+        #cast before broadcasting the time terms against the sites
+        subsol, dec, longitude, latitude = _cast(
+            dtype, _impl.subsolar_longitude(j2000_ott, accuracy)*np.pi/180., dec, longitude, latitude)
+        ha = longitude*(np.pi/180.) - subsol
 
+    return _solar_zenith(latitude, dec, ha)
+
+def _solar_zenith(latitude, dec, ha):
+    """solar_zenith from the declination and hour angle in radians"""
     cosZ = np.sin(dec) * np.sin(latitude*np.pi/180) + \
         np.cos(dec)*np.cos(latitude*np.pi/180.)*np.cos(ha)
 
@@ -439,26 +926,35 @@ def solar_zenith(longitude=0,latitude=0, j2000_ott=None):
         Z = np.acos(cosZ)*180./np.pi
     return Z
 
-def solar_elevation(longitude=0, latitude=0, j2000_ott=None):
-    """Elevation = 90-Zenith, angle between sun and flat surface """
+@_elementwise()
+def solar_elevation(longitude=0, latitude=0, j2000_ott=None, dtype=None, accuracy="full"):
+    """Elevation = 90-Zenith, angle between sun and flat surface,
+    see solar_zenith for dtype and accuracy"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
         
-    Z = solar_zenith(longitude, latitude, j2000_ott)
+    Z = _impl.solar_zenith(longitude, latitude, j2000_ott, dtype, accuracy)
     return 90 - Z
 
-def solar_azimuth(longitude=0, latitude=0, j2000_ott = None):
+@_elementwise()
+def solar_azimuth(longitude=0, latitude=0, j2000_ott = None, accuracy="full"):
     """Azimuth Angle, between sun and north pole"""
     if j2000_ott is None:
-        jday_tt = julian_tt()
-        j2000_ott = j2000_offset_tt(jday_tt)
+        jday_tt = _impl.julian_tt()
+        j2000_ott = _impl.j2000_offset_tt(jday_tt)
     
-    ha = hourangle(longitude, j2000_ott)
-    ls = Mars_Ls(j2000_ott)
-    dec = solar_declination(ls)*np.pi/180.
-    denom = (np.cos(latitude)*np.tan(dec)\
-                 - np.sin(latitude)*np.cos(ha))
+    ha = _impl.hourangle(longitude, j2000_ott, accuracy)
+    ls = _impl.Mars_Ls(j2000_ott, accuracy)
+    dec = _impl.solar_declination(ls)*np.pi/180.
+
+    return _solar_azimuth(latitude, dec, ha)
+
+def _solar_azimuth(latitude, dec, ha):
+    """solar_azimuth from the declination and hour angle in radians"""
+    lat = latitude*np.pi/180.
+    denom = (np.cos(lat)*np.tan(dec)\
+                 - np.sin(lat)*np.cos(ha))
 
     num = np.sin(ha) 
 
@@ -469,6 +965,300 @@ def solar_azimuth(longitude=0, latitude=0, j2000_ott = None):
     return az
 
 
+def _sin_cos_declination(sinls):
+    """sin and cos of solar_declination from sin(Ls), using the angle sum
+    formulae instead of arcsin"""
+    a = _declination_terms[0] * sinls
+    b = _declination_terms[1]*(np.pi/180) * sinls
+    cosa = np.sqrt(1 - a*a)
+    sinb = np.sin(b)
+    cosb = np.cos(b)
+    return a*cosb + cosa*sinb, cosa*cosb - a*sinb
+
+def _solar_terms(j2000_ott, accuracy="full"):
+    """Returns the mean anomaly in radians, Ls, sin(Ls), the equation of time
+    and the Coordinated Mars Time, sharing the intermediate terms"""
+    harmonics, perturbations, eot_harmonics = _terms(accuracy)
+    M = _impl.Mars_Mean_Anomaly(j2000_ott)*np.pi/180.
+    v_m = _equation_of_center(j2000_ott, [np.sin(k*M) for k in range(1, harmonics+1)],
+                              _impl.alpha_perturbs(j2000_ott, accuracy))
+    ls = (_impl.FMS_Angle(j2000_ott) + v_m) % 360
+    sinls = np.sin(ls*np.pi/180.)
+    cosls = np.cos(ls*np.pi/180.)
+    eot = _equation_of_time(2*sinls*cosls, cosls*cosls - sinls*sinls, v_m, eot_harmonics)
+    return M, ls, sinls, eot, _impl.Coordinated_Mars_Time(j2000_ott)
+
+def _sun_direction(j2000_ott, distance=False, accuracy="full"):
+    """Returns sin and cos of the declination, the subsolar longitude in
+    radians and the heliocentric distance (1 unless distance is True)"""
+    M, ls, sinls, eot, mtc = _solar_terms(j2000_ott, accuracy)
+    subsol = _subsolar_longitude(mtc, eot)*np.pi/180.
+    sindec, cosdec = _sin_cos_declination(sinls)
+    rm = 1
+    if distance:
+        rm = _heliocentric_distance([np.cos(k*M) for k in range(1, 5)])
+    return sindec, cosdec, subsol, rm
+
+def _vector(x, y, z):
+    """Stacks vector components on a last axis of 3, a list without numpy"""
+    if use_numpy:
+        return np.stack(np.broadcast_arrays(x, y, z), axis=-1)
+    return [x, y, z]
+
+def sun_vector_body_fixed(j2000_ott=None, distance=False, accuracy="full"):
+    """Unit vector towards the Sun in the Mars body-fixed frame, x towards
+    0E, y towards 90E and z towards the north pole, with a last axis of 3.
+    Scaled by heliocentric_distance (AU) if distance is True."""
+    if j2000_ott is None:
+        j2000_ott = _impl.j2000_offset_tt()
+
+    sindec, cosdec, subsol, rm = _sun_direction(j2000_ott, distance, accuracy)
+    #subsolar longitude is west, so y takes the opposite sign
+    return _vector(rm*cosdec*np.cos(subsol), -rm*cosdec*np.sin(subsol), rm*sindec)
+
+def sun_vector_enu(longitude=0, latitude=0, j2000_ott=None, distance=False, accuracy="full"):
+    """Unit vector towards the Sun in the local east, north, up frame at a
+    planetographic (west) longitude and latitude, with a last axis of 3.
+    The arguments are broadcast against each other, so longitude[:, None]
+    with a 1D j2000_ott gives sites x times. Scaled by heliocentric_distance
+    (AU) if distance is True. The up component is cos(solar_zenith)."""
+    if j2000_ott is None:
+        j2000_ott = _impl.j2000_offset_tt()
+
+    sindec, cosdec, subsol, rm = _sun_direction(j2000_ott, distance, accuracy)
+    ha = longitude*np.pi/180. - subsol
+    lat = latitude*np.pi/180.
+    sinlat = np.sin(lat)
+    coslat = np.cos(lat)
+    cosha = np.cos(ha)
+    return _vector(rm*cosdec*np.sin(ha),
+                   rm*(coslat*sindec - sinlat*cosdec*cosha),
+                   rm*_cos_solar_zenith(sinlat, coslat, sindec, cosdec, cosha))
+
+@_elementwise()
+def cos_solar_zenith(longitude=0, latitude=0, j2000_ott=None, dtype=None, accuracy="full"):
+    """Cosine of solar_zenith, computed without inverse trig. Negative when
+    the sun is below the horizon. The arguments are broadcast against each
+    other, e.g. longitude[:, None] with a 1D j2000_ott gives sites x times.
+    With dtype=numpy.float32 the time terms are computed in float64 and the
+    site terms and result in float32, with an error below 1e-6.
+    See Mars_Ls for accuracy."""
+    if use_numpy:
+        out_of_bounds = np.any(np.abs(latitude) > 90)
+    else:
+        out_of_bounds = latitude > 90 or latitude < -90
+    if out_of_bounds:
+        raise ValueError("Latitude out of Bounds: {0}".format(latitude))
+    if j2000_ott is None:
+        j2000_ott = _impl.j2000_offset_tt()
+
+    sindec, cosdec, subsol, rm = _sun_direction(j2000_ott, accuracy=accuracy)
+    if dtype is not None:
+        sindec, cosdec, subsol, longitude, latitude = _cast(
+            dtype, sindec, cosdec, subsol, longitude, latitude)
+    lat = latitude*np.pi/180.
+    return _cos_solar_zenith(np.sin(lat), np.cos(lat), sindec, cosdec,
+                             np.cos(longitude*np.pi/180. - subsol))
+
+def _cos_solar_zenith(sinlat, coslat, sindec, cosdec, cosha):
+    """cos_solar_zenith from sin and cos of the latitude, declination and hour angle"""
+    return sinlat*sindec + coslat*cosdec*cosha
+
+@_elementwise(outputs=("ls", "lmst", "ltst", "sza", "azimuth"))
+def track_geometry(j2000_ott, longitude, latitude, chunk=2**18, knots_per_sol=None,
+                   accuracy="full", unique=False):
+    """Returns a dictionary of ls (Mars_Ls), lmst (Local_Mean_Solar_Time),
+    ltst (Local_True_Solar_Time), sza (solar_zenith) and azimuth
+    (solar_azimuth) for aligned arrays of times, planetographic longitudes
+    and latitudes, such as an orbiter ground track. The arguments are
+    broadcast against each other and evaluated elementwise in one pass that
+    shares the time terms, `chunk` samples at a time to bound the temporary
+    memory. If knots_per_sol is given the slowly varying terms are
+    interpolated, see interpolated_time_state, otherwise they are computed
+    at the given accuracy (see Mars_Ls). If unique is True the time terms
+    are computed once per distinct time, e.g. when many channels or
+    footprints share each timestamp."""
+    t, lon, lat = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (j2000_ott, longitude, latitude)])
+    if np.any(np.abs(lat) > 90):
+        raise ValueError("Latitude out of Bounds: {0}".format(
+            lat[np.abs(lat) > 90].ravel()[0]))
+    shape = t.shape
+    t, lon, lat = [x.ravel() for x in (t, lon, lat)]
+    out = dict((key, np.empty(t.size)) for key in
+               ["ls", "lmst", "ltst", "sza", "azimuth"])
+
+    def time_terms(tc):
+        #ls, eot, mtc, sin and cos of the declination
+        if knots_per_sol:
+            state = interpolated_time_state(tc, knots_per_sol)
+            dec = state["dec"]*np.pi/180.
+            return state["ls"], state["eot"], state["mtc"], np.sin(dec), np.cos(dec)
+        M, ls, sinls, eot, mtc = _solar_terms(tc, accuracy)
+        return (ls, eot, mtc) + tuple(_sin_cos_declination(sinls))
+
+    if unique and t.size:
+        first, inverse = _unique_rows([t])
+        distinct = t[first]
+        terms = [np.concatenate(parts) for parts in zip(
+            *[time_terms(distinct[start:start + chunk])
+              for start in range(0, distinct.size, chunk)])]
+
+    for start in range(0, t.size, chunk):
+        s = slice(start, start + chunk)
+        if unique:
+            ls, eot, mtc, sindec, cosdec = [x[inverse[s]] for x in terms]
+        else:
+            ls, eot, mtc, sindec, cosdec = time_terms(t[s])
+        lmst = (mtc - lon[s]*(24/360.)) % 24
+
+        ha = (lon[s] - _subsolar_longitude(mtc, eot))*np.pi/180.
+        sinlat = np.sin(lat[s]*np.pi/180.)
+        coslat = np.cos(lat[s]*np.pi/180.)
+        cosha = np.cos(ha)
+        cosZ = _cos_solar_zenith(sinlat, coslat, sindec, cosdec, cosha)
+
+        out["ls"][s] = ls
+        out["lmst"][s] = lmst
+        out["ltst"][s] = (lmst + eot*(24/360.)) % 24
+        out["sza"][s] = np.arccos(np.clip(cosZ, -1., 1.))*180./np.pi
+        #solar_azimuth with tan(dec) multiplied through by cos(dec) > 0
+        out["azimuth"][s] = (360 + np.arctan2(
+            cosdec*np.sin(ha), coslat*sindec - sinlat*cosdec*cosha)*180./np.pi) % 360.
+
+    return dict((key, value.reshape(shape)[()]) for (key, value) in out.items())
+
+def time_state(j2000_ott=None, accuracy="full"):
+    """Returns a dictionary of the quantities that depend only on time, computed
+    together so the intermediate terms are shared: j2000_ott,
+    M (Mars_Mean_Anomaly), alpha_fms (FMS_Angle), pbs (alpha_perturbs),
+    v_m (equation_of_center), ls (Mars_Ls), eot (equation_of_time),
+    mtc (Coordinated_Mars_Time), subsol (subsolar_longitude),
+    dec (solar_declination) and rm (heliocentric_distance).
+    See Mars_Ls for accuracy."""
+    if j2000_ott is None:
+        j2000_ott = _impl.j2000_offset_tt()
+
+    harmonics, perturbations, eot_harmonics = _terms(accuracy)
+    M = _impl.Mars_Mean_Anomaly(j2000_ott)
+    Mr = M*np.pi/180.
+    sinM = [np.sin(k*Mr) for k in range(1, harmonics+1)]
+    cosM = [np.cos(k*Mr) for k in range(1, 5)]
+    pbs = _impl.alpha_perturbs(j2000_ott, accuracy)
+
+    return _time_state(j2000_ott, M, sinM, cosM, pbs, eot_harmonics)
+
+def _time_state(j2000_ott, M, sinM, cosM, pbs, eot_harmonics=3):
+    """Completes time_state from the mean anomaly harmonics and perturbations"""
+    alpha_fms = _impl.FMS_Angle(j2000_ott)
+    v_m = _equation_of_center(j2000_ott, sinM, pbs)
+    ls = (alpha_fms + v_m) % 360
+    ls1 = ls*np.pi/180.
+    sinls = np.sin(ls1)
+    cosls = np.cos(ls1)
+    eot = _equation_of_time(2*sinls*cosls, cosls*cosls - sinls*sinls, v_m, eot_harmonics)
+    mtc = _impl.Coordinated_Mars_Time(j2000_ott)
+
+    return dict(j2000_ott=j2000_ott, M=M, alpha_fms=alpha_fms, pbs=pbs,
+                v_m=v_m, ls=ls, eot=eot, mtc=mtc,
+                subsol=_subsolar_longitude(mtc, eot),
+                dec=_solar_declination(sinls),
+                rm=_heliocentric_distance(cosM))
+
+def interpolated_time_state(j2000_ott, knots_per_sol=1, chunk=2**16):
+    """Returns time_state with the slowly varying terms, pbs, v_m, eot, dec
+    and rm, interpolated from evaluations at knots_per_sol evenly spaced knots
+    per sol, for high rate or densely sampled times in any order. M,
+    alpha_fms and mtc are computed exactly, and ls and subsol from them.
+
+    The 4 point cubic interpolation error with one knot per sol is below
+    3e-8 degrees in ls, eot, dec and subsol and 1e-10 AU in rm, and falls as
+    knots_per_sol**-4. The saving is largest when there are many samples
+    per knot; samples are interpolated `chunk` at a time."""
+    t = np.asarray(j2000_ott, dtype=float)
+    shape = t.shape
+    t = t.ravel()
+    h = _msd_terms[1]/knots_per_sol
+    x = t/h
+    k = np.floor(x)
+    u = x - k
+    #the knots span the finite times only, the nan u gives nan elsewhere
+    bad = ~np.isfinite(k)
+    if bad.any():
+        k[bad] = 0. if bad.all() else k[~bad].min()
+    k0 = int(k.min()) - 1
+    state = time_state((k0 + np.arange(int(k.max()) - k0 + 3))*h)
+
+    #cubic through the knots k-1, k, k+1 and k+2 in powers of u, per interval
+    keys = ["pbs", "v_m", "eot", "dec", "rm"]
+    y = np.stack([state[key] for key in keys], axis=-1)
+    ym, y0, y1, y2 = y[:-3], y[1:-2], y[2:-1], y[3:]
+    coefficients = np.stack([y0, -ym/3. - y0/2. + y1 - y2/6.,
+                             ym/2. - y0 + y1/2., (y2 - ym)/6. + (y0 - y1)/2.], axis=1)
+    i = (k - (k0 + 1)).astype(int)
+    slow = np.empty((len(keys), t.size))
+    for start in range(0, t.size, chunk):
+        c = coefficients[i[start:start+chunk]]
+        uc = u[start:start+chunk, np.newaxis]
+        slow[:, start:start+chunk] = (c[:, 0] + uc*(c[:, 1] + uc*(c[:, 2] + uc*c[:, 3]))).T
+    slow = dict((key, value.reshape(shape)[()]) for (key, value) in zip(keys, slow))
+
+    t = t.reshape(shape)[()]
+    alpha_fms = _impl.FMS_Angle(t)
+    mtc = _impl.Coordinated_Mars_Time(t)
+    return dict(j2000_ott=t, M=_impl.Mars_Mean_Anomaly(t), alpha_fms=alpha_fms,
+                pbs=slow["pbs"], v_m=slow["v_m"], ls=(alpha_fms + slow["v_m"]) % 360,
+                eot=slow["eot"], mtc=mtc, subsol=_subsolar_longitude(mtc, slow["eot"]),
+                dec=slow["dec"], rm=slow["rm"])
+
+def timeseries(start_j2000_ott, step, n, anchor=1024, chunk=2**18):
+    """Returns time_state on the uniform grid start_j2000_ott + step*arange(n),
+    with step in days.
+
+    On a uniform grid the mean anomaly and every perturbation argument advance
+    by a fixed angle per step, so their sines and cosines are found by complex
+    rotation from anchor points every `anchor` samples. Each anchor is evaluated
+    directly, so rounding errors do not accumulate along the series; results
+    agree with time_state to ~1e-12 degrees. The grid is processed `chunk`
+    samples at a time to bound the temporary memory."""
+    n = int(n)
+    out = dict((key, np.empty(n)) for key in
+               ["j2000_ott", "M", "alpha_fms", "pbs", "v_m", "ls", "eot",
+                "mtc", "subsol", "dec", "rm"])
+
+    #rotation by the angle advanced in 0..anchor-1 steps, per argument
+    rates = [_mean_anomaly[1]] + [_perturb_rate/tau for tau in _perturb_tau]
+    phases = [_mean_anomaly[0]] + list(_perturb_phi)
+    steps = step*np.arange(anchor)
+    w = [np.exp(1j*(rate*steps)*np.pi/180.) for rate in rates]
+
+    chunk = max(anchor, chunk - chunk % anchor)
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        t_anchor = start_j2000_ott + step*(start + anchor*np.arange(-(-size // anchor)))
+        z = [np.multiply.outer(np.exp(1j*(phase + rate*t_anchor)*np.pi/180.), wk
+                               ).ravel()[:size]
+             for (rate, phase, wk) in zip(rates, phases, w)]
+
+        zM = z[0]
+        powers = [zM]
+        for k in range(4):
+            powers.append(powers[-1]*zM)
+        sinM = [p.imag for p in powers]
+        cosM = [p.real for p in powers[:4]]
+        pbs = 0
+        for (A, zk) in zip(_perturb_A, z[1:]):
+            pbs += A*zk.real
+
+        j2000_ott = start_j2000_ott + step*(start + np.arange(size))
+        state = _time_state(j2000_ott, _impl.Mars_Mean_Anomaly(j2000_ott),
+                            sinM, cosM, pbs)
+        for key in out:
+            out[key][start:start+size] = state[key]
+
+    return out
+
+
 if __name__=="__main__":
 
     mils = [947116800000,1073137591000]
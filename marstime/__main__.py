@@ -0,0 +1,4 @@
+import sys
+from marstime.cli import main
+
+sys.exit(main())
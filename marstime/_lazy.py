@@ -0,0 +1,90 @@
+"""Deferred numpy import for the core module
+
+marstime uses the name np for numpy, or for the math module when numpy is
+not installed. With numpy installed, np is a LazyNumpy instead: the
+elementwise functions the scalar code paths use run through the math module
+for Python int and float arguments, and numpy is only imported when an
+array, or a numpy-only function, is first used.
+"""
+import importlib
+import math
+import sys
+
+
+def _find(name):
+    """importlib.util.find_spec without importing importlib.util, which is
+    slower to import than the rest of marstime"""
+    if name in sys.modules:
+        return True
+    for finder in sys.meta_path:
+        find_spec = getattr(finder, "find_spec", None)
+        if find_spec is not None:
+            if find_spec(name, None) is not None:
+                return True
+        elif getattr(finder, "find_module", None) is not None:
+            #legacy finders only have find_module
+            if finder.find_module(name) is not None:
+                return True
+    return False
+
+
+numpy_available = _find("numpy")
+
+_scalars = (int, float)
+
+
+def is_scalar(x):
+    """True for Python ints and floats (including numpy float64 scalars)"""
+    return isinstance(x, _scalars)
+
+
+def _floor(x):
+    return float(math.floor(x))
+
+
+def _unary(name, scalar):
+    def f(x):
+        if isinstance(x, _scalars):
+            try:
+                return scalar(x)
+            except (ValueError, OverflowError):
+                #outside the math domain, numpy returns nan or inf instead
+                pass
+        return getattr(_numpy(), name)(x)
+    f.__name__ = name
+    return f
+
+
+def _arctan2(y, x):
+    if isinstance(y, _scalars) and isinstance(x, _scalars):
+        return math.atan2(y, x)
+    return _numpy().arctan2(y, x)
+
+
+def _numpy():
+    return importlib.import_module("numpy")
+
+
+class LazyNumpy(object):
+    """Stands in for the numpy module, see the module docstring"""
+
+    pi = math.pi
+    inf = float("inf")
+    newaxis = None
+
+    def __init__(self):
+        for name, scalar in [("sin", math.sin), ("cos", math.cos), ("tan", math.tan),
+                             ("arcsin", math.asin), ("arccos", math.acos),
+                             ("exp", math.exp), ("sqrt", math.sqrt), ("floor", _floor),
+                             ("abs", abs), ("any", bool)]:
+            setattr(self, name, _unary(name, scalar))
+        self.arctan2 = _arctan2
+
+    def __getattr__(self, name):
+        #everything else comes from numpy, cached after the first lookup
+        value = getattr(_numpy(), name)
+        setattr(self, name, value)
+        return value
+
+    def __repr__(self):
+        return "<lazily imported numpy>"
@@ -0,0 +1,141 @@
+"""Memoization of the time-only state for repeated scalar queries
+
+Every site-specific function in marstime re-derives Ls, the equation of
+time, the declination and the subsolar longitude from the j2000 offset.
+A StateCache keeps marstime.time_state for recently used times, so queries
+for a cached time at any site only need the site arithmetic. It is opt-in:
+
+    cache = StateCache(maxsize=256)
+    ltst = cache.Local_True_Solar_Time(longitude, j2000_ott)
+"""
+import math
+import threading
+from collections import OrderedDict
+import marstime
+
+
+class StateCache(object):
+    """Least recently used cache of marstime.time_state for scalar j2000 offsets.
+
+    Times are quantized to `resolution` seconds and the state is evaluated at
+    the quantized time, so results do not depend on which caller filled the
+    entry. The Coordinated Mars Time is always recomputed for the exact time.
+    All methods are thread safe."""
+
+    def __init__(self, maxsize=1024, resolution=1e-3):
+        self.maxsize = maxsize
+        self.resolution = resolution
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, j2000_ott):
+        return int(round(j2000_ott*86400./self.resolution))
+
+    def state(self, j2000_ott=None):
+        """Returns the time_state dictionary for the quantized time"""
+        if j2000_ott is None:
+            j2000_ott = marstime.j2000_offset_tt()
+        key = self._key(j2000_ott)
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+                self.hits += 1
+                return state
+            self.misses += 1
+
+        #evaluated outside the lock, a concurrent miss may compute it twice
+        state = marstime.time_state(key*self.resolution/86400.)
+
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+                self.evictions += 1
+        return state
+
+    def stats(self):
+        """Returns a dictionary of hits, misses, evictions, size and maxsize"""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, size=len(self._states),
+                        maxsize=self.maxsize)
+
+    def clear(self):
+        """Empties the cache and resets the statistics"""
+        with self._lock:
+            self._states.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def resize(self, maxsize):
+        """Changes the maximum number of cached times, evicting the oldest"""
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+                self.evictions += 1
+
+    def Mars_Ls(self, j2000_ott=None):
+        """Cached marstime.Mars_Ls"""
+        return self.state(j2000_ott)["ls"]
+
+    def equation_of_time(self, j2000_ott=None):
+        """Cached marstime.equation_of_time"""
+        return self.state(j2000_ott)["eot"]
+
+    def solar_declination(self, j2000_ott=None):
+        """marstime.solar_declination of the cached Ls, takes a time, not Ls"""
+        return self.state(j2000_ott)["dec"]
+
+    def _site(self, j2000_ott):
+        """Returns the cached state and the exact Coordinated Mars Time"""
+        if j2000_ott is None:
+            j2000_ott = marstime.j2000_offset_tt()
+        return self.state(j2000_ott), marstime.Coordinated_Mars_Time(j2000_ott)
+
+    def subsolar_longitude(self, j2000_ott=None):
+        """Cached marstime.subsolar_longitude"""
+        state, mtc = self._site(j2000_ott)
+        return marstime._subsolar_longitude(mtc, state["eot"])
+
+    def Local_Mean_Solar_Time(self, longitude=0, j2000_ott=None):
+        """marstime.Local_Mean_Solar_Time, no state is needed"""
+        if j2000_ott is None:
+            j2000_ott = marstime.j2000_offset_tt()
+        return marstime.Local_Mean_Solar_Time(longitude, j2000_ott)
+
+    def Local_True_Solar_Time(self, longitude=0, j2000_ott=None):
+        """Cached marstime.Local_True_Solar_Time"""
+        state, mtc = self._site(j2000_ott)
+        return (mtc - longitude*(24/360.) + state["eot"]*(24/360.)) % 24
+
+    def _angles(self, longitude, j2000_ott):
+        """Returns the declination and hour angle in radians"""
+        state, mtc = self._site(j2000_ott)
+        subsol = marstime._subsolar_longitude(mtc, state["eot"])
+        return (state["dec"]*math.pi/180.,
+                (longitude - subsol)*math.pi/180.)
+
+    def hourangle(self, longitude=0, j2000_ott=None):
+        """Cached marstime.hourangle"""
+        return self._angles(longitude, j2000_ott)[1]
+
+    def solar_zenith(self, longitude=0, latitude=0, j2000_ott=None):
+        """Cached marstime.solar_zenith"""
+        if latitude > 90 or latitude < -90:
+            raise ValueError("Latitude out of Bounds: {0}".format(latitude))
+        dec, ha = self._angles(longitude, j2000_ott)
+        return marstime._solar_zenith(latitude, dec, ha)
+
+    def solar_elevation(self, longitude=0, latitude=0, j2000_ott=None):
+        """Cached marstime.solar_elevation"""
+        return 90 - self.solar_zenith(longitude, latitude, j2000_ott)
+
+    def solar_azimuth(self, longitude=0, latitude=0, j2000_ott=None):
+        """Cached marstime.solar_azimuth"""
+        dec, ha = self._angles(longitude, j2000_ott)
+        return marstime._solar_azimuth(latitude, dec, ha)
@@ -0,0 +1,155 @@
+"""Blockwise evaluation of the marstime functions on dask and xarray inputs
+
+The elementwise marstime functions (those that broadcast their array
+arguments, e.g. Mars_Ls, Local_True_Solar_Time, solar_zenith and
+track_geometry) also accept dask arrays and xarray DataArrays. Instead of
+computing them, the function is mapped over the blocks of the broadcast
+inputs, so the result is a dask array with the same chunks, or a DataArray
+with the coordinates of the inputs (lazy if the inputs are dask backed):
+
+    ds = xarray.open_mfdataset("archive/*.nc", chunks={"time": 1000})
+    ds["ls"] = marstime.Mars_Ls(j2000_offset(ds["time"]))
+    ds = chunked.add_variables(ds)   # ls, ltst and sza in one pass
+    ds.to_zarr("out.zarr")           # computed block by block by dask
+
+Functions with several outputs (track_geometry) return a dictionary of
+lazy arrays computed from a single pass over each block. Neither dask nor
+xarray is imported by marstime; their objects are only recognised once the
+caller has imported them.
+"""
+import inspect
+import sys
+import numpy as np
+import marstime
+
+#the array types found when sys.modules last changed size
+_known = (0, ())
+
+
+def _types():
+    """dask and xarray array types, among the modules imported so far"""
+    global _known
+    if len(sys.modules) != _known[0]:
+        types = []
+        if "dask.array" in sys.modules:
+            types.append(sys.modules["dask.array"].Array)
+        if "xarray" in sys.modules:
+            xarray = sys.modules["xarray"]
+            types.extend([xarray.DataArray, xarray.Variable])
+        _known = (len(sys.modules), tuple(types))
+    return _known[1]
+
+
+def is_chunked(args, kwargs):
+    """True if any argument is a dask array or an xarray object"""
+    types = _types()
+    if kwargs:
+        args = args + tuple(kwargs.values())
+    for a in args:
+        if isinstance(a, types):
+            return True
+    return False
+
+
+def _split(func, outputs, kwargs):
+    """func on numpy blocks returning a tuple of outputs. outputs is the
+    number of outputs or the keys of a dictionary result"""
+    if outputs == 1:
+        return lambda *a: (func(*a, **kwargs),)
+    if isinstance(outputs, int):
+        return lambda *a: tuple(func(*a, **kwargs))
+    def keyed(*a):
+        #one call for all the keys
+        result = func(*a, **kwargs)
+        return tuple(result[key] for key in outputs)
+    return keyed
+
+
+def _join(results, outputs):
+    if outputs == 1:
+        return results[0]
+    if isinstance(outputs, int):
+        return tuple(results)
+    return dict(zip(outputs, results))
+
+
+def _apply_dask(func, args, kwargs, outputs, dtype):
+    da = sys.modules["dask.array"]
+    positions = [i for (i, a) in enumerate(args) if marstime._is_array(a)]
+    arrays = da.broadcast_arrays(*[da.asarray(args[i]) for i in positions])
+    n = outputs if isinstance(outputs, int) else len(outputs)
+    blocks = _split(func, outputs, kwargs)
+
+    def block(*values):
+        a = list(args)
+        for i, v in zip(positions, values):
+            a[i] = v
+        result = blocks(*a)
+        return np.stack(np.broadcast_arrays(*result)) if n > 1 else result[0]
+
+    if n == 1:
+        return da.map_blocks(block, *arrays, dtype=dtype)
+    stacked = da.map_blocks(block, *arrays, dtype=dtype, new_axis=0,
+                            chunks=((n,),) + arrays[0].chunks)
+    return _join([stacked[i] for i in range(n)], outputs)
+
+
+def _apply_xarray(func, args, kwargs, outputs, dtype):
+    xarray = sys.modules["xarray"]
+    n = outputs if isinstance(outputs, int) else len(outputs)
+    blocks = _split(func, outputs, kwargs)
+    result = xarray.apply_ufunc(lambda *a: blocks(*a) if n > 1 else blocks(*a)[0], *args,
+                                dask="parallelized", output_dtypes=[dtype]*n,
+                                output_core_dims=[()]*n)
+    return _join(result if n > 1 else [result], outputs)
+
+
+def apply(func, args, kwargs, outputs=1, where=None, unique=False):
+    """Maps func blockwise over the dask and xarray arguments, see the module
+    docstring. Other arguments are passed to every call unchanged. where is
+    mapped alongside them, and it and unique are applied within each block
+    (see marstime)."""
+    #dask and xarray arguments given by keyword are mapped too
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    args, kwargs = bound.args, bound.kwargs
+    #the result dtype, float unless the reduced precision mode is asked for
+    dtype = np.dtype(bound.arguments.get("dtype") or float)
+    if where is not None or unique:
+        func = marstime._restricted(func, outputs, unique)
+        args = (where,) + args
+    xarray = sys.modules.get("xarray")
+    if xarray is not None and any(isinstance(a, (xarray.DataArray, xarray.Variable))
+                                  for a in args):
+        return _apply_xarray(func, args, kwargs, outputs, dtype)
+    return _apply_dask(func, args, kwargs, outputs, dtype)
+
+
+def j2000_offset(time):
+    """j2000 offsets (TT) of datetime64 times, e.g. the time coordinate of a
+    dataset, staying lazy for dask backed inputs"""
+    mills = (time - np.datetime64("1970-01-01T00:00:00"))/np.timedelta64(1, "ms")
+    return marstime.j2000_offset_tt(marstime.julian_tt(marstime.julian(mills)))
+
+
+def add_variables(dataset, time="time", longitude="lon", latitude="lat",
+                  east=True, accuracy="full"):
+    """Returns the dataset with ls, lmst, ltst, sza (solar zenith) and
+    azimuth variables from a single blockwise pass of track_geometry, chunked
+    like the data variables of the dataset.
+    time is a datetime64 or j2000 offset variable; longitude and latitude are
+    degrees, east longitude unless east is False."""
+    t = dataset[time]
+    if t.dtype.kind == "M":
+        t = j2000_offset(t)
+    lon = dataset[longitude]
+    if east:
+        lon = marstime.east_to_west(lon)
+    xarray = sys.modules["xarray"]
+    #coordinates are never chunked, so follow the chunks of the data variables
+    order = [d for d in dataset.dims if d in set(t.dims) | set(lon.dims) | set(dataset[latitude].dims)]
+    chunks = dict((d, c) for (d, c) in dataset.chunks.items() if d in order)
+    args = [v.transpose(*order) for v in xarray.broadcast(t, lon, dataset[latitude])]
+    if chunks:
+        args = [v.chunk(chunks) for v in args]
+    geometry = marstime.track_geometry(*args, accuracy=accuracy)
+    return dataset.assign(**geometry)
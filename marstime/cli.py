@@ -0,0 +1,222 @@
+"""marstime command line tool
+
+Adds Mars time columns to CSV or newline delimited JSON records, reading
+from files or stdin and streaming to stdout in batches, e.g.
+
+    marstime --columns msd,ls,ltst --lon-column lon events.csv > enriched.csv
+    zcat log.ndjson.gz | marstime --time-column t --time-format mills --columns ls
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import sys
+import numpy as np
+import marstime
+
+
+#columns that can be added, and whether they need longitude/latitude
+column_names = ["msd", "my", "ls", "lmst", "ltst", "sza"]
+needs_longitude = ["lmst", "ltst", "sza"]
+needs_latitude = ["sza"]
+
+
+def parse_times(values, time_format="auto"):
+    """Returns j2000 offsets from a list of time strings or numbers. time_format
+    is iso (UTC), mills or unix (UTC milliseconds or seconds since Jan 1 1970),
+    j2000 (TT offsets, used as is) or auto (iso unless the values are numbers,
+    which are taken as mills)"""
+    if time_format == "auto":
+        try:
+            float(values[0])
+            time_format = "mills"
+        except (ValueError, TypeError):
+            time_format = "iso"
+
+    if time_format == "iso":
+        values = [v[:-1] if v.endswith("Z") else v for v in values]
+        m = np.array(values, dtype="datetime64[ms]").astype("int64").astype(float)
+    elif time_format == "j2000":
+        return np.array(values, dtype=float)
+    elif time_format == "unix":
+        m = np.array(values, dtype=float)*1000.
+    elif time_format == "mills":
+        m = np.array(values, dtype=float)
+    else:
+        raise ValueError("unknown time format {0}".format(time_format))
+    return marstime.j2000_offset_tt(marstime.julian_tt(marstime.julian(m)))
+
+
+def compute(columns, j2000_ott, longitude=None, latitude=None):
+    """Returns a dictionary of the requested columns, sharing the time-only terms"""
+    out = {}
+    if "msd" in columns:
+        out["msd"] = marstime.Mars_Solar_Date(j2000_ott)
+    if "my" in columns:
+        out["my"] = marstime.Mars_Year(j2000_ott)
+    if not set(columns) & set(["ls", "lmst", "ltst", "sza"]):
+        return out
+
+    state = marstime.time_state(j2000_ott)
+    if "ls" in columns:
+        out["ls"] = state["ls"]
+    if "lmst" in columns:
+        out["lmst"] = (state["mtc"] - longitude*(24/360.)) % 24
+    if "ltst" in columns:
+        out["ltst"] = (state["mtc"] - longitude*(24/360.) + state["eot"]*(24/360.)) % 24
+    if "sza" in columns:
+        if np.any(np.abs(latitude) > 90):
+            raise ValueError("Latitude out of Bounds: {0}".format(latitude))
+        ha = (longitude - state["subsol"])*np.pi/180.
+        out["sza"] = marstime._solar_zenith(latitude, state["dec"]*np.pi/180., ha)
+    return out
+
+
+def batches(iterable, size):
+    """Yields lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Enricher(object):
+    """Computes the requested columns for batches of records"""
+
+    def __init__(self, args):
+        self.args = args
+        self.columns = [c.strip() for c in args.columns.split(",") if c.strip()]
+        for c in self.columns:
+            if c not in column_names:
+                raise ValueError("unknown column {0}, choose from {1}".format(
+                    c, ",".join(column_names)))
+        self.header_written = False
+
+    def values(self, times, longitudes, latitudes):
+        """Returns the new columns as lists of numbers, rounded to the precision
+        in numpy so the writers only need the fast float repr"""
+        j2000_ott = parse_times(times, self.args.time_format)
+        lon = lat = None
+        if set(self.columns) & set(needs_longitude):
+            if longitudes is None:
+                raise ValueError("longitude column {0} is needed for {1}".format(
+                    self.args.lon_column, ",".join(self.columns)))
+            lon = np.array(longitudes, dtype=float)
+            if self.args.east:
+                lon = marstime.east_to_west(lon)
+        if set(self.columns) & set(needs_latitude):
+            if latitudes is None:
+                raise ValueError("latitude column {0} is needed for sza".format(
+                    self.args.lat_column))
+            lat = np.array(latitudes, dtype=float)
+        out = compute(self.columns, j2000_ott, lon, lat)
+        return [out[c].astype(int).tolist() if c == "my" else
+                np.round(out[c], self.args.precision).tolist() for c in self.columns]
+
+    def csv(self, lines, output):
+        reader = csv.reader(lines, delimiter=self.args.delimiter)
+        writer = csv.writer(output, delimiter=self.args.delimiter, lineterminator="\n")
+        header = next(reader, None)
+        if header is None:
+            return
+        index = dict((name, i) for (i, name) in enumerate(header))
+        if self.args.time_column not in index:
+            raise ValueError("time column {0} not in header".format(self.args.time_column))
+        it = index[self.args.time_column]
+        ix = index.get(self.args.lon_column)
+        iy = index.get(self.args.lat_column)
+        if not self.header_written:
+            writer.writerow(header + self.columns)
+            self.header_written = True
+        width = 1 + max(i for i in (it, ix, iy) if i is not None)
+
+        def records():
+            #blank lines are skipped, short rows are errors
+            for r in reader:
+                if not r:
+                    continue
+                if len(r) < width:
+                    raise ValueError("line {0} has {1} fields, expected {2}".format(
+                        reader.line_num, len(r), len(header)))
+                yield r
+
+        for rows in batches(records(), self.args.batch_size):
+            new = self.values([r[it] for r in rows],
+                              None if ix is None else [r[ix] for r in rows],
+                              None if iy is None else [r[iy] for r in rows])
+            writer.writerows([r + list(v) for (r, v) in zip(rows, zip(*new))])
+            output.flush()
+
+    def ndjson(self, lines, output):
+        records = (json.loads(line) for line in lines if line.strip())
+        a = self.args
+        for rows in batches(records, a.batch_size):
+            new = self.values([r[a.time_column] for r in rows],
+                              [r[a.lon_column] for r in rows] if a.lon_column in rows[0] else None,
+                              [r[a.lat_column] for r in rows] if a.lat_column in rows[0] else None)
+            for r, v in zip(rows, zip(*new)):
+                r.update(zip(self.columns, v))
+                output.write(json.dumps(r))
+                output.write("\n")
+            output.flush()
+
+    def run(self, stream, output):
+        """Enriches one input stream, detecting the format if needed"""
+        fmt = self.args.format
+        if fmt == "auto":
+            first = stream.readline()
+            fmt = "ndjson" if first.lstrip().startswith("{") else "csv"
+            stream = itertools.chain([first], stream)
+        if fmt == "csv":
+            self.csv(stream, output)
+        else:
+            self.ndjson(stream, output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Adds Mars time columns to CSV or NDJSON records")
+    parser.add_argument("files", nargs="*", help="input files, stdin if none are given")
+    parser.add_argument("--format", "-f", default="auto", choices=["auto", "csv", "ndjson"],
+            help="input format, detected from the first line by default")
+    parser.add_argument("--columns", "-c", default="msd,my,ls",
+            help="comma separated columns to add: " + ",".join(column_names))
+    parser.add_argument("--time-column", "-t", default="time",
+            help="name of the timestamp column")
+    parser.add_argument("--time-format", default="auto",
+            choices=["auto", "iso", "mills", "unix", "j2000"],
+            help="iso or mills (UTC), unix (UTC seconds) or j2000 (TT offset days)")
+    parser.add_argument("--lon-column", "-x", default="lon",
+            help="name of the longitude column, needed for lmst, ltst and sza")
+    parser.add_argument("--lat-column", "-y", default="lat",
+            help="name of the latitude column, needed for sza")
+    parser.add_argument("--east", action="store_true",
+            help="longitudes are east positive (marstime uses west longitude)")
+    parser.add_argument("--delimiter", "-d", default=",", help="CSV delimiter")
+    parser.add_argument("--precision", default=6, type=int,
+            help="decimal places in the new columns")
+    parser.add_argument("--batch-size", "-b", default=65536, type=int,
+            help="records processed per vectorized batch")
+    args = parser.parse_args(argv)
+
+    try:
+        enricher = Enricher(args)
+        output = sys.stdout
+        if not args.files:
+            enricher.run(io.TextIOWrapper(sys.stdin.buffer, newline=""), output)
+        for filename in args.files:
+            with open(filename, newline="") as stream:
+                enricher.run(stream, output)
+    except BrokenPipeError:
+        sys.stderr.close()
+    except (ValueError, KeyError) as e:
+        sys.stderr.write("marstime: error: {0}\n".format(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
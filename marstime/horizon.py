@@ -0,0 +1,147 @@
+"""Sunrise, sunset and illuminated time above local horizon profiles
+
+A horizon profile is the elevation (degrees) of the visible horizon as a
+function of azimuth (degrees clockwise from north, as solar_azimuth), e.g.
+a crater rim around a landing site. Sites without a profile use the flat
+horizon of examples/calculate_sunrise.py.
+
+    profiles = [(azimuth, elevation), None]
+    sols = np.arange(4000, 4669)
+    result = horizon.illumination([137.4, 184.7], [-4.5, -14.6], sols, profiles)
+    result["sunrise"].shape  # (2, 669)
+"""
+import numpy as np
+import marstime
+
+#length of the mean solar day in Earth days
+_sol = 1.027491252
+
+
+def horizon_table(horizons, sites, step=0.5):
+    """Resamples per-site (azimuth, elevation) profiles onto a regular azimuth
+    grid, returning an array of shape (sites, 360/step + 1) that wraps at 360.
+    horizons is a sequence with one profile or None (flat) per site, or
+    None for flat horizons everywhere."""
+    bins = int(round(360./step))
+    grid = np.arange(bins + 1)*(360./bins)
+    table = np.zeros((sites, bins + 1))
+    if horizons is None:
+        return table
+    if len(horizons) != sites:
+        raise ValueError("{0} horizon profiles for {1} sites".format(len(horizons), sites))
+    for i, profile in enumerate(horizons):
+        if profile is None:
+            continue
+        azimuth, elevation = [np.asarray(x, dtype=float) for x in profile]
+        table[i] = np.interp(grid, azimuth % 360., elevation, period=360.)
+    return table
+
+
+def _lookup(table, site, azimuth):
+    """Linear interpolation of the horizon table rows site at azimuth"""
+    x = (azimuth % 360.)*((table.shape[1] - 1)/360.)
+    i = np.minimum(x.astype(int), table.shape[1] - 2)
+    w = x - i
+    return table[site, i]*(1 - w) + table[site, i+1]*w
+
+
+def _above(t, longitude, latitude, site, table, limb, accuracy):
+    """Solar elevation above the horizon profile (degrees), with the angular
+    radius of the sun added for the upper limb"""
+    geometry = marstime.track_geometry(t, longitude, latitude, accuracy=accuracy)
+    f = 90. - geometry["sza"]
+    if table.any():
+        f = f - _lookup(table, site, geometry["azimuth"])
+    if limb == "upper":
+        radius = 6.96342e8/(marstime.heliocentric_distance(t)*1.496e11)
+        f = f + radius*180./np.pi
+    return f
+
+
+def illumination(longitude, latitude, sols, horizons=None, samples=96, iterations=8,
+                 limb="center", step=0.5, accuracy="full", chunk=2**20):
+    """Sunrise, sunset and illuminated time above the horizon profiles for each
+    site (planetographic west longitude and latitude, 1D) on each local sol
+    (integer local Mars Solar Date, as in times_of_ltst).
+
+    Each sol is sampled at `samples` evenly spaced local mean times and each
+    crossing of the horizon is refined by `iterations` steps of the Illinois
+    (modified false position) method, which is accurate to a few seconds for
+    the defaults. Illumination gaps shorter than 1/samples of a sol may be
+    missed. limb is "center" or "upper" (the top edge of the sun, as in
+    examples/calculate_sunrise.py). Sites are processed in blocks of about
+    `chunk` samples.
+
+    Returns a dictionary of (sites, sols) arrays: sunrise (first rising) and
+    sunset (last setting) as j2000 offsets, nan if there is none in the sol,
+    risings (number of rising crossings) and illuminated (hours above the
+    horizon, in Mars hours of 1/24 sol)."""
+    if limb not in ("center", "upper"):
+        raise ValueError("limb must be center or upper, not {0}".format(limb))
+    lon = np.atleast_1d(np.asarray(longitude, dtype=float))
+    lat = np.atleast_1d(np.asarray(latitude, dtype=float))
+    lon, lat = np.broadcast_arrays(lon, lat)
+    sols = np.atleast_1d(np.asarray(sols, dtype=float))
+    table = horizon_table(horizons, lon.size, step)
+
+    out = dict(sunrise=np.full((lon.size, sols.size), np.nan),
+               sunset=np.full((lon.size, sols.size), np.nan),
+               risings=np.zeros((lon.size, sols.size), dtype=int),
+               illuminated=np.zeros((lon.size, sols.size)))
+    hours = np.arange(samples + 1)*(24./samples)
+    block = max(1, chunk // (sols.size*(samples + 1)))
+    for first in range(0, lon.size, block):
+        sites = np.arange(first, min(first + block, lon.size))
+        _illumination_block(lon, lat, sols, sites, hours, table, limb,
+                            iterations, accuracy, out)
+    return out
+
+
+def _illumination_block(lon, lat, sols, sites, hours, table, limb, iterations,
+                        accuracy, out):
+    """Fills out for the given sites"""
+    shape = (sites.size, sols.size, hours.size)
+    site = np.broadcast_to(sites[:, np.newaxis, np.newaxis], shape)
+    t = marstime.j2000_ott_from_Local_Mean_Solar_Time(
+        hours, sols[:, np.newaxis], lon[sites][:, np.newaxis, np.newaxis])
+    f = _above(t, lon[site], lat[site], site, table, limb, accuracy)
+
+    up = f > 0
+    dt = t[..., 1:] - t[..., :-1]
+    whole = (up[..., :-1] & up[..., 1:]).astype(float)
+    illuminated = (whole*dt).sum(axis=-1)
+
+    #refine every bracketed crossing at once
+    i, j, k = np.nonzero(up[..., :-1] != up[..., 1:])
+    ta, tb = t[i, j, k], t[i, j, k+1]
+    fa, fb = f[i, j, k], f[i, j, k+1]
+    s = sites[i]
+    root = ta
+    side = np.zeros(ta.size, dtype=int)
+    for n in range(iterations):
+        root = tb - fb*(tb - ta)/(fb - fa)
+        froot = _above(root, lon[s], lat[s], s, table, limb, accuracy)
+        left = np.sign(froot) == np.sign(fa)
+        #Illinois: halve the retained end point if it was retained last time too
+        fb = np.where(left & (side == 1), fb/2., fb)
+        fa = np.where(~left & (side == -1), fa/2., fa)
+        ta = np.where(left, root, ta)
+        fa = np.where(left, froot, fa)
+        tb = np.where(left, tb, root)
+        fb = np.where(left, fb, froot)
+        side = np.where(left, 1, -1)
+
+    rising = ~up[i, j, k]
+    index = (i, j)
+    np.add.at(illuminated, index, np.where(rising, t[i, j, k+1] - root, root - t[i, j, k]))
+    sunrise = np.full(illuminated.shape, np.nan)
+    sunset = np.full(illuminated.shape, np.nan)
+    np.fmin.at(sunrise, (i[rising], j[rising]), root[rising])
+    np.fmax.at(sunset, (i[~rising], j[~rising]), root[~rising])
+    risings = np.zeros(illuminated.shape, dtype=int)
+    np.add.at(risings, (i[rising], j[rising]), 1)
+
+    out["sunrise"][sites] = sunrise
+    out["sunset"][sites] = sunset
+    out["risings"][sites] = risings
+    out["illuminated"][sites] = illuminated*(24./_sol)
@@ -0,0 +1,186 @@
+"""Top of atmosphere insolation on Mars
+
+Daily mean insolation uses the closed form for the sunlit hour angle
+(e.g. Levine et al. 1977), with the declination and orbital radius from
+the Mars24 functions held fixed through the sol.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import marstime
+
+
+def instantaneous_insolation(longitude=0, latitude=0, j2000_ott=None,
+                             solar_constant=1361., dtype=None):
+    """Top of atmosphere insolation (W/m^2) on a horizontal surface at a
+    planetographic longitude and planetocentric latitude, S0 cos(Z)/r^2, zero
+    when the sun is below the horizon. The arguments are broadcast against
+    each other. dtype=numpy.float32 computes the site terms and result in
+    single precision (see marstime.cos_solar_zenith)."""
+    if j2000_ott is None:
+        j2000_ott = marstime.j2000_offset_tt()
+
+    cosZ = marstime.cos_solar_zenith(longitude, latitude, j2000_ott, dtype)
+    scale = solar_constant/marstime.heliocentric_distance(j2000_ott)**2
+    if dtype is not None:
+        scale = np.asarray(scale, dtype=dtype)
+    return scale*np.maximum(cosZ, 0)
+
+
+def daily_mean_insolation(latitude=0, j2000_ott=None, solar_constant=1361.):
+    """Diurnally averaged top of atmosphere insolation (W/m^2) at a planetocentric
+    latitude. latitude and j2000_ott are broadcast against each other.
+    Polar day and night are handled through the hour angle of sunset."""
+    if j2000_ott is None:
+        j2000_ott = marstime.j2000_offset_tt()
+
+    ls = marstime.Mars_Ls(j2000_ott)
+    dec = marstime.solar_declination(ls)*np.pi/180.
+    rm = marstime.heliocentric_distance(j2000_ott)
+    lat = np.asarray(latitude, dtype=float)*np.pi/180.
+
+    sinsin = np.sin(lat)*np.sin(dec)
+    coscos = np.cos(lat)*np.cos(dec)
+    #hour angle of sunset, 0 in polar night and pi in polar day
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_h0 = np.clip(-sinsin/coscos, -1., 1.)
+    h0 = np.arccos(cos_h0)
+
+    Q = solar_constant/(np.pi*rm**2) * (h0*sinsin + coscos*np.sin(h0))
+    return Q
+
+
+def annual_mean_insolation(latitude=0, j2000_ott=None, samples=669,
+                           year_length=686.9725, solar_constant=1361.):
+    """Annual mean top of atmosphere insolation (W/m^2) at a planetocentric
+    latitude, averaging daily_mean_insolation over samples evenly spaced
+    times through one Mars year starting at j2000_ott.
+    The result has the shape of latitude."""
+    if j2000_ott is None:
+        j2000_ott = marstime.j2000_offset_tt()
+
+    lat = np.asarray(latitude, dtype=float)
+    t = j2000_ott + year_length*np.arange(samples)/float(samples)
+    Q = daily_mean_insolation(lat[..., np.newaxis], t, solar_constant)
+    return Q.mean(axis=-1)
+
+
+#length of the mean solar day in seconds
+_sol_length = 1.027491252*86400.
+
+#cumulative daily totals of the most recently used sites, see integrated_insolation
+_daily_totals = OrderedDict()
+_daily_totals_lock = threading.Lock()
+_max_sites = 256
+
+
+def clear_cache():
+    """Forget the cached daily insolation totals"""
+    with _daily_totals_lock:
+        _daily_totals.clear()
+
+
+def _local_true_sol(longitude, j2000_ott):
+    """Continuous local true solar date (sols) at a planetographic longitude,
+    24 times its fractional part is the Local True Solar Time"""
+    return marstime.Mars_Solar_Date(j2000_ott) - longitude/360. \
+        + marstime.equation_of_time(j2000_ott)/360.
+
+
+def _sol_geometry(longitude, latitude, sols):
+    """Returns sin(lat)sin(dec), cos(lat)cos(dec), the hour angle of sunset and
+    1/r^2, with declination and orbital radius taken at local noon of each sol"""
+    noon = marstime.j2000_ott_from_Local_Mean_Solar_Time(12., sols, longitude)
+    noon = noon - marstime.equation_of_time(noon)/360.*1.027491252
+
+    dec = marstime.solar_declination(marstime.Mars_Ls(noon))*np.pi/180.
+    lat = latitude*np.pi/180.
+    sinsin = np.sin(lat)*np.sin(dec)
+    coscos = np.cos(lat)*np.cos(dec)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h0 = np.arccos(np.clip(-sinsin/coscos, -1., 1.))
+    return sinsin, coscos, h0, 1./marstime.heliocentric_distance(noon)**2
+
+
+def _partial_sol(geometry, ha, hb):
+    """Energy (J/m^2 per unit solar constant) received between hour angles ha and
+    hb (radians from local noon, -pi to pi) of one sol"""
+    sinsin, coscos, h0, inv_r2 = geometry
+    ca = np.clip(ha, -h0, h0)
+    cb = np.clip(hb, -h0, h0)
+    return inv_r2*(_sol_length/(2*np.pi)) * \
+        (sinsin*(cb-ca) + coscos*(np.sin(cb)-np.sin(ca)))
+
+
+def _whole_sols(longitude, latitude, first, stop, cache=True):
+    """Energy (J/m^2 per unit solar constant) received in the whole sols first
+    to stop-1 at a single site, summed from the cached daily totals"""
+    key = (float(longitude), float(latitude))
+    with _daily_totals_lock:
+        k0, cumulative = _daily_totals.get(key, (0, np.zeros(1)))
+        if key in _daily_totals:
+            _daily_totals.move_to_end(key)
+    lo = int(first.min())
+    hi = int(stop.max())
+    if cumulative.size == 1 or lo < k0 or hi > k0 + cumulative.size - 1:
+        #(re)build the table to cover both the cached and the requested sols
+        if cumulative.size > 1:
+            lo = min(lo, k0)
+            hi = max(hi, k0 + cumulative.size - 1)
+        sols = np.arange(lo, hi)
+        daily = _partial_sol(_sol_geometry(longitude, latitude, sols), -np.pi, np.pi)
+        k0 = lo
+        cumulative = np.concatenate([[0.], np.cumsum(daily)])
+        if cache:
+            #built outside the lock, a concurrent call may build it twice
+            with _daily_totals_lock:
+                _daily_totals[key] = (k0, cumulative)
+                _daily_totals.move_to_end(key)
+                while len(_daily_totals) > _max_sites:
+                    _daily_totals.popitem(last=False)
+    return cumulative[(stop-k0).astype(int)] - cumulative[(first-k0).astype(int)]
+
+
+def integrated_insolation(longitude, latitude, start, end, solar_constant=1361.,
+                          cache=True):
+    """Top of atmosphere solar energy (J/m^2) received between the j2000 offsets
+    start and end at a planetographic longitude and planetocentric latitude.
+    All arguments are broadcast against each other.
+
+    Each sol is integrated analytically between sunrise and sunset, with the
+    declination and orbital radius fixed at local noon. Whole sols inside a
+    window are summed from per-site cumulative daily totals, which are kept
+    for the 256 most recently used sites between calls when cache is True
+    (see clear_cache). The integral is signed, so a window with end before
+    start gives minus the energy received between end and start."""
+    lon, lat, start, end = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (longitude, latitude, start, end)])
+    shape = lon.shape
+    lon, lat, start, end = [x.ravel() for x in (lon, lat, start, end)]
+    reversed_window = end < start
+    start, end = np.minimum(start, end), np.maximum(start, end)
+
+    us = _local_true_sol(lon, start)
+    ue = _local_true_sol(lon, end)
+    ks = np.floor(us)
+    ke = np.floor(ue)
+    hs = 2*np.pi*(us - ks - 0.5)
+    he = 2*np.pi*(ue - ke - 0.5)
+
+    first = _sol_geometry(lon, lat, ks)
+    last = _sol_geometry(lon, lat, ke)
+    energy = np.where(ks == ke,
+                      _partial_sol(first, hs, he),
+                      _partial_sol(first, hs, np.pi) + _partial_sol(last, -np.pi, he))
+
+    spans = np.nonzero(ke - ks > 1)[0]
+    if spans.size:
+        sites, inverse = np.unique(np.stack([lon[spans], lat[spans]], axis=-1),
+                                   axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        for i, (x, y) in enumerate(sites):
+            sel = spans[inverse == i]
+            energy[sel] += _whole_sols(x, y, ks[sel]+1, ke[sel], cache)
+
+    energy[reversed_window] *= -1
+    return (solar_constant*energy).reshape(shape)[()]
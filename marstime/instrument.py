@@ -0,0 +1,198 @@
+"""Opt-in call counting and timing for the marstime functions
+
+Nothing is recorded until enable() is called, which replaces the functions
+in the marstime namespace with recording wrappers; disable() puts the
+originals back, so there is no overhead while it is off. Nested calls are
+recorded too, since marstime looks its functions up by name at call time
+(the elementwise functions in marstime._impl, which are replaced as well).
+
+    from marstime import instrument
+    instrument.enable()
+    run_job()
+    print(instrument.report())
+    instrument.write_prometheus("/var/lib/node_exporter/marstime.prom")
+
+For each function the snapshot holds the number of calls, the number of
+elements processed (the size of the largest array argument, 1 for scalars),
+the cumulative wall time in seconds including nested calls, and the number
+of redundant calls, i.e. repeats of a call with the same arguments within a
+single outermost marstime call (e.g. Mars_Ls recomputed by solar_zenith).
+"""
+import functools
+import inspect
+import os
+import tempfile
+import threading
+import time
+import marstime
+
+_lock = threading.Lock()
+_local = threading.local()
+_originals = {}
+#the undecorated functions of marstime._impl that are replaced
+_impl_originals = {}
+_counters = {}
+
+#fields of each snapshot entry, with their Prometheus help text
+fields = [("calls", "Number of calls"),
+          ("elements", "Number of elements processed"),
+          ("seconds", "Cumulative wall time in seconds, including nested calls"),
+          ("redundant", "Calls repeating an earlier call with the same arguments "
+                        "within one outermost call")]
+
+
+def _elements(args):
+    n = 1
+    for a in args:
+        n = max(n, getattr(a, "size", 1))
+    return n
+
+
+def _key(name, args, kwargs):
+    """Identifies a call by its scalar argument values and array identities"""
+    values = list(args) + sorted(kwargs.items())
+    return (name,) + tuple(("array", id(a)) if getattr(a, "ndim", 0) else a
+                           for a in values)
+
+
+def _wrap(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, "depth", 0)
+        if depth == 0:
+            #arguments are kept alive until the outermost call returns so that
+            #array ids are not reused within it
+            _local.seen = {}
+        key = _key(name, args, kwargs)
+        try:
+            redundant = int(key in _local.seen)
+            _local.seen[key] = (args, kwargs)
+        except TypeError:
+            #unhashable arguments are not checked
+            redundant = 0
+
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.depth = depth
+            if depth == 0:
+                _local.seen = {}
+            with _lock:
+                c = _counters.setdefault(name, dict(calls=0, elements=0, seconds=0., redundant=0))
+                c["calls"] += 1
+                c["elements"] += _elements(args)
+                c["seconds"] += elapsed
+                c["redundant"] += redundant
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def functions():
+    """Returns the names of the marstime functions that can be instrumented"""
+    return sorted(name for (name, f) in vars(marstime).items()
+                  if inspect.isfunction(f) and f.__module__ == "marstime"
+                  and not name.startswith("_"))
+
+
+def enable(names=None):
+    """Starts recording the named functions, all of them by default"""
+    with _lock:
+        for name in names or functions():
+            if name in _originals:
+                continue
+            func = getattr(marstime, name)
+            _originals[name] = func
+            setattr(marstime, name, _wrap(name, func))
+            impl = getattr(marstime._impl, name, None)
+            if impl is not None:
+                _impl_originals[name] = impl
+                setattr(marstime._impl, name, _wrap(name, impl))
+
+
+def disable():
+    """Stops recording and restores the original functions, keeping the counters"""
+    with _lock:
+        for name, func in _originals.items():
+            setattr(marstime, name, func)
+        for name, func in _impl_originals.items():
+            setattr(marstime._impl, name, func)
+        _originals.clear()
+        _impl_originals.clear()
+
+
+def enabled():
+    """Returns True if any function is being recorded"""
+    return bool(_originals)
+
+
+class recording(object):
+    """Context manager that enables recording for the duration of a block"""
+
+    def __init__(self, names=None):
+        self.names = names
+
+    def __enter__(self):
+        enable(self.names)
+        return self
+
+    def __exit__(self, *exc):
+        disable()
+
+
+def snapshot():
+    """Returns a copy of the counters, keyed by function name"""
+    with _lock:
+        return dict((name, dict(c)) for (name, c) in _counters.items())
+
+
+def reset():
+    """Zeroes the counters"""
+    with _lock:
+        _counters.clear()
+
+
+def report(sort="seconds", file=None):
+    """Returns a table of the counters sorted by the given field, largest first,
+    also writing it to file if one is given"""
+    counters = snapshot()
+    lines = ["{0:40s} {1:>10s} {2:>14s} {3:>12s} {4:>14s} {5:>10s}".format(
+        "function", "calls", "elements", "seconds", "elements/s", "redundant")]
+    for name in sorted(counters, key=lambda n: -counters[n][sort]):
+        c = counters[name]
+        lines.append("{0:40s} {1:>10d} {2:>14d} {3:>12.6f} {4:>14.4g} {5:>10d}".format(
+            name, c["calls"], c["elements"], c["seconds"],
+            c["elements"]/c["seconds"] if c["seconds"] > 0 else 0., c["redundant"]))
+    text = "\n".join(lines) + "\n"
+    if file is not None:
+        file.write(text)
+    return text
+
+
+def prometheus(prefix="marstime"):
+    """Returns the counters in the Prometheus text exposition format"""
+    counters = snapshot()
+    lines = []
+    for field, help_text in fields:
+        metric = "{0}_{1}_total".format(prefix, field)
+        lines.append("# HELP {0} {1}".format(metric, help_text))
+        lines.append("# TYPE {0} counter".format(metric))
+        for name in sorted(counters):
+            lines.append('{0}{{function="{1}"}} {2}'.format(metric, name, counters[name][field]))
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, prefix="marstime"):
+    """Writes the counters to a textfile for the node exporter textfile collector,
+    replacing the file atomically so a scrape never sees a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".marstime", suffix=".prom.tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(prometheus(prefix))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
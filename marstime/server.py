@@ -0,0 +1,241 @@
+"""Asyncio server for Mars time queries with micro-batching
+
+Clients send one JSON object per line and get one JSON object per line back,
+matched by "id" (responses to pipelined requests may arrive out of order):
+
+    {"id": 1, "function": "Local_True_Solar_Time", "longitude": 184.7, "mills": 1073137591000}
+    {"id": 1, "result": 0.0003}
+
+Times are given either as "j2000_ott" or as UTC "mills" (milliseconds since
+Jan 1 1970). Requests for the same function that arrive within max_latency
+seconds of each other are evaluated together in one vectorized call, up to
+max_batch requests at a time. Run a server on localhost with
+
+    python -m marstime.server --port 8765
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import marstime
+
+
+#the functions that can be called and their site arguments with defaults
+functions = dict(
+    Mars_Mean_Anomaly={}, FMS_Angle={}, alpha_perturbs={},
+    equation_of_center={}, Mars_Ls={}, equation_of_time={},
+    Mars_Solar_Date={}, Coordinated_Mars_Time={}, subsolar_longitude={},
+    heliocentric_distance={}, heliocentric_longitude={},
+    heliocentric_latitude={}, mills_from_j2000_ott={},
+    Local_Mean_Solar_Time=dict(longitude=0.), Local_True_Solar_Time=dict(longitude=0.),
+    hourangle=dict(longitude=0.),
+    solar_zenith=dict(longitude=0., latitude=0.),
+    cos_solar_zenith=dict(longitude=0., latitude=0.),
+    solar_elevation=dict(longitude=0., latitude=0.),
+    solar_azimuth=dict(longitude=0., latitude=0.),
+)
+
+
+def j2000_ott_from_request(request):
+    """Returns the j2000 offset of a request given as j2000_ott or UTC mills"""
+    if "j2000_ott" in request:
+        return float(request["j2000_ott"])
+    if "mills" in request:
+        return marstime.j2000_offset_tt(
+            marstime.julian_tt(marstime.julian(float(request["mills"]))))
+    raise ValueError("request needs j2000_ott or mills")
+
+
+class BatchServer(object):
+    """Coalesces concurrent requests into vectorized marstime calls.
+
+    submit() can be awaited directly from the same event loop, start() also
+    listens for newline delimited JSON on host:port (port 0 picks a free port,
+    available as self.port once started)."""
+
+    def __init__(self, host="127.0.0.1", port=0, max_batch=4096, max_latency=0.002):
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._pending = {}
+        self._timers = {}
+        self._server = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zeroes the throughput and latency counters"""
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.total_latency = 0.
+        self.max_seen_latency = 0.
+
+    def stats(self):
+        """Returns a dictionary of request, batch and latency counters"""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return dict(requests=self.requests, errors=self.errors, batches=self.batches,
+                    mean_batch=self.requests/float(max(self.batches, 1)),
+                    throughput=self.requests/elapsed,
+                    mean_latency=self.total_latency/max(self.requests, 1),
+                    max_latency=self.max_seen_latency)
+
+    async def submit(self, function, **request):
+        """Evaluates one request, batched with any others for the same function"""
+        try:
+            if function not in functions:
+                raise ValueError("unknown function {0}".format(function))
+            args = [j2000_ott_from_request(request)]
+            for name, default in functions[function].items():
+                args.append(float(request.get(name, default)))
+        except (ValueError, TypeError):
+            self.errors += 1
+            raise
+
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(function, [])
+        pending.append((args, future, time.perf_counter()))
+        if len(pending) >= self.max_batch:
+            self._flush(function)
+        elif function not in self._timers:
+            self._timers[function] = asyncio.get_running_loop().call_later(
+                self.max_latency, self._flush, function)
+        return await future
+
+    def _flush(self, function):
+        """Evaluates the pending requests for a function in one call"""
+        timer = self._timers.pop(function, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(function, [])
+        if not pending:
+            return
+        self.batches += 1
+
+        func = getattr(marstime, function)
+        columns = [np.array(c) for c in zip(*[args for (args, f, t) in pending])]
+        #marstime takes the time last
+        columns = columns[1:] + columns[:1]
+        try:
+            results = np.broadcast_to(func(*columns), (len(pending),))
+        except Exception:
+            #isolate the failing requests
+            results = []
+            for (args, f, t) in pending:
+                try:
+                    results.append(func(*(args[1:]+args[:1])))
+                except Exception as e:
+                    results.append(e)
+
+        now = time.perf_counter()
+        for (args, future, received), result in zip(pending, results):
+            latency = now - received
+            self.requests += 1
+            self.total_latency += latency
+            self.max_seen_latency = max(self.max_seen_latency, latency)
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                self.errors += 1
+                future.set_exception(result)
+            else:
+                future.set_result(float(result))
+
+    async def _respond(self, line, writer):
+        rid = None
+        try:
+            request = json.loads(line)
+            rid = request.pop("id", None)
+            function = request.pop("function", None)
+        except (ValueError, AttributeError) as e:
+            self.errors += 1
+            response = dict(id=rid, error="bad request: {0}".format(e))
+        else:
+            try:
+                response = dict(id=rid, result=await self.submit(function, **request))
+            except Exception as e:
+                response = dict(id=rid, error=str(e))
+        writer.write((json.dumps(response) + "\n").encode())
+
+    async def _handle(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if len(tasks) > 4*self.max_batch:
+                    await writer.drain()
+            if tasks:
+                await asyncio.wait(tasks)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self):
+        """Starts listening, returns the asyncio server"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def close(self):
+        """Stops listening"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def query(requests, host="127.0.0.1", port=8765):
+    """Sends a list of request dictionaries over one connection and returns the
+    responses in the same order, the ids are replaced by the list positions."""
+    reader, writer = await asyncio.open_connection(host, port)
+    for i, request in enumerate(requests):
+        request = dict(request)
+        request["id"] = i
+        writer.write((json.dumps(request) + "\n").encode())
+    await writer.drain()
+    responses = [None]*len(requests)
+    for i in range(len(requests)):
+        response = json.loads(await reader.readline())
+        responses[response["id"]] = response
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves marstime queries over TCP as newline delimited JSON")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", "-p", default=8765, type=int, help="port to listen on")
+    parser.add_argument("--max-batch", default=4096, type=int,
+            help="largest number of requests evaluated in one call")
+    parser.add_argument("--max-latency", default=0.002, type=float,
+            help="longest time (seconds) a request waits for others to batch with")
+    parser.add_argument("--stats-interval", default=0., type=float,
+            help="print the counters every this many seconds, 0 to disable")
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = BatchServer(args.host, args.port, args.max_batch, args.max_latency)
+        await server.start()
+        print("marstime server listening on {0}:{1}".format(server.host, server.port))
+        while True:
+            if args.stats_interval > 0:
+                await asyncio.sleep(args.stats_interval)
+                print(server.stats())
+            else:
+                await asyncio.sleep(3600)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Horizon maps and shadow masks for DEM tiles
+
+horizon_map computes the elevation angle of the terrain horizon in n evenly
+spaced azimuth directions for every pixel of a DEM (a 2D array of heights in
+metres, row 0 to the north, columns increasing to the east). For each
+direction the DEM is sheared so that lines in that direction become rows,
+and each row is swept once against the direction, keeping the upper convex
+hull of the terrain ahead of each pixel: the horizon point is found by
+popping hull points, which is O(1) amortized per pixel instead of a ray
+march over every distance. All the rows of a tile are swept together.
+
+Large DEMs (e.g. a .npy file, which is memory mapped) are processed in tiles
+with a halo of surrounding terrain, optionally in a pool of processes, and
+the result can be written straight to a memory mapped .npy file:
+
+    horizons = terrain.horizon_map("dem.npy", 20., directions=32,
+                                   processes=8, out="horizons.npy")
+    shadowed = terrain.shadow_mask(horizons, 137.4, -4.5, j2000_offsets)
+
+Terrain further than halo pixels outside a tile, and the curvature of the
+planet, are ignored.
+"""
+import collections
+import concurrent.futures
+import numpy as np
+import marstime
+
+
+def direction_azimuths(n):
+    """Returns the azimuths (degrees clockwise from north) of n evenly spaced
+    directions, the first axis of a horizon map"""
+    return np.arange(n)*(360./n)
+
+
+def _sweep(z, step):
+    """Tangent of the horizon elevation toward increasing column along each
+    row of z (nan where there is no terrain), -inf where there is none ahead"""
+    lines, n = z.shape
+    rows = np.arange(lines)
+    stack = np.zeros((lines, n), dtype=np.intp)
+    top = np.zeros(lines, dtype=np.intp)
+    out = np.full(z.shape, -np.inf)
+    for i in range(n-1, -1, -1):
+        zi = z[:, i]
+        valid = ~np.isnan(zi)
+        #pop hull points hidden behind the next one as seen from column i
+        r = rows[valid & (top >= 2)]
+        while r.size:
+            h0 = stack[r, top[r]-1]
+            h1 = stack[r, top[r]-2]
+            z0 = z[r, h0]
+            pop = (z0 - zi[r])*(h1 - h0) <= (z[r, h1] - z0)*(h0 - i)
+            r = r[pop]
+            top[r] -= 1
+            r = r[top[r] >= 2]
+        r = rows[valid & (top >= 1)]
+        h0 = stack[r, top[r]-1]
+        out[r, i] = (z[r, h0] - zi[r])/((h0 - i)*step)
+        r = rows[valid]
+        stack[r, top[r]] = i
+        top[r] += 1
+    return out
+
+
+def _direction(z, azimuth, pixel_size, phases=4):
+    """Tangent of the horizon elevation in one direction for every pixel of z"""
+    a = np.radians(azimuth)
+    dcol, drow = np.sin(a), -np.cos(a)
+    transpose = abs(drow) > abs(dcol)
+    if transpose:
+        z, dcol, drow = z.T, drow, dcol
+    flip = dcol < 0
+    if flip:
+        z = z[:, ::-1]
+    #rounded so the axes and diagonals fall exactly on pixels
+    shear = round(drow/abs(dcol), 12)
+
+    #line k passes through row start[k] + offset[c] of column c, its heights
+    #interpolated linearly between the rows on either side. The lines are
+    #1/phases of a row apart, so each pixel is at most 1/(2*phases) of a
+    #row from the nearest line (exactly on one on the axes and diagonals)
+    h, w = z.shape
+    offset = np.arange(w)*shear
+    if shear == round(shear):
+        phases = 1
+    start = np.arange(np.floor(-offset.max()*phases) - 1,
+                      np.ceil((h - 1 - offset.min())*phases) + 2)/phases
+    y = start[:, np.newaxis] + offset
+    below = np.floor(y)
+    f = y - below
+    below = below.astype(np.intp)
+    cols = np.broadcast_to(np.arange(w), y.shape)
+    z0 = z[np.clip(below, 0, h-1), cols]
+    z1 = z[np.clip(below + 1, 0, h-1), cols]
+    sheared = np.where(f > 0, z0 + f*(z1 - z0), z0)
+    sheared[(y < -1e-9) | (y > h - 1 + 1e-9)] = np.nan
+
+    tangent = _sweep(sheared, pixel_size*np.hypot(1., shear))
+    #the line nearest each pixel, within the DEM at the edges
+    line = np.rint((np.arange(h)[:, np.newaxis] - offset - start[0])*phases).astype(np.intp)
+    y = start[line] + offset
+    line += (y < -1e-9)
+    line -= (y > h - 1 + 1e-9)
+    out = tangent[line, np.arange(w)]
+    if flip:
+        out = out[:, ::-1]
+    if transpose:
+        out = out.T
+    return out
+
+
+def _horizon_tile(z, azimuths, pixel_size, crop, phases):
+    """Horizon elevations (degrees) of the crop of z in each direction"""
+    z = np.asarray(z, dtype=float)
+    out = np.empty((len(azimuths),) + z[crop].shape, dtype=np.float32)
+    for k, azimuth in enumerate(azimuths):
+        out[k] = np.degrees(np.arctan(_direction(z, azimuth, pixel_size, phases)[crop]))
+    out[:, np.isnan(z[crop])] = np.nan
+    return out
+
+
+def _tiles(shape, tile, halo):
+    """Yields (tile, outer, crop) slices covering a 2D shape: outer extends the
+    tile by up to halo pixels on each side and crop is the tile within outer"""
+    for r0 in range(0, shape[0], tile):
+        for c0 in range(0, shape[1], tile):
+            r1, c1 = min(r0 + tile, shape[0]), min(c0 + tile, shape[1])
+            R0, C0 = max(r0 - halo, 0), max(c0 - halo, 0)
+            R1, C1 = min(r1 + halo, shape[0]), min(c1 + halo, shape[1])
+            yield ((slice(r0, r1), slice(c0, c1)), (slice(R0, R1), slice(C0, C1)),
+                   (slice(r0 - R0, r1 - R0), slice(c0 - C0, c1 - C0)))
+
+
+def _map_tiles(func, jobs, processes=None):
+    """Yields (key, func(*args)) for each (key, args) in jobs, in a pool of
+    processes if processes > 1, with at most two jobs per process in flight so
+    that only a few tiles are held in memory at once"""
+    if not processes or processes <= 1:
+        for key, args in jobs:
+            yield key, func(*args)
+        return
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        pending = collections.deque()
+        for key, args in jobs:
+            pending.append((key, pool.submit(func, *args)))
+            if len(pending) >= 2*processes:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+
+
+def _open(array):
+    """Memory maps .npy file names, other arrays are used as they are"""
+    if isinstance(array, str):
+        return np.load(array, mmap_mode="r")
+    return np.asanyarray(array)
+
+
+def _output(out, shape, dtype):
+    """An array of shape for the results: a new one, out itself, or a new
+    memory mapped .npy file if out is a file name"""
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+    return out
+
+
+def horizon_map(dem, pixel_size, directions=16, tile=512, halo=256, processes=None, out=None,
+                phases=4):
+    """Returns the horizon elevation angle (degrees, float32) in each of
+    `directions` evenly spaced azimuths (see direction_azimuths) for every
+    pixel of the DEM, an array of shape (directions, rows, cols). Pixels with
+    no terrain ahead in a direction (at the edge of the DEM) get -90, nan
+    heights give nan.
+
+    dem is a 2D array of heights or the name of a .npy file, pixel_size the
+    pixel spacing in the same units as the heights. The DEM is processed in
+    tiles of tile x tile pixels, each with halo pixels of surrounding terrain,
+    in `processes` worker processes if given. out may be an array or the name
+    of a .npy file to create (memory mapped) for the result.
+
+    Off the axes and diagonals the lines swept through the DEM do not pass
+    through every pixel centre: they are spaced 1/phases of a pixel apart and
+    each pixel takes the horizon of the nearest, at most 1/(2*phases) of a
+    pixel to the side. The time is proportional to phases."""
+    dem = _open(dem)
+    azimuths = direction_azimuths(directions)
+    out = _output(out, (directions,) + dem.shape, np.float32)
+    jobs = ((inner, (dem[outer], azimuths, pixel_size, crop, phases))
+            for (inner, outer, crop) in _tiles(dem.shape, tile, halo))
+    for inner, horizons in _map_tiles(_horizon_tile, jobs, processes):
+        out[(slice(None),) + inner] = horizons
+    return out
+
+
+def horizon_at(horizons, azimuth):
+    """Horizon elevation at azimuth (degrees, a scalar or one per pixel),
+    linearly interpolated between the directions of a horizon map"""
+    n = horizons.shape[0]
+    x = np.broadcast_to(np.asarray(azimuth, dtype=float) % 360., horizons.shape[1:])*(n/360.)
+    i = np.floor(x).astype(np.intp)
+    w = x - i
+    lower = np.take_along_axis(horizons, (i % n)[np.newaxis], axis=0)[0]
+    upper = np.take_along_axis(horizons, ((i + 1) % n)[np.newaxis], axis=0)[0]
+    return lower*(1 - w) + upper*w
+
+
+def shadow_mask(horizons, longitude, latitude, j2000_ott=None):
+    """True where the centre of the sun is at or below the terrain horizon.
+
+    horizons is a horizon map of shape (directions, rows, cols), longitude
+    (planetographic west) and latitude are scalars for the tile or one value
+    per pixel. The result has shape j2000_ott.shape + (rows, cols), one time
+    being evaluated at a time."""
+    if j2000_ott is None:
+        j2000_ott = marstime.j2000_offset_tt(marstime.julian_tt())
+    t = np.asarray(j2000_ott, dtype=float)
+    masks = np.empty(t.shape + horizons.shape[1:], dtype=bool)
+    for index in np.ndindex(t.shape):
+        elevation = marstime.solar_elevation(longitude, latitude, float(t[index]))
+        azimuth = marstime.solar_azimuth(longitude, latitude, float(t[index]))
+        masks[index] = elevation <= horizon_at(horizons, azimuth)
+    return masks
+
+
+def _raster_tile(value, window):
+    """The window of a raster, scalars are used as they are"""
+    if value.ndim < 2:
+        return value.astype(float)
+    return np.asarray(value[window], dtype=float)
+
+
+#largest number of elements (times x pixels) of each facet_insolation job
+_facet_chunk = 2**22
+
+
+def _facet_tile(slope, aspect, longitude, latitude, horizons, sun, dtype):
+    """Incidence angles and fluxes of one tile at each time of sun, the
+    (sin dec, cos dec, subsolar longitude, flux at normal incidence) rows"""
+    slope, aspect = np.radians(slope), np.radians(aspect)
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    sinlat, coslat = np.sin(lat), np.cos(lat)
+    #facet normal in east, north, up, regrouped so each time is a few operations
+    east = np.sin(slope)*np.sin(aspect)
+    north = np.sin(slope)*np.cos(aspect)
+    up = np.cos(slope)
+    a = north*coslat + up*sinlat
+    b = up*coslat - north*sinlat
+
+    shape = (len(sun),) + np.broadcast(slope, aspect, lat, lon).shape
+    incidence = np.empty(shape, dtype=dtype)
+    flux = np.empty(shape, dtype=dtype)
+    for k, (sindec, cosdec, subsol, scale) in enumerate(sun):
+        ha = lon - subsol
+        sinha, cosha = np.sin(ha), np.cos(ha)
+        cosi = sindec*a + cosdec*(east*sinha + b*cosha)
+        cosz = sinlat*sindec + coslat*cosdec*cosha
+        if horizons is None:
+            lit = cosz > 0
+        else:
+            sun_north = coslat*sindec - sinlat*cosdec*cosha
+            azimuth = np.degrees(np.arctan2(cosdec*sinha, sun_north))
+            elevation = np.degrees(np.arcsin(np.clip(cosz, -1., 1.)))
+            lit = elevation > horizon_at(horizons, azimuth)
+        incidence[k] = np.degrees(np.arccos(np.clip(cosi, -1., 1.)))
+        flux[k] = np.where(lit, scale*np.maximum(cosi, 0.), 0.)
+    return incidence, flux
+
+
+def facet_insolation(slope, aspect, longitude, latitude, j2000_ott=None, solar_constant=1361.,
+                     horizons=None, tile=512, processes=None, out=None, dtype=np.float32):
+    """Top of atmosphere insolation on tilted facets.
+
+    slope (degrees from horizontal) and aspect (degrees clockwise from north
+    of the downhill direction) are rasters, arrays or .npy file names (memory
+    mapped); longitude (planetographic west) and latitude are scalars or
+    rasters of the same shape. The sun direction comes from
+    subsolar_longitude, solar_declination and heliocentric_distance once per
+    time. If horizons (a horizon map of the raster) is given, pixels where
+    the sun is behind the terrain get no flux, otherwise only the sun being
+    below the horizon does.
+
+    Returns a dictionary of incidence (the angle between the facet normal and
+    the sun, degrees) and flux (W/m^2 on the facet) arrays of shape
+    j2000_ott.shape + raster shape. The rasters are processed in tiles of
+    tile x tile pixels and as many times as fit in 2^22 elements, in
+    `processes` worker processes if given, so memory is bounded by a few
+    tiles at all times. out may be a dictionary of arrays or .npy file names
+    (created memory mapped) for the results."""
+    if j2000_ott is None:
+        j2000_ott = marstime.j2000_offset_tt(marstime.julian_tt())
+    slope, aspect = _open(slope), _open(aspect)
+    longitude, latitude = _open(longitude), _open(latitude)
+    if horizons is not None:
+        horizons = _open(horizons)
+
+    t = np.asarray(j2000_ott, dtype=float)
+    dec = np.radians(marstime.solar_declination(marstime.Mars_Ls(t.ravel())))
+    sun = np.stack([np.sin(dec), np.cos(dec),
+                    np.radians(marstime.subsolar_longitude(t.ravel())),
+                    solar_constant/marstime.heliocentric_distance(t.ravel())**2], axis=-1)
+
+    shape = t.shape + slope.shape
+    out = out or {}
+    out = dict((key, _output(out.get(key), shape, dtype)) for key in ("incidence", "flux"))
+    def jobs():
+        for (inner, outer, crop) in _tiles(slope.shape, tile, 0):
+            pixels = (inner[0].stop - inner[0].start)*(inner[1].stop - inner[1].start)
+            step = max(1, _facet_chunk//pixels)
+            for k in range(0, max(t.size, 1), step):
+                times = slice(k, min(k + step, t.size))
+                yield ((times, inner),
+                       (slope[inner], aspect[inner], _raster_tile(longitude, inner),
+                        _raster_tile(latitude, inner),
+                        None if horizons is None else horizons[(slice(None),) + inner],
+                        sun[times], dtype))
+
+    for (times, inner), (incidence, flux) in _map_tiles(_facet_tile, jobs(), processes):
+        if t.ndim:
+            index = np.unravel_index(np.arange(times.start, times.stop), t.shape) + inner
+        else:
+            index, incidence, flux = inner, incidence[0], flux[0]
+        out["incidence"][index] = incidence
+        out["flux"][index] = flux
+    return out
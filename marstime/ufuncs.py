@@ -0,0 +1,230 @@
+"""NumPy ufuncs of the core conversions, compiled with numba
+
+Each ufunc computes the whole Mars24 chain for one element in a single loop,
+so no intermediate arrays are allocated, and being true ufuncs they support
+broadcasting, out=, dtype= and the other ufunc keywords:
+
+    from marstime import ufuncs
+    ufuncs.solar_zenith(lon[:, None], lat[:, None], t, out=buffer, where=mask)
+
+numba's ufuncs reject a where mask, so each numpy ufunc is wrapped in a
+Ufunc that evaluates only the selected elements and scatters them into out
+(elements that are not selected keep the values of out, as for any ufunc).
+Other attributes (nin, types, outer, at...) are those of the numpy ufunc,
+which is Ufunc.ufunc.
+
+They take the same positional arguments as the marstime functions with the
+full accuracy tier, and match them to ~1e-12. The coefficients are imported
+from marstime, so only the scalar form of each formula is written here. There are float64 and float32
+loops (float32 inputs compute in double precision and round the result);
+other inputs are cast to float64. Latitudes outside [-90, 90] give nan
+instead of the ValueError of the marstime functions.
+
+numba is needed, and each ufunc is compiled on first use (and cached on disk).
+"""
+import math
+import numpy as np
+try:
+    import numba
+except ImportError:
+    raise ImportError("marstime.ufuncs needs numba, e.g. pip install numba")
+#the coefficients are those of marstime, numba compiles them in as constants
+from marstime import (_perturb_A, _perturb_tau, _perturb_phi, _perturb_rate,
+                      _mean_anomaly, _fms_angle, _center, _eot_terms, _msd_terms,
+                      _declination_terms, _distance_terms)
+
+_jit = numba.njit(cache=True)
+
+
+@_jit
+def _mean_anomaly_radians(j2000_ott):
+    return ((_mean_anomaly[0] + _mean_anomaly[1]*j2000_ott) % 360.)*math.pi/180.
+
+
+@_jit
+def _equation_of_center(j2000_ott):
+    M = _mean_anomaly_radians(j2000_ott)
+    pbs = 0.
+    for k in range(7):
+        pbs += _perturb_A[k]*math.cos(((_perturb_rate*j2000_ott/_perturb_tau[k])
+                                       + _perturb_phi[k])*math.pi/180.)
+    val = (_center[0] + _center[1]*j2000_ott)*math.sin(M)
+    for k in range(2, 6):
+        val += _center[k]*math.sin(k*M)
+    return val + pbs
+
+
+@_jit
+def _ls_v_m(j2000_ott):
+    v_m = _equation_of_center(j2000_ott)
+    return ((_fms_angle[0] + _fms_angle[1]*j2000_ott) % 360. + v_m) % 360., v_m
+
+
+@_jit
+def _mars_ls(j2000_ott):
+    return _ls_v_m(j2000_ott)[0]
+
+
+@_jit
+def _eot(ls, v_m):
+    ls = ls*math.pi/180.
+    return (_eot_terms[0]*math.sin(2*ls) + _eot_terms[1]*math.sin(4*ls)
+            + _eot_terms[2]*math.sin(6*ls) - v_m)
+
+
+@_jit
+def _equation_of_time(j2000_ott):
+    ls, v_m = _ls_v_m(j2000_ott)
+    return _eot(ls, v_m)
+
+
+@_jit
+def _coordinated_mars_time(j2000_ott):
+    return (24*(((j2000_ott - _msd_terms[0])/_msd_terms[1])
+                + _msd_terms[2] - _msd_terms[3])) % 24
+
+
+@_jit
+def _local_mean_solar_time(longitude, j2000_ott):
+    return (_coordinated_mars_time(j2000_ott) - longitude*(24/360.)) % 24
+
+
+@_jit
+def _local_true_solar_time(longitude, j2000_ott):
+    return (_local_mean_solar_time(longitude, j2000_ott)
+            + _equation_of_time(j2000_ott)*(24/360.)) % 24
+
+
+@_jit
+def _subsolar_longitude(j2000_ott):
+    mtc = _coordinated_mars_time(j2000_ott)
+    return ((mtc + _equation_of_time(j2000_ott)*24/360.)*(360/24.) + 180.) % 360.
+
+
+@_jit
+def _solar_declination(ls):
+    sinls = math.sin(ls*math.pi/180.)
+    return (math.asin(_declination_terms[0]*sinls)
+            + _declination_terms[1]*(math.pi/180)*sinls)*180./math.pi
+
+
+@_jit
+def _heliocentric_distance(j2000_ott):
+    M = _mean_anomaly_radians(j2000_ott)
+    rm = _distance_terms[1]
+    for k in range(1, 5):
+        rm += _distance_terms[k + 1]*math.cos(k*M)
+    return _distance_terms[0]*rm
+
+
+@_jit
+def _hourangle(longitude, j2000_ott):
+    return longitude*math.pi/180. - _subsolar_longitude(j2000_ott)*math.pi/180.
+
+
+@_jit
+def _declination_hourangle(longitude, j2000_ott):
+    """Declination and hour angle in radians, sharing Ls"""
+    ls, v_m = _ls_v_m(j2000_ott)
+    mtc = _coordinated_mars_time(j2000_ott)
+    subsol = ((mtc + _eot(ls, v_m)*24/360.)*(360/24.) + 180.) % 360.
+    return (_solar_declination(ls)*math.pi/180.,
+            longitude*math.pi/180. - subsol*math.pi/180.)
+
+
+@_jit
+def _cos_solar_zenith(longitude, latitude, j2000_ott):
+    if abs(latitude) > 90:
+        return math.nan
+    dec, ha = _declination_hourangle(longitude, j2000_ott)
+    lat = latitude*math.pi/180.
+    return math.sin(dec)*math.sin(lat) + math.cos(dec)*math.cos(lat)*math.cos(ha)
+
+
+@_jit
+def _solar_zenith(longitude, latitude, j2000_ott):
+    return math.acos(_cos_solar_zenith(longitude, latitude, j2000_ott))*180./math.pi
+
+
+@_jit
+def _solar_elevation(longitude, latitude, j2000_ott):
+    return 90 - _solar_zenith(longitude, latitude, j2000_ott)
+
+
+@_jit
+def _solar_azimuth(longitude, latitude, j2000_ott):
+    if abs(latitude) > 90:
+        return math.nan
+    dec, ha = _declination_hourangle(longitude, j2000_ott)
+    lat = latitude*math.pi/180.
+    denom = math.cos(lat)*math.tan(dec) - math.sin(lat)*math.cos(ha)
+    return (360 + math.atan2(math.sin(ha), denom)*180./math.pi) % 360.
+
+
+#ufunc name: (kernel, number of inputs)
+_kernels = dict(
+    equation_of_center=(_equation_of_center, 1),
+    Mars_Ls=(_mars_ls, 1),
+    equation_of_time=(_equation_of_time, 1),
+    Coordinated_Mars_Time=(_coordinated_mars_time, 1),
+    Local_Mean_Solar_Time=(_local_mean_solar_time, 2),
+    Local_True_Solar_Time=(_local_true_solar_time, 2),
+    subsolar_longitude=(_subsolar_longitude, 1),
+    solar_declination=(_solar_declination, 1),
+    heliocentric_distance=(_heliocentric_distance, 1),
+    hourangle=(_hourangle, 2),
+    cos_solar_zenith=(_cos_solar_zenith, 3),
+    solar_zenith=(_solar_zenith, 3),
+    solar_elevation=(_solar_elevation, 3),
+    solar_azimuth=(_solar_azimuth, 3),
+)
+
+__all__ = sorted(_kernels)
+
+
+class Ufunc(object):
+    """A numpy ufunc with where= support, see the module docstring"""
+
+    def __init__(self, ufunc):
+        self.ufunc = ufunc
+        self.__name__ = ufunc.__name__
+        self.__doc__ = "ufunc of marstime.{0}, see marstime.ufuncs".format(ufunc.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.ufunc, name)
+
+    def __repr__(self):
+        return "<marstime ufunc '{0}'>".format(self.__name__)
+
+    def __call__(self, *args, out=None, where=True, **kwargs):
+        if where is True:
+            return self.ufunc(*args, out=out, **kwargs)
+        if isinstance(out, tuple):
+            out, = out
+        arrays = list(np.broadcast_arrays(*args, where))
+        mask = arrays.pop().astype(bool)
+        values = self.ufunc(*[a[mask] for a in arrays], **kwargs)
+        if out is None:
+            #uninitialised where not selected, as for numpy ufuncs
+            out = np.empty(mask.shape, dtype=values.dtype)
+        out[mask] = values
+        return out
+
+
+def _ufunc(name):
+    kernel, nin = _kernels[name]
+    loop = [None, lambda a: kernel(a), lambda a, b: kernel(a, b),
+            lambda a, b, c: kernel(a, b, c)][nin]
+    loop.__name__ = name
+    signatures = ["{0}({1})".format(t, ",".join([t]*nin)) for t in ("float32", "float64")]
+    #the kernel is inlined into the loop
+    return Ufunc(numba.vectorize(signatures, cache=True)(loop).ufunc)
+
+
+def __getattr__(name):
+    #compiled on first use, then a module attribute
+    if name not in _kernels:
+        raise AttributeError("module 'marstime.ufuncs' has no attribute '{0}'".format(name))
+    ufunc = _ufunc(name)
+    globals()[name] = ufunc
+    return ufunc
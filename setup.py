@@ -20,9 +20,11 @@ setup(name="marstime",
       long_description=open("README.txt").read(),
       classifiers=["License :: OSI Approved :: BSD License",
                   "Intended Audience :: Science/Research",
-                  "Programming Language :: Python :: 2.7",
                   "Programming Language :: Python :: 3",
+                  "Programming Language :: Python :: 3.7",
                   "Topic :: Scientific/Engineering :: Astronomy"],
       zip_safe=False,
       install_requires=requirements,
+      python_requires=">=3.7",
+      entry_points={"console_scripts": ["marstime=marstime.cli:main"]},
 )
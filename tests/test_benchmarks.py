@@ -0,0 +1,32 @@
+import inspect
+import os
+import sys
+import marstime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import benchmarks
+
+
+def test_every_public_function():
+    public = [name for (name, f) in vars(marstime).items()
+              if inspect.isfunction(f) and f.__module__ == "marstime"
+              and not name.startswith("_")
+              and not name.endswith(("_math", "_np", "_numpy"))]
+    assert sorted(public) == sorted(benchmarks.public_functions)
+
+
+def test_cases_run():
+    for name in benchmarks.public_functions:
+        for n in [1, 10]:
+            case = benchmarks.TimeFunctions()
+            case.setup(name, n)
+            case.time_call(name, n)
+
+
+def test_math_path_restored():
+    case = benchmarks.TimeMath()
+    case.setup("Mars_Ls")
+    case.time_call("Mars_Ls")
+    case.teardown("Mars_Ls")
+    assert marstime.use_numpy
+    assert marstime.np.__name__ == "numpy"
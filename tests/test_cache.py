@@ -0,0 +1,74 @@
+import sys
+sys.path.insert(0,"./")
+import threading
+import marstime
+from marstime.cache import StateCache
+
+
+def within_error(val, equal, error):
+    return (val>(equal-error))&(val<(equal+error))
+
+def test_state_cache_matches():
+    cache = StateCache(resolution=1e-6)
+    j2000_ott = 1463.07471
+    longitude = 184.702
+    latitude = -14.460
+    for i in range(2):
+        assert within_error(cache.Mars_Ls(j2000_ott), marstime.Mars_Ls(j2000_ott), 1e-7)
+        assert within_error(cache.equation_of_time(j2000_ott),
+                            marstime.equation_of_time(j2000_ott), 1e-7)
+        assert within_error(cache.subsolar_longitude(j2000_ott),
+                            marstime.subsolar_longitude(j2000_ott), 1e-7)
+        assert within_error(cache.Local_True_Solar_Time(longitude, j2000_ott),
+                            marstime.Local_True_Solar_Time(longitude, j2000_ott), 1e-7)
+        assert within_error(cache.hourangle(longitude, j2000_ott),
+                            marstime.hourangle(longitude, j2000_ott), 1e-7)
+        assert within_error(cache.solar_zenith(longitude, latitude, j2000_ott),
+                            marstime.solar_zenith(longitude, latitude, j2000_ott), 1e-6)
+        assert within_error(cache.solar_elevation(longitude, latitude, j2000_ott),
+                            marstime.solar_elevation(longitude, latitude, j2000_ott), 1e-6)
+        assert within_error(cache.solar_azimuth(longitude, latitude, j2000_ott),
+                            marstime.solar_azimuth(longitude, latitude, j2000_ott), 1e-6)
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+    assert stats["hits"] > 10
+
+def test_state_cache_quantized():
+    cache = StateCache(resolution=1.0)
+    cache.state(100.0)
+    cache.state(100.0 + 0.4/86400.)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+    cache.state(100.0 + 0.6/86400.)
+    assert cache.stats()["misses"] == 2
+
+def test_state_cache_lru():
+    cache = StateCache(maxsize=2)
+    cache.state(1.0)
+    cache.state(2.0)
+    cache.state(1.0)
+    cache.state(3.0) #evicts 2.0, the least recently used
+    assert cache.stats()["evictions"] == 1
+    cache.state(1.0)
+    assert cache.stats()["hits"] == 2
+    cache.state(2.0)
+    assert cache.stats()["misses"] == 4
+    cache.resize(1)
+    assert cache.stats()["size"] == 1
+    cache.clear()
+    assert cache.stats() == dict(hits=0, misses=0, evictions=0, size=0, maxsize=1)
+
+def test_state_cache_threads():
+    cache = StateCache(maxsize=8)
+    def worker():
+        for i in range(200):
+            cache.Local_True_Solar_Time(10., float(i % 16))
+    threads = [threading.Thread(target=worker) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 800
+    assert stats["size"] == 8
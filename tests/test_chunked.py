@@ -0,0 +1,94 @@
+import sys
+sys.path.insert(0,"./")
+import numpy as np
+import pytest
+import marstime
+from marstime import chunked
+
+da = pytest.importorskip("dask.array")
+
+
+def test_dask_lazy_and_chunked():
+    t = np.linspace(-300., 7000., 10000)
+    lazy = da.from_array(t, chunks=1000)
+    ls = marstime.Mars_Ls(lazy)
+    assert isinstance(ls, da.Array) and ls.chunks == lazy.chunks
+    assert np.allclose(ls.compute(), marstime.Mars_Ls(t))
+    #numpy and scalar arguments are broadcast against the chunks
+    lon = np.linspace(0., 360., 7)[:, np.newaxis]
+    sza = marstime.solar_zenith(lon, 20., j2000_ott=lazy, accuracy="medium")
+    assert sza.shape == (7, 10000) and sza.chunks[1] == lazy.chunks[0]
+    assert np.allclose(sza.compute(), marstime.solar_zenith(lon, 20., t, accuracy="medium"))
+
+def test_dask_several_outputs():
+    t = np.linspace(0., 700., 1000)
+    lazy = da.from_array(t, chunks=300)
+    geometry = marstime.track_geometry(lazy, 10., 20.)
+    expected = marstime.track_geometry(t, 10., 20.)
+    assert sorted(geometry) == sorted(expected)
+    for key in expected:
+        assert np.allclose(geometry[key].compute(), expected[key])
+    year, length = marstime.Mars_Year(lazy, return_length=True)
+    assert np.allclose(year.compute(), marstime.Mars_Year(t))
+    assert np.allclose(length.compute(), marstime.Mars_Year(t, True)[1])
+
+def test_scalars_unaffected():
+    assert marstime.Mars_Ls(100.) == marstime.Mars_Ls.__wrapped__(100.)
+    assert not chunked.is_chunked((100., np.arange(3.)), {})
+
+def test_xarray_dataset():
+    xr = pytest.importorskip("xarray")
+    times = np.arange("2020-01-01", "2020-01-03", dtype="datetime64[h]")
+    ds = xr.Dataset(coords=dict(time=times, lat=np.linspace(-80., 80., 5),
+                                lon=np.linspace(0., 350., 8)))
+    ds["ps"] = (("time", "lat", "lon"), np.zeros((48, 5, 8)))
+    ds = ds.chunk(time=12)
+    out = chunked.add_variables(ds)
+    assert out["ltst"].dims == ("time", "lat", "lon")
+    assert isinstance(out["ltst"].data, da.Array) and out["ltst"].chunks == ds["ps"].chunks
+
+    t = chunked.j2000_offset(ds["time"]).values
+    assert np.isclose(t[0], marstime.j2000_offset_tt(marstime.julian_tt(
+        marstime.julian(1577836800000.))))
+    lon = marstime.east_to_west(ds["lon"].values)
+    expected = marstime.Local_True_Solar_Time(lon[np.newaxis, :], t[:, np.newaxis])
+    assert np.allclose(out["ltst"].values[:, 2, :], expected)
+
+def test_xarray_keeps_coordinates():
+    xr = pytest.importorskip("xarray")
+    t = xr.DataArray(np.linspace(0., 700., 5), dims="x", coords=dict(x=np.arange(5)))
+    ls = marstime.Mars_Ls(j2000_ott=t)
+    assert isinstance(ls, xr.DataArray) and ls.dims == ("x",)
+    assert np.array_equal(ls["x"], t["x"])
+    assert np.allclose(ls.values, marstime.Mars_Ls(t.values))
+
+def test_dask_where():
+    t = np.linspace(0., 700., 1000)
+    mask = np.arange(1000) % 3 == 0
+    ltst = marstime.Local_True_Solar_Time(10., da.from_array(t, chunks=300), where=mask)
+    assert isinstance(ltst, da.Array)
+    expected = marstime.Local_True_Solar_Time(10., t, where=mask)
+    assert np.array_equal(ltst.compute(), expected, equal_nan=True)
+
+
+def test_dask_unique():
+    t = np.repeat(np.linspace(0., 700., 100), 10)
+    geometry = marstime.track_geometry(da.from_array(t, chunks=300), 10., 20., unique=True)
+    expected = marstime.track_geometry(t, 10., 20.)
+    for key in expected:
+        assert np.allclose(geometry[key].compute(), expected[key])
+    ls = marstime.Mars_Ls(da.from_array(t, chunks=300), unique=True, where=t > 100)
+    assert np.array_equal(ls.compute(), marstime.Mars_Ls(t, where=t > 100), equal_nan=True)
+
+def test_dask_float32():
+    lon = np.linspace(0., 360., 100)
+    t = np.linspace(0., 700., 100)
+    expected = marstime.solar_zenith(lon, 10., t, dtype=np.float32)
+    sza = chunked.apply(marstime.solar_zenith, (da.from_array(lon, chunks=30), 10.,
+                        da.from_array(t, chunks=30)), {"dtype": np.float32})
+    assert sza.dtype == np.float32
+    assert np.array_equal(sza.compute(), expected)
+    sza = marstime.solar_zenith(da.from_array(lon, chunks=30), 10., t,
+                                dtype=np.float32, where=t > 100)
+    assert sza.dtype == np.float32
+    assert np.array_equal(sza.compute(), np.where(t > 100, expected, np.nan), equal_nan=True)
@@ -0,0 +1,60 @@
+import sys
+sys.path.insert(0,"./")
+import json
+import marstime
+from marstime import cli
+
+
+def within_error(val, equal, error):
+    return (val>(equal-error))&(val<(equal+error))
+
+def test_parse_times():
+    j2k = cli.parse_times(["2004-01-03T13:46:31Z"])
+    assert within_error(j2k[0], 1463.07471, 1e-5)
+    assert within_error(cli.parse_times(["1073137591000"])[0], j2k[0], 1e-9)
+    assert within_error(cli.parse_times([1073137591.0], "unix")[0], j2k[0], 1e-9)
+    assert cli.parse_times(["1.5"], "j2000")[0] == 1.5
+
+def test_csv(tmpdir, capsys):
+    filename = str(tmpdir.join("in.csv"))
+    with open(filename, "w") as f:
+        f.write("time,lon,lat\n")
+        for i in range(10):
+            f.write("1073137591000,184.702,-14.46\n")
+    assert cli.main([filename, filename, "-c", "msd,my,ls,ltst,sza", "-b", "3"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "time,lon,lat,msd,my,ls,ltst,sza"
+    assert len(lines) == 21
+    row = lines[1].split(",")
+    assert row[4] == "26"
+    assert within_error(float(row[5]), 327.32322, 1e-4)
+    assert within_error(float(row[6]), 0.00025, 1e-5)
+    assert within_error(float(row[7]), marstime.solar_zenith(184.702, -14.46, 1463.07471), 1e-4)
+
+def test_ndjson(tmpdir, capsys):
+    filename = str(tmpdir.join("in.ndjson"))
+    with open(filename, "w") as f:
+        f.write('{"t": 1073137591000, "lon": 175.298, "id": 1}\n\n')
+        f.write('{"t": 947116800000, "lon": 0, "id": 2}\n')
+    assert cli.main([filename, "-t", "t", "--east", "-c", "lmst"]) == 0
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["id"] for r in records] == [1, 2]
+    assert within_error(records[0]["lmst"], 0.85196, 1e-4)
+    assert within_error(records[1]["lmst"], 23.99431, 1e-4)
+
+def test_errors(tmpdir, capsys):
+    filename = str(tmpdir.join("in.csv"))
+    with open(filename, "w") as f:
+        f.write("time\n2004-01-03\n")
+    assert cli.main([filename, "-c", "ltst"]) == 1
+    assert cli.main([filename, "-c", "bogus"]) == 1
+    assert "bogus" in capsys.readouterr().err
+    #blank lines are skipped, short rows are reported
+    with open(filename, "w") as f:
+        f.write("time,lon\n1073137591000,184.702\n\n1073137591000,184.702\n\n")
+    assert cli.main([filename, "-c", "ltst"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 3
+    with open(filename, "w") as f:
+        f.write("time,lon\n1073137591000,184.702\n1073137591000\n")
+    assert cli.main([filename, "-c", "ltst"]) == 1
+    assert "line 3 has 1 fields" in capsys.readouterr().err
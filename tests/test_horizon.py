@@ -0,0 +1,70 @@
+import sys
+sys.path.insert(0,"./")
+import math
+import numpy as np
+import marstime
+from marstime import horizon
+
+
+def bisect(f, a, b, tol=1e-8):
+    fa = f(a)
+    while b - a > tol:
+        c = 0.5*(a+b)
+        fc = f(c)
+        if (fc > 0) == (fa > 0):
+            a, fa = c, fc
+        else:
+            b = c
+    return 0.5*(a+b)
+
+def sunrise_sunset(date, longitude, latitude):
+    #the scalar bisection search of examples/calculate_sunrise.py
+    radius = math.degrees(6.96342e8/(marstime.heliocentric_distance(date)*1.496e11))
+    f = lambda t: marstime.solar_elevation(longitude, latitude, t) + radius
+    lt = marstime.Local_True_Solar_Time(longitude, date)
+    mid1, mid2 = date - lt/24., date + (24-lt)/24.
+    noon = 0.5*(mid1 + mid2)
+    return bisect(f, mid1, noon), bisect(f, noon, mid2)
+
+
+def test_flat_horizon_matches_bisection():
+    lon, lat = 360.-137.4, -4.5
+    rise, sset = sunrise_sunset(4800.3, lon, lat)
+    sol = np.floor(marstime.Mars_Solar_Date(rise) - lon/360.)
+    r = horizon.illumination([lon], [lat], [sol], limb="upper")
+    assert abs(r["sunrise"][0,0] - rise)*86400 < 1.
+    assert abs(r["sunset"][0,0] - sset)*86400 < 1.
+    assert r["risings"][0,0] == 1
+    assert abs(r["illuminated"][0,0] - (sset-rise)*24/1.027491252) < 1e-3
+
+def test_raised_horizon():
+    lon, lat = 360.-137.4, -4.5
+    sols = np.arange(49400, 49420)
+    #a rim to the east delays sunrise but not sunset
+    azimuth = np.arange(0, 360, 10.)
+    elevation = np.where((azimuth > 30) & (azimuth < 150), 5., 0.)
+    r = horizon.illumination([lon, lon], [lat, lat], sols, [(azimuth, elevation), None])
+    assert r["sunrise"].shape == (2, 20)
+    assert np.all(r["sunrise"][0] > r["sunrise"][1] + 5./360.)
+    assert np.allclose(r["sunset"][0], r["sunset"][1])
+    assert np.all(r["illuminated"][0] < r["illuminated"][1])
+    #the sun is on the rim at sunrise
+    t = r["sunrise"][0]
+    az = marstime.solar_azimuth(lon, lat, t)
+    el = marstime.solar_elevation(lon, lat, t)
+    assert np.allclose(el, np.interp(az, azimuth, elevation, period=360.), atol=1e-3)
+
+def test_polar_day_and_night():
+    #north polar summer (Ls ~ 90) and winter (Ls ~ 270)
+    t = np.arange(0., 687.)
+    t = t[np.argmin(np.abs(marstime.Mars_Ls(t) - 90.))]
+    sols = np.floor(marstime.Mars_Solar_Date(np.array([t])))
+    r = horizon.illumination([0., 0.], [85., -85.], sols)
+    assert np.isnan(r["sunrise"]).all() and np.isnan(r["sunset"]).all()
+    assert np.isclose(r["illuminated"][0,0], 24.) and r["illuminated"][1,0] == 0.
+
+def test_horizon_table():
+    table = horizon.horizon_table([([350., 10.], [2., 4.]), None], 2, step=1.)
+    assert table.shape == (2, 361)
+    assert np.isclose(table[0,0], 3.) and np.isclose(table[0,360], 3.)
+    assert np.all(table[1] == 0)
@@ -0,0 +1,102 @@
+import sys
+sys.path.insert(0,"./")
+import numpy as np
+import marstime
+from marstime import insolation
+
+
+def within_error(val, equal, error):
+    return (val>(equal-error))&(val<(equal+error))
+
+def brute_force_daily_mean(latitude, j2000_ott, n=2000):
+    t = j2000_ott - 0.5*1.027491252 + 1.027491252*np.arange(n)/float(n)
+    cosZ = np.cos(marstime.solar_zenith(0, latitude, t)*np.pi/180.)
+    flux = 1361./marstime.heliocentric_distance(t)**2 * np.clip(cosZ, 0, None)
+    return flux.mean()
+
+def test_daily_mean_insolation():
+    latitudes = [-90., -80., -45., 0., 30., 70., 85., 90.]
+    for j2k in [0.5, 151.8, 350.4, 500.5]:
+        Q = insolation.daily_mean_insolation(latitudes, j2k)
+        assert Q.shape == (8,)
+        for lat, q in zip(latitudes, Q):
+            assert within_error(q, brute_force_daily_mean(lat, j2k), 0.5)
+
+def test_daily_mean_insolation_broadcast():
+    lat = np.linspace(-90, 90, 19)[:,None]
+    t = np.linspace(0, 687, 50)[None,:]
+    Q = insolation.daily_mean_insolation(lat, t)
+    assert Q.shape == (19, 50)
+    assert np.all(Q >= 0)
+    assert np.all(np.isfinite(Q))
+
+def test_annual_mean_insolation():
+    Q = insolation.annual_mean_insolation([-90., 0., 90.], 0.0)
+    #the annual mean is the same at both poles and largest at the equator
+    assert within_error(Q[0], Q[2], 0.5)
+    assert Q[1] > Q[0]
+
+def brute_force_energy(longitude, latitude, start, end, n=100000):
+    t = start + (end-start)*(np.arange(n)+0.5)/float(n)
+    cosZ = np.cos(marstime.solar_zenith(longitude, latitude, t)*np.pi/180.)
+    flux = 1361./marstime.heliocentric_distance(t)**2 * np.clip(cosZ, 0, None)
+    return flux.sum()*(end-start)*86400./n
+
+def test_integrated_insolation():
+    insolation.clear_cache()
+    cases = [(0., 0., 10.2, 10.6), (137., -4.5, 100.1, 103.7),
+             (200., 70., 300., 340.3), (10., -85., 0., 20.)]
+    for lon, lat, start, end in cases:
+        E = insolation.integrated_insolation(lon, lat, start, end)
+        assert within_error(E/brute_force_energy(lon, lat, start, end), 1.0, 1e-3)
+
+    lon, lat, start, end = [np.array(x) for x in zip(*cases)]
+    E = insolation.integrated_insolation(lon, lat, start, end)
+    assert E.shape == (4,)
+    assert np.allclose(E, insolation.integrated_insolation(lon, lat, start, end, cache=False))
+
+def test_integrated_insolation_cache():
+    insolation.clear_cache()
+    start = np.linspace(0, 600, 200)
+    E = insolation.integrated_insolation(137., -4.5, start, start+50.)
+    assert len(insolation._daily_totals) == 1
+    #splitting a window in two gives the same total
+    E1 = insolation.integrated_insolation(137., -4.5, start, start+20.3)
+    E2 = insolation.integrated_insolation(137., -4.5, start+20.3, start+50.)
+    assert np.allclose(E, E1+E2, rtol=1e-9)
+    insolation.clear_cache()
+    assert len(insolation._daily_totals) == 0
+    #least recently used sites are evicted
+    for lon in range(insolation._max_sites + 10):
+        insolation.integrated_insolation(float(lon), -4.5, start, start+3.)
+    assert len(insolation._daily_totals) == insolation._max_sites
+    assert (0., -4.5) not in insolation._daily_totals
+    insolation.clear_cache()
+
+def test_integrated_insolation_reversed():
+    E = insolation.integrated_insolation(184.7, -14.5, 1463.07, 1468.37)
+    assert E > 0
+    assert np.isclose(insolation.integrated_insolation(184.7, -14.5, 1468.37, 1463.07), -E)
+    both = insolation.integrated_insolation(184.7, -14.5, [1463.07, 1468.37], [1468.37, 1463.07])
+    assert np.allclose(both, [E, -E])
+
+def test_instantaneous_insolation():
+    t = np.linspace(4800., 4801.03, 200)
+    lat = np.array([-60., 0., 30.])[:, np.newaxis]
+    Q = insolation.instantaneous_insolation(184.702, lat, t)
+    assert Q.shape == (3, 200)
+    cosZ = np.cos(np.radians(marstime.solar_zenith(184.702, lat, t)))
+    rm = marstime.heliocentric_distance(t)
+    assert np.allclose(Q, 1361.*np.clip(cosZ, 0, None)/rm**2)
+    assert (Q >= 0).all() and (Q == 0).any()
+    #the diurnal mean of the instantaneous value matches the closed form
+    t = 4800. + 1.027491252*np.arange(20000)/20000.
+    mean = insolation.instantaneous_insolation(184.702, 30., t).mean()
+    assert within_error(mean, insolation.daily_mean_insolation(30., 4800.5), 1.)
+
+def test_instantaneous_insolation_float32():
+    t = np.linspace(4800., 4801.03, 200)
+    lat = np.linspace(-90, 90, 37)[:, np.newaxis]
+    Q = insolation.instantaneous_insolation(184.702, lat, t, dtype=np.float32)
+    assert Q.dtype == np.float32
+    assert np.abs(Q - insolation.instantaneous_insolation(184.702, lat, t)).max() < 1e-3
@@ -0,0 +1,62 @@
+import sys
+sys.path.insert(0,"./")
+import numpy as np
+import marstime
+from marstime import instrument
+
+
+def test_disabled_by_default():
+    assert not instrument.enabled()
+    #the blockwise dispatch of marstime.chunked also sets __wrapped__
+    assert marstime.Mars_Ls.__code__ is not instrument._wrap("Mars_Ls", None).__code__
+
+
+def test_counts_and_restores():
+    original = marstime.solar_zenith
+    instrument.reset()
+    with instrument.recording():
+        assert instrument.enabled()
+        marstime.solar_zenith(10., 20., 100.)
+        marstime.solar_zenith(np.arange(1000.), 20., 100.)
+    assert marstime.solar_zenith is original
+    counters = instrument.snapshot()
+    assert counters["solar_zenith"]["calls"] == 2
+    assert counters["solar_zenith"]["elements"] == 1001
+    assert counters["solar_zenith"]["redundant"] == 0
+    #Mars_Ls is computed for the declination and again for the equation of time
+    assert counters["Mars_Ls"]["calls"] == 4
+    assert counters["Mars_Ls"]["redundant"] == 2
+    assert counters["solar_zenith"]["seconds"] >= counters["hourangle"]["seconds"]
+    assert "solar_zenith" in instrument.report()
+    #private helpers are not wrapped
+    assert not [name for name in counters if name.startswith("_")]
+    assert "_masked" not in instrument.functions()
+
+    instrument.reset()
+    assert instrument.snapshot() == {}
+    marstime.solar_zenith(10., 20., 100.)
+    assert instrument.snapshot() == {}
+
+
+def test_results_unchanged():
+    expected = marstime.solar_azimuth(10., 20., 100.)
+    instrument.enable(["solar_azimuth", "Mars_Ls"])
+    try:
+        assert marstime.solar_azimuth(10., 20., 100.) == expected
+    finally:
+        instrument.disable()
+    assert sorted(instrument.snapshot()) == ["Mars_Ls", "solar_azimuth"]
+    instrument.reset()
+
+
+def test_prometheus(tmpdir):
+    instrument.reset()
+    with instrument.recording(["Mars_Ls"]):
+        marstime.Mars_Ls(100.)
+    path = str(tmpdir.join("marstime.prom"))
+    instrument.write_prometheus(path)
+    text = open(path).read()
+    assert '# TYPE marstime_calls_total counter' in text
+    assert 'marstime_calls_total{function="Mars_Ls"} 1' in text
+    assert tmpdir.listdir() == [tmpdir.join("marstime.prom")]
+    instrument.reset()
@@ -68,6 +68,36 @@ def test_utc_to_tt_offset():
     t=0
     assert within_error(marstime.utc_to_tt_offset(t), 0, 1e-3)
 
+def test_tt_to_utc_offset():
+    t = marstime.julian_tt(marstime.j2000_epoch())
+    assert within_error(marstime.tt_to_utc_offset(t), 64.184, 1e-3)
+    assert within_error(marstime.tt_to_utc_offset(0), 0, 1e-3)
+
+    #2012 July 1, the TT instants inside the leap second hold UTC at midnight
+    boundary = 2441317.5 + 14792.
+    t = boundary + 66.684/86400.
+    assert within_error(marstime.julian_utc(t), boundary, 1e-9)
+    t = boundary + 67.5/86400.
+    assert within_error(marstime.julian_utc(t), boundary+0.316/86400., 1e-9)
+    t = boundary + 66.1/86400.
+    assert within_error(marstime.julian_utc(t), boundary-0.084/86400., 1e-9)
+
+def test_julian_utc():
+    for m in [0, 947116800000, 1073137591000, 1483228800000]:
+        jday = marstime.julian(m)
+        assert within_error(marstime.julian_utc(marstime.julian_tt(jday)), jday, 1e-9)
+
+def test_mills_round_trip():
+    if not marstime.use_numpy:
+        return
+    m = np.linspace(-3e11, 2.2e12, 100001)
+    j2k = marstime.j2000_offset_tt(marstime.julian_tt(marstime.julian(m)))
+    assert np.all(np.abs(marstime.mills_from_j2000_ott(j2k) - m) < 0.1)
+    msd = marstime.Mars_Solar_Date(j2k)
+    assert np.all(np.abs(marstime.mills_from_Mars_Solar_Date(msd) - m) < 0.1)
+    assert marstime.datetime64_from_mills(1073137591000.5) == \
+        np.datetime64("2004-01-03T13:46:31.000500")
+
 def test_julian_tt():
     assert marstime.julian_tt() > 2456203.
     assert marstime.julian_tt(0) == 0
@@ -115,7 +145,20 @@ def test_j2000_ott_from_Mars_Solar_Date():
     assert within_error(marstime.j2000_ott_from_Mars_Solar_Date(0.0), -46022.997, 1e-3)
     assert within_error(marstime.j2000_ott_from_Mars_Solar_Date(1000), -44995.505, 1e-3)
     t=marstime.Mars_Solar_Date(0)
-    assert within_error(marstime.j2000_ott_from_Mars_Solar_Date(t), 0.0007428,1e-5)
+    assert within_error(marstime.j2000_ott_from_Mars_Solar_Date(t), 0.0,1e-8)
+
+def test_j2000_ott_from_Coordinated_Mars_Time():
+    j2k = 1463.07471
+    msd = marstime.Mars_Solar_Date(j2k)
+    mtc = marstime.Coordinated_Mars_Time(j2k)
+    assert within_error(marstime.j2000_ott_from_Coordinated_Mars_Time(mtc, np.floor(msd)), j2k, 1e-8)
+
+def test_j2000_ott_from_Local_Mean_Solar_Time():
+    j2k = 1463.07471
+    longitude = 184.702
+    lmst = marstime.Local_Mean_Solar_Time(longitude, j2k)
+    sol = np.floor(marstime.Mars_Solar_Date(j2k) - longitude/360.)
+    assert within_error(marstime.j2000_ott_from_Local_Mean_Solar_Time(lmst, sol, longitude), j2k, 1e-8)
 
 def test_Clancy_Year():
     #j2000_epoch = 0.0 offset
@@ -141,6 +184,55 @@ def test_marstime_Year():
     #6 months earlier, 0 year
     assert within_error(marstime.Mars_Year(-16500.0), 0, 0.5)
     assert within_error(marstime.Mars_Year(-17025.0), -1, 0.5)
+    #beyond the end of the table
+    assert within_error(marstime.Mars_Year(37247.8), 79, 0.5)
+    assert within_error(marstime.Mars_Year(37247.8+687.1), 80, 0.5)
+    assert marstime.Mars_Year() >= 36
+    #scalars give floats, as arrays do
+    assert marstime.Mars_Year(0.0) == 24.0 and isinstance(marstime.Mars_Year(0.0), float)
+    assert isinstance(marstime.Mars_Year(-17025.0, return_length=True)[0], float)
+
+def test_Mars_Year_array():
+    if not marstime.use_numpy:
+        return
+    j2k = np.array([-17025.0, -16500.0, 0.0, 151.3, 37247.8, 37247.8+687.1])
+    assert np.all(marstime.Mars_Year(j2k) == [-1, 0, 24, 25, 79, 80])
+    y, l = marstime.Mars_Year(j2k, return_length=True)
+    assert l.shape == j2k.shape
+
+
+def test_sorted_tables():
+    if not marstime.use_numpy:
+        return
+    t = np.linspace(-18000., 40000., 5000)
+    jday = t + marstime.j2000_epoch() - 12000.
+    #the sorted fast path agrees with the per element search
+    for args in [(t, marstime._year_jday_vals, marstime._year_vals, marstime._year_length_vals, True)]:
+        fast = marstime.Mars_Year_np(*args, assume_sorted=True)
+        slow = marstime.Mars_Year_np(*args, assume_sorted=False)
+        assert all(np.array_equal(a, b) for (a, b) in zip(fast, slow))
+    assert np.array_equal(marstime.utc_to_tt_offset_numpy(jday, assume_sorted=True),
+                          marstime.utc_to_tt_offset_numpy(jday, assume_sorted=False))
+    assert np.array_equal(marstime.utc_to_tt_offset(jday.reshape(50, 100)).ravel(),
+                          marstime.utc_to_tt_offset(jday))
+    #unsorted input takes the search
+    assert not marstime._is_sorted(t[::-1])
+    assert np.array_equal(marstime.Mars_Year(t[::-1]), marstime.Mars_Year(t)[::-1])
+
+    index, start, stop = marstime.table_segments(t, "year")
+    assert start[0] == 0 and stop[-1] == t.size and np.all(stop[:-1] == start[1:])
+    year = marstime.Mars_Year(t)
+    for (i, a, b) in zip(index[1:-1], start[1:-1], stop[1:-1]):
+        assert np.all(year[a:b] == i)
+    index, start, stop = marstime.table_segments(jday, "leap")
+    offset = marstime.utc_to_tt_offset(jday)
+    for (i, a, b) in zip(index, start, stop):
+        assert np.all(offset[a:b] == 32.184 + marstime._leap_offset_vals[i])
+    try:
+        marstime.table_segments(t[::-1])
+        assert False
+    except ValueError:
+        pass
 
     
 def test_Coordinated_Mars_Time():
@@ -160,11 +252,47 @@ def test_Local_True_Solar_Time():
     assert within_error(marstime.Local_True_Solar_Time(0,0)
                         -marstime.Local_True_Solar_Time(15,0), 1.0, 1e-2)
 
+def test_times_of_ltst():
+    if not marstime.use_numpy:
+        return
+    longitudes = np.array([0., 184.702, 222.6])
+    target = np.array([14., 0.5, 23.9])
+    sols = np.arange(46000, 48000)
+    t = marstime.times_of_ltst(target, longitudes, sols)
+    assert t.shape == (3, 2000)
+    ltst = marstime.Local_True_Solar_Time(longitudes[:,None], t)
+    err = (ltst - target[:,None] + 12) % 24 - 12
+    assert np.all(np.abs(err) < 1e-7)
+    assert np.all(np.abs(np.diff(t, axis=1) - 1.027491252) < 0.01)
+
+    m = marstime.times_of_ltst(14., 137.4, [47000], mills=True)
+    assert within_error(m[0], marstime.mills_from_j2000_ott(
+        marstime.times_of_ltst(14., 137.4, [47000])[0]), 1e-3)
+
 def test_subsolar_longitude():
     assert within_error(marstime.subsolar_longitude(0.0)-
                         marstime.subsolar_longitude(3698.9685/86400.),
                         -14.99, 1e-2)
 
+def test_solar_azimuth_latitude():
+    if not marstime.use_numpy:
+        return
+    #the azimuth of the east and north components of the sun vector
+    t = np.linspace(4800., 4801., 49)
+    for lat in [-60., -14.46, 0., 30., 75.]:
+        east, north, up = np.moveaxis(marstime.sun_vector_enu(137.4, lat, t), -1, 0)
+        expected = np.degrees(np.arctan2(east, north)) % 360.
+        error = (marstime.solar_azimuth(137.4, lat, t) - expected + 180.) % 360. - 180.
+        assert np.abs(error).max() < 1e-6
+    #solar_azimuth used to pass the latitude in degrees to cos and sin
+    lat = 30.
+    dec = np.radians(marstime.solar_declination(marstime.Mars_Ls(t)))
+    ha = marstime.hourangle(137.4, t)
+    previous = (360 + np.degrees(np.arctan2(
+        np.sin(ha), np.cos(lat)*np.tan(dec) - np.sin(lat)*np.cos(ha)))) % 360.
+    error = (marstime.solar_azimuth(137.4, lat, t) - previous + 180.) % 360. - 180.
+    assert np.abs(error).max() > 10.
+
 def test_solar_declination():
     assert within_error(marstime.solar_declination(0.0)  ,0.0,1e-3)
     assert within_error(marstime.solar_declination(90.0) ,25.441,1e-3)
@@ -236,6 +364,27 @@ def test_solar_azimuth():
     assert within_error(marstime.solar_azimuth(x,45,j2day),180,1e-3)
     assert within_error(marstime.solar_azimuth(x,-45,j2day),0,1e-3)
 
+def test_time_state():
+    j2000_ott = 1463.07471
+    state = marstime.time_state(j2000_ott)
+    assert within_error(state["ls"], 327.32322, 1e-4)
+    assert within_error(state["eot"], -12.77557, 1e-4)
+    assert within_error(state["mtc"], 13.16542, 1e-4)
+    assert within_error(state["rm"], 1.47767, 1e-4)
+    assert within_error(state["subsol"], marstime.subsolar_longitude(j2000_ott), 1e-10)
+    assert within_error(state["dec"], marstime.solar_declination(state["ls"]), 1e-10)
+
+def test_timeseries():
+    if not marstime.use_numpy:
+        return
+    start, step, n = -300.123, 1/86400., 10000
+    series = marstime.timeseries(start, step, n, anchor=64, chunk=1000)
+    state = marstime.time_state(start + step*np.arange(n))
+    for key in state:
+        assert series[key].shape == (n,)
+        assert np.all(np.abs(series[key] - state[key]) < 1e-10)
+    assert np.all(np.abs(series["ls"] - marstime.Mars_Ls(state["j2000_ott"])) < 1e-10)
+
 def test_on_mills():
     mills=959804082*1e3
     j2k_ott = marstime.j2000_offset_tt(marstime.julian_tt(marstime.julian(mills)))
@@ -402,6 +551,13 @@ def test_math_vs_numpy():
         marstime.use_numpy = True
         myn = marstime.Mars_Year(j2k)
         assert within_error(mym,myn,0.5)
+
+        jdtt = marstime.julian_tt(jdut)
+        marstime.use_numpy = False
+        utc_math = marstime.tt_to_utc_offset(jdtt)
+        marstime.use_numpy = True
+        utc_numpy = marstime.tt_to_utc_offset(jdtt)
+        assert within_error(utc_math,utc_numpy,1e-6)
 #----        
         
         mil=0
@@ -423,3 +579,260 @@ def test_math_vs_numpy():
         
 
         
+
+def test_lazy_numpy():
+    import subprocess
+    code = ("import sys, marstime\n"
+            "marstime.Local_True_Solar_Time(184.702, 1463.07471)\n"
+            "marstime.solar_azimuth(184.702, -14.46, 1463.07471)\n"
+            "marstime.Mars_Year(1463.07471)\n"
+            "marstime.mills_from_j2000_ott(1463.07471)\n"
+            "assert 'numpy' not in sys.modules\n")
+    subprocess.check_call([sys.executable, "-c", code])
+
+def test_scalar_paths_match_arrays():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.array([-20000., 1463.07471, 40000.])
+    for f in [marstime.Mars_Ls, marstime.equation_of_time, marstime.Mars_Year,
+              marstime.heliocentric_distance, marstime.Clancy_Year]:
+        assert np.allclose([f(float(x)) for x in t], f(t), rtol=0, atol=1e-9)
+    for f in [marstime.solar_zenith, marstime.solar_azimuth]:
+        assert np.allclose([f(184.702, -14.46, float(x)) for x in t],
+                           f(184.702, -14.46, t), rtol=0, atol=1e-9)
+    jday = t + marstime.j2000_epoch()
+    assert np.allclose([marstime.utc_to_tt_offset(float(x)) for x in jday],
+                       marstime.utc_to_tt_offset(jday))
+    #outside the math domain the numpy result is used
+    with np.errstate(invalid="ignore"):
+        assert np.isnan(marstime.np.arccos(2.))
+
+def test_lazy_submodules():
+    assert marstime.insolation.daily_mean_insolation(0., 100.) > 0
+    assert marstime.cache.StateCache
+
+def test_sun_vectors():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.linspace(0., 700., 50)
+    lon = np.array([0., 137.4, 184.702, 300.])[:, np.newaxis]
+    lat = np.array([-89., -14.46, 4.5, 60.])[:, np.newaxis]
+
+    enu = marstime.sun_vector_enu(lon, lat, t)
+    assert enu.shape == (4, 50, 3)
+    assert np.allclose((enu**2).sum(axis=-1), 1.)
+    zenith = marstime.solar_zenith(lon, lat, t)
+    assert np.allclose(np.degrees(np.arccos(enu[..., 2])), zenith, atol=1e-9)
+    dec = np.radians(marstime.solar_declination(marstime.Mars_Ls(t)))
+    ha = marstime.hourangle(lon, t)
+    la = np.radians(lat)
+    azimuth = np.arctan2(np.sin(ha), np.cos(la)*np.tan(dec) - np.sin(la)*np.cos(ha))
+    assert np.allclose(np.arctan2(enu[..., 0], enu[..., 1]), azimuth, atol=1e-9)
+
+    body = marstime.sun_vector_body_fixed(t)
+    assert np.allclose(np.degrees(np.arcsin(body[:, 2])), np.degrees(dec), atol=1e-9)
+    east = np.degrees(np.arctan2(body[:, 1], body[:, 0])) % 360.
+    assert np.allclose(marstime.east_to_west(east), marstime.subsolar_longitude(t), atol=1e-8)
+    #the sun is overhead at the subsolar point
+    sub = marstime.sun_vector_enu(marstime.subsolar_longitude(t), np.degrees(dec), t)
+    assert np.allclose(sub[:, 2], 1.)
+
+    scaled = marstime.sun_vector_body_fixed(t, distance=True)
+    assert np.allclose(np.sqrt((scaled**2).sum(axis=-1)), marstime.heliocentric_distance(t))
+    assert np.allclose(marstime.sun_vector_enu(184.702, -14.46, 100.),
+                       marstime.sun_vector_enu(np.array([184.702]), -14.46, np.array([100.]))[0])
+
+def test_cos_solar_zenith():
+    j2000_ott = 1463.07471
+    longitude = 184.702
+    latitude = -14.460
+    assert within_error(marstime.cos_solar_zenith(longitude, latitude, j2000_ott),
+                        np.cos(marstime.solar_zenith(longitude, latitude, j2000_ott)*np.pi/180.),
+                        1e-12)
+    try:
+        marstime.cos_solar_zenith(longitude, 91., j2000_ott)
+        assert False
+    except ValueError:
+        pass
+
+def test_float32_mode():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.linspace(0, 700, 200)[np.newaxis, :]
+    lon = np.linspace(0, 360, 181)[:, np.newaxis]
+    lat = np.linspace(-89.9, 89.9, 181)[:, np.newaxis]
+    z64 = marstime.solar_zenith(lon, lat, t)
+    z32 = marstime.solar_zenith(lon, lat, t, dtype=np.float32)
+    assert z32.dtype == np.float32
+    away = (z64 > 1) & (z64 < 179)
+    assert np.abs(z32 - z64)[away].max() < 3e-4
+    assert np.abs(z32 - z64).max() < 0.1
+    e32 = marstime.solar_elevation(lon, lat, t, dtype=np.float32)
+    assert e32.dtype == np.float32
+    c32 = marstime.cos_solar_zenith(lon, lat, t, dtype=np.float32)
+    assert c32.dtype == np.float32
+    assert np.abs(c32 - marstime.cos_solar_zenith(lon, lat, t)).max() < 1e-6
+
+def test_track_geometry():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.linspace(-300., 7000., 5001)
+    lon = np.linspace(0., 3600., 5001) % 360.
+    lat = 89.*np.sin(np.linspace(0., 60., 5001))
+    out = marstime.track_geometry(t, lon, lat, chunk=1000)
+    assert within_error(out["ls"], marstime.Mars_Ls(t), 1e-9).all()
+    assert within_error(out["lmst"], marstime.Local_Mean_Solar_Time(lon, t), 1e-9).all()
+    ltst = marstime.Local_True_Solar_Time(lon, t)
+    assert (np.abs((out["ltst"] - ltst + 12) % 24 - 12) < 1e-9).all()
+    assert within_error(out["sza"], marstime.solar_zenith(lon, lat, t), 1e-6).all()
+    azimuth = marstime.solar_azimuth(lon, lat, t)
+    assert (np.abs((out["azimuth"] - azimuth + 180) % 360 - 180) < 1e-6).all()
+
+    single = marstime.track_geometry(1463.07471, 184.702, -14.46)
+    assert within_error(single["azimuth"],
+                        marstime.solar_azimuth(184.702, -14.46, 1463.07471), 1e-6)
+    try:
+        marstime.track_geometry(t, lon, lat + 2.)
+        assert False
+    except ValueError:
+        pass
+
+def test_interpolated_time_state():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.random.RandomState(1).uniform(-20000., 20000., 20000)
+    exact = marstime.time_state(t)
+    for knots_per_sol, error in [(1, 3e-8), (4, 2e-10)]:
+        state = marstime.interpolated_time_state(t, knots_per_sol, chunk=1000)
+        for key in ["pbs", "v_m", "eot", "dec", "rm", "M", "alpha_fms", "mtc"]:
+            assert np.abs(state[key] - exact[key]).max() < error
+        for key in ["ls", "subsol"]:
+            assert (np.abs((state[key] - exact[key] + 180) % 360 - 180) < error).all()
+    single = marstime.interpolated_time_state(1463.07471)
+    assert within_error(single["ls"], marstime.Mars_Ls(1463.07471), 1e-8)
+    assert marstime.interpolated_time_state(t.reshape(200, 100))["eot"].shape == (200, 100)
+    track = marstime.track_geometry(t, 184.702, -14.46, knots_per_sol=1)
+    assert np.abs(track["sza"] - marstime.solar_zenith(184.702, -14.46, t)).max() < 1e-7
+    #non-finite times give nan, as in time_state
+    t = np.array([np.nan, 100.3, np.inf, 5000.7])
+    with np.errstate(invalid="ignore"):
+        state = marstime.interpolated_time_state(t)
+        exact = marstime.time_state(t)
+        assert np.isnan(marstime.interpolated_time_state(np.nan)["eot"])
+    for key in exact:
+        assert np.array_equal(np.isnan(state[key]), np.isnan(exact[key]))
+        assert np.allclose(state[key][[1, 3]], exact[key][[1, 3]], atol=1e-7)
+
+def test_accuracy_tiers():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.linspace(-36500., 36500., 20001)
+    lon = np.linspace(0., 360.*97, t.size) % 360.
+    lat = np.linspace(-60., 60., t.size)
+    for tier, error in [("full", 1e-12), ("high", 6e-4), ("medium", 8e-3), ("low", 9e-2)]:
+        ls = marstime.Mars_Ls(t, accuracy=tier)
+        assert (np.abs((ls - marstime.Mars_Ls(t) + 180) % 360 - 180) < error).all()
+        eot = marstime.equation_of_time(t, accuracy=tier)
+        assert np.abs(eot - marstime.equation_of_time(t)).max() < error*1.2
+        sza = marstime.solar_zenith(lon, lat, t, accuracy=tier)
+        assert np.abs(sza - marstime.solar_zenith(lon, lat, t)).max() < error
+        track = marstime.track_geometry(t, lon, lat, accuracy=tier)
+        assert np.abs(track["sza"] - sza).max() < 1e-6
+        state = marstime.time_state(t, accuracy=tier)
+        assert np.abs(state["eot"] - eot).max() < 1e-9
+    assert within_error(marstime.Local_True_Solar_Time(0., 1463.07471, accuracy="low"),
+                        marstime.Local_True_Solar_Time(0., 1463.07471), 0.01)
+    try:
+        marstime.Mars_Ls(100., accuracy="fast")
+        assert False
+    except ValueError:
+        pass
+
+def test_where():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    t = np.linspace(-300., 7000., 1000)
+    lon = np.linspace(0., 360., 1000)
+    lat = np.linspace(-89., 89., 1000)
+    mask = np.arange(1000) % 4 == 0
+    sza = marstime.solar_zenith(lon, lat, j2000_ott=t, where=mask)
+    assert np.array_equal(sza[mask], marstime.solar_zenith(lon, lat, t)[mask])
+    assert np.isnan(sza[~mask]).all()
+    #the mask is broadcast against the arguments
+    ltst = marstime.Local_True_Solar_Time(lon[:3, np.newaxis], t, where=mask)
+    assert ltst.shape == (3, 1000) and np.isnan(ltst[:, ~mask]).all()
+    geometry = marstime.track_geometry(t, lon, lat, where=mask)
+    assert np.allclose(geometry["azimuth"][mask], marstime.solar_azimuth(lon, lat, t)[mask])
+    year, length = marstime.Mars_Year(t, True, where=t > 0)
+    assert np.isnan(year[t <= 0]).all() and np.all(length[t > 0] > 686)
+    #with the reduced precision mode
+    for f in (marstime.solar_zenith, marstime.solar_elevation, marstime.cos_solar_zenith):
+        r = f(lon, lat, t, dtype=np.float32, where=mask)
+        assert r.dtype == np.float32 and np.isnan(r[~mask]).all()
+        assert np.array_equal(r[mask], f(lon, lat, t, dtype=np.float32)[mask])
+
+def test_where_without_numpy(monkeypatch):
+    import math
+    ls = marstime.Mars_Ls(0.0)
+    monkeypatch.setattr(marstime, "numpy_available", False)
+    monkeypatch.setattr(marstime, "np", math)
+    monkeypatch.setattr(marstime, "use_numpy", False)
+    assert within_error(marstime.Mars_Ls(0.0), ls, 1e-9)
+    for kwargs in ({"where": True}, {"unique": True}):
+        try:
+            marstime.Mars_Ls(0.0, **kwargs)
+            assert False
+        except ImportError as e:
+            assert "numpy" in str(e)
+
+def test_unique():
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    times = np.linspace(-300., 7000., 50)
+    t = np.repeat(times, 20)
+    lon = np.tile(np.linspace(0., 342., 20), 50)
+    lat = np.tile(np.linspace(-85., 85., 20), 50)
+    for order in (np.arange(t.size), np.random.default_rng(0).permutation(t.size)):
+        ls = marstime.Mars_Ls(t[order], unique=True)
+        assert np.array_equal(ls, marstime.Mars_Ls(t[order]))
+        sza = marstime.solar_zenith(lon[order], lat[order], t[order], unique=True)
+        assert np.allclose(sza, marstime.solar_zenith(lon[order], lat[order], t[order]))
+        geometry = marstime.track_geometry(t[order], lon[order], lat[order], unique=True)
+        expected = marstime.track_geometry(t[order], lon[order], lat[order])
+        for key in expected:
+            assert np.allclose(geometry[key], expected[key])
+    #broadcast arguments keep their shape
+    ltst = marstime.Local_True_Solar_Time(lon[:20, np.newaxis], t, unique=True)
+    assert np.allclose(ltst, marstime.Local_True_Solar_Time(lon[:20, np.newaxis], t))
+    #with where
+    mask = t > 0
+    year, length = marstime.Mars_Year(t, True, where=mask, unique=True)
+    assert np.isnan(year[~mask]).all()
+    assert np.array_equal(year[mask], marstime.Mars_Year(t[mask]))
+    #with the reduced precision mode
+    sza = marstime.solar_zenith(lon, lat, t, dtype=np.float32, unique=True)
+    assert sza.dtype == np.float32
+    assert np.array_equal(sza, marstime.solar_zenith(lon, lat, t, dtype=np.float32))
+
+def test_internal_calls_undecorated():
+    #marstime calls the undecorated functions, only the outer call dispatches
+    names = sorted(vars(marstime._impl))
+    assert "Mars_Ls" in names and "track_geometry" in names
+    for name in names:
+        assert getattr(marstime, name).__wrapped__ is getattr(marstime._impl, name)
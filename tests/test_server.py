@@ -0,0 +1,46 @@
+import sys
+sys.path.insert(0,"./")
+import asyncio
+import marstime
+from marstime import server
+
+
+def within_error(val, equal, error):
+    return (val>(equal-error))&(val<(equal+error))
+
+def test_submit_batches():
+    async def run():
+        batcher = server.BatchServer(max_batch=64, max_latency=0.01)
+        j2k = [100. + i for i in range(200)]
+        results = await asyncio.gather(
+            *[batcher.submit("Local_True_Solar_Time", longitude=10., j2000_ott=t) for t in j2k])
+        return batcher, j2k, results
+    batcher, j2k, results = asyncio.run(run())
+    for t, r in zip(j2k, results):
+        assert within_error(r, marstime.Local_True_Solar_Time(10., t), 1e-9)
+    stats = batcher.stats()
+    assert stats["requests"] == 200
+    assert stats["batches"] < 10
+    assert stats["errors"] == 0
+
+def test_server_round_trip():
+    async def run():
+        batcher = server.BatchServer(max_latency=0.005)
+        await batcher.start()
+        requests = [dict(function="Mars_Ls", mills=1073137591000),
+                    dict(function="solar_zenith", longitude=184.702, latitude=-14.46,
+                         j2000_ott=1463.07471),
+                    dict(function="solar_zenith", latitude=100., j2000_ott=0.),
+                    dict(function="not_a_function", j2000_ott=0.),
+                    dict(function="Mars_Ls")]
+        responses = await server.query(requests, port=batcher.port)
+        await batcher.close()
+        return batcher, responses
+    batcher, responses = asyncio.run(run())
+    assert within_error(responses[0]["result"], 327.32322, 1e-4)
+    assert within_error(responses[1]["result"],
+                        marstime.solar_zenith(184.702, -14.46, 1463.07471), 1e-9)
+    assert "Latitude" in responses[2]["error"]
+    assert "unknown" in responses[3]["error"]
+    assert "mills" in responses[4]["error"]
+    assert batcher.stats()["errors"] == 3
@@ -0,0 +1,156 @@
+import sys
+sys.path.insert(0,"./")
+import numpy as np
+import marstime
+from marstime import insolation, terrain
+
+
+def brute_force_horizon(z, drow, dcol, step):
+    out = np.full(z.shape, -90.)
+    for r in range(z.shape[0]):
+        for c in range(z.shape[1]):
+            tangents = [(z[r+k*drow, c+k*dcol] - z[r, c])/(k*step*np.hypot(drow, dcol))
+                        for k in range(1, max(z.shape))
+                        if 0 <= r+k*drow < z.shape[0] and 0 <= c+k*dcol < z.shape[1]]
+            if tangents:
+                out[r, c] = np.degrees(np.arctan(max(tangents)))
+    return out
+
+def ray_march_horizon(z, azimuth, step):
+    """One column (or row) at a time along the ray, interpolating the heights
+    linearly across it"""
+    a = np.radians(azimuth)
+    dcol, drow = np.sin(a), -np.cos(a)
+    major = max(abs(dcol), abs(drow))
+    dcol, drow = dcol/major, drow/major
+    h, w = z.shape
+    out = np.full(z.shape, -90.)
+    for r in range(h):
+        for c in range(w):
+            tangents = []
+            for k in range(1, max(h, w)):
+                y, x = r + k*drow, c + k*dcol
+                if not (-1e-9 < y < h - 1 + 1e-9 and -1e-9 < x < w - 1 + 1e-9):
+                    break
+                if abs(drow) == 1:
+                    y, x = int(round(y)), x
+                    z0, z1 = z[y, int(np.floor(x + 1e-9))], z[y, min(int(np.floor(x + 1e-9)) + 1, w - 1)]
+                    f = x - np.floor(x + 1e-9)
+                else:
+                    z0, z1 = z[int(np.floor(y + 1e-9)), int(round(x))], z[min(int(np.floor(y + 1e-9)) + 1, h - 1), int(round(x))]
+                    f = y - np.floor(y + 1e-9)
+                tangents.append((z0 + f*(z1 - z0) - z[r, c])/(k*step*np.hypot(drow, dcol)))
+            if tangents:
+                out[r, c] = np.degrees(np.arctan(max(tangents)))
+    return out
+
+def random_dem(shape, seed=1):
+    return np.random.default_rng(seed).normal(size=shape).cumsum(0).cumsum(1)
+
+def test_horizon_map_brute_force():
+    z = random_dem((30, 40))
+    horizons = terrain.horizon_map(z, 10., directions=8)
+    assert horizons.shape == (8, 30, 40) and horizons.dtype == np.float32
+    #north, north east, east ... as (row, column) steps
+    steps = [(-1,0), (-1,1), (0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1)]
+    for k, (drow, dcol) in enumerate(steps):
+        assert np.allclose(horizons[k], brute_force_horizon(z, drow, dcol, 10.), atol=1e-4)
+
+def test_horizon_map_off_axis():
+    rows, cols = np.mgrid[:41, :41]
+    hill = 300.*np.exp(-((rows - 20)**2 + (cols - 20)**2)/(2*6.**2))
+    horizons = terrain.horizon_map(hill, 10., directions=16)
+    for k in [1, 3, 6, 13]:
+        error = np.abs(horizons[k] - ray_march_horizon(hill, 22.5*k, 10.))
+        assert error.max() < 2.5 and np.median(error) < 0.15
+    #finer lines converge on the ray march
+    fine = terrain.horizon_map(hill, 10., directions=16, phases=16)
+    error = np.abs(fine[1] - ray_march_horizon(hill, 22.5, 10.))
+    assert error.max() < 1.5 and np.median(error) < 0.03
+
+def test_ridge():
+    z = np.zeros((20, 100))
+    z[:, 50] = 100.
+    horizons = terrain.horizon_map(z, 10., directions=4)
+    #100 m west of a 100 m wall, looking east
+    assert np.isclose(horizons[1, 10, 40], 45.)
+    assert np.isclose(horizons[3, 10, 40], 0.)
+    assert np.isclose(horizons[3, 10, 0], -90.)
+
+def test_tiles(tmpdir):
+    z = random_dem((70, 50))
+    whole = terrain.horizon_map(z, 5., directions=12)
+    filename = str(tmpdir.join("dem.npy"))
+    np.save(filename, z)
+    out = str(tmpdir.join("horizons.npy"))
+    tiled = terrain.horizon_map(filename, 5., directions=12, tile=16, halo=70, out=out)
+    assert np.array_equal(tiled, whole)
+    assert np.array_equal(np.load(out), whole)
+    parallel = terrain.horizon_map(z, 5., directions=12, tile=32, halo=70, processes=2)
+    assert np.array_equal(parallel, whole)
+
+def test_nodata():
+    z = random_dem((20, 20))
+    z[5, 5] = np.nan
+    horizons = terrain.horizon_map(z, 5., directions=8)
+    assert np.isnan(horizons[:, 5, 5]).all()
+    assert np.isfinite(np.delete(horizons.reshape(8, -1), 5*20+5, axis=1)).all()
+
+def test_shadow_mask():
+    t = np.linspace(4800., 4801., 25)
+    #flat terrain: shadowed exactly when the sun is below the horizon
+    flat = terrain.horizon_map(np.zeros((10, 10)), 10., directions=8)
+    mask = terrain.shadow_mask(flat, 137.4, -4.5, t)
+    assert mask.shape == (25, 10, 10)
+    night = marstime.solar_elevation(137.4, -4.5, t) <= 0
+    assert np.array_equal(mask[:, 5, 5], night)
+    #the bottom of a deep pit is always in shadow
+    z = np.zeros((21, 21))
+    z[10, 10] = -1e4
+    pit = terrain.horizon_map(z, 10., directions=8)
+    assert terrain.shadow_mask(pit, 137.4, -4.5, t)[:, 10, 10].all()
+    assert np.isclose(terrain.horizon_at(pit, 22.5)[10, 10], pit[:2, 10, 10].mean())
+
+def test_facet_insolation():
+    t = np.array([4800.1, 4800.4, 4800.7])
+    lon = np.linspace(130., 140., 20)[np.newaxis, :]*np.ones((15, 1))
+    lat = np.linspace(-10., 0., 15)[:, np.newaxis]*np.ones((1, 20))
+    #horizontal facets receive the insolation of a horizontal surface
+    flat = terrain.facet_insolation(np.zeros((15, 20)), np.zeros((15, 20)), lon, lat, t)
+    assert flat["flux"].shape == (3, 15, 20) and flat["flux"].dtype == np.float32
+    expected = insolation.instantaneous_insolation(lon, lat, t[:, None, None])
+    assert np.allclose(flat["flux"], expected, rtol=1e-5, atol=1e-3)
+    assert np.allclose(flat["incidence"], marstime.solar_zenith(lon, lat, t[:, None, None]), atol=1e-3)
+    #a facet facing the sun receives the full flux
+    azimuth = marstime.solar_azimuth(137.4, -4.5, 4800.9)
+    elevation = marstime.solar_elevation(137.4, -4.5, 4800.9)
+    facing = terrain.facet_insolation([[90. - elevation]], [[azimuth]], 137.4, -4.5, [4800.9])
+    assert np.isclose(facing["incidence"][0, 0, 0], 0., atol=0.05)
+    assert np.isclose(facing["flux"][0, 0, 0], 1361./marstime.heliocentric_distance(4800.9)**2)
+
+def test_facet_insolation_tiles(tmpdir):
+    rng = np.random.default_rng(2)
+    slope, aspect = rng.uniform(0, 40, (30, 25)), rng.uniform(0, 360, (30, 25))
+    t = np.linspace(4800., 4801., 7)
+    horizons = terrain.horizon_map(random_dem((30, 25)), 20., directions=8)
+    whole = terrain.facet_insolation(slope, aspect, 137.4, -4.5, t, horizons=horizons)
+    filename = str(tmpdir.join("slope.npy"))
+    np.save(filename, slope)
+    out = dict(flux=str(tmpdir.join("flux.npy")))
+    tiled = terrain.facet_insolation(filename, aspect, 137.4, -4.5, t, horizons=horizons,
+                                     tile=8, processes=2, out=out)
+    assert np.array_equal(tiled["flux"], whole["flux"])
+    assert np.array_equal(np.load(out["flux"]), whole["flux"])
+    assert np.array_equal(tiled["incidence"], whole["incidence"])
+    shadowed = terrain.shadow_mask(horizons, 137.4, -4.5, t)
+    assert np.all(whole["flux"][shadowed] == 0)
+    #the times are split across jobs too
+    chunk = terrain._facet_chunk
+    terrain._facet_chunk = 3*8*8
+    try:
+        split = terrain.facet_insolation(slope, aspect, 137.4, -4.5, t[:6].reshape(2, 3),
+                                         horizons=horizons, tile=8)
+    finally:
+        terrain._facet_chunk = chunk
+    assert np.array_equal(split["flux"], whole["flux"][:6].reshape((2, 3) + slope.shape))
+    assert np.array_equal(split["incidence"], whole["incidence"][:6].reshape((2, 3) + slope.shape))
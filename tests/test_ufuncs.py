@@ -0,0 +1,42 @@
+import sys
+sys.path.insert(0,"./")
+import numpy as np
+import pytest
+import marstime
+
+ufuncs = pytest.importorskip("marstime.ufuncs", exc_type=ImportError)
+
+t = np.linspace(-300., 7000., 2000)
+lon = np.linspace(0., 360., 2000)
+lat = np.linspace(-89., 89., 2000)
+
+
+def wrapped_difference(a, b, period):
+    d = np.abs(a - b) % period
+    return np.minimum(d, period - d)
+
+def test_match_marstime():
+    periods = dict(Local_Mean_Solar_Time=24., Local_True_Solar_Time=24.,
+                   Coordinated_Mars_Time=24., Mars_Ls=360., subsolar_longitude=360.,
+                   solar_azimuth=360.)
+    for name in ufuncs.__all__:
+        u = getattr(ufuncs, name)
+        args = [(t,), (lon, t), (lon, lat, t)][u.nin - 1]
+        if name == "solar_declination":
+            args = (lon,)
+        expected = getattr(marstime, name)(*args)
+        assert np.all(wrapped_difference(u(*args), expected, periods.get(name, np.inf)) < 1e-9), name
+
+def test_ufunc_keywords():
+    sza = ufuncs.solar_zenith(lon[:5, np.newaxis], lat[:5, np.newaxis], t)
+    assert sza.shape == (5, 2000)
+    out = np.full(2000, -1.)
+    mask = lat > 0
+    result = ufuncs.solar_zenith(lon, lat, t, out=out, where=mask)
+    assert result is out
+    assert np.allclose(out[mask], marstime.solar_zenith(lon, lat, t)[mask])
+    assert np.all(out[~mask] == -1.)
+    assert ufuncs.Mars_Ls(t.astype(np.float32)).dtype == np.float32
+    assert np.isclose(ufuncs.Mars_Ls(100), marstime.Mars_Ls(100.))
+    assert np.isnan(ufuncs.solar_zenith(0., 95., 10.))
+    assert isinstance(ufuncs.Mars_Ls.ufunc, np.ufunc)